@@ -0,0 +1,556 @@
+import itertools
+import operator
+import numpy as np
+import scipy.sparse as sp
+import gurobipy as gp
+from gurobipy import GRB
+
+from formula import (Number, Symbol, Indexed, Lag, BinOp, Neg, Sum, Conditional,
+                     Compare, Member, BoolOp, Not, Constraint)
+from store import IndexSet, Parameter
+from utils import as_array
+
+ARITHMETIC = {"+": operator.add, "-": operator.sub, "*": operator.mul, "/": operator.truediv}
+SENSES = {"<=": GRB.LESS_EQUAL, ">=": GRB.GREATER_EQUAL, "==": GRB.EQUAL}
+RELATIONS = {"==": operator.eq, "!=": operator.ne, "<=": operator.le, ">=": operator.ge,
+             "<": operator.lt, ">": operator.gt}
+
+
+def lookup(name, namespace, env):
+    """
+    Resolve a bare name, iterators shadow the data
+    :param name: string
+    :param namespace: mapping of data and variable names
+    :param env: dictionary of the current iterator values
+    :return: value
+    """
+    if name in env:
+        return env[name]
+    try:
+        return namespace[name]
+    except KeyError:
+        raise Exception(f"Error: Unknown symbol '{name}'")
+
+
+def domain(name, namespace):
+    """
+    Resolve the set an iterator runs over
+    :param name: string
+    :param namespace: mapping of data and variable names
+    :return: iterable
+    """
+    try:
+        return namespace[name]
+    except KeyError:
+        raise Exception(f"Error: Unknown set '{name}'")
+
+
+def evaluate(node, namespace, env):
+    """
+    Evaluate an expression tree to a number, gurobi expression or boolean
+    :param node: expression node
+    :param namespace: mapping of data and variable names
+    :param env: dictionary of the current iterator values
+    :return: value
+    """
+    kind = type(node)
+    if kind is Number:
+        return node.value
+    if kind is Symbol:
+        return lookup(node.name, namespace, env)
+    if kind is Indexed:
+        key = tuple(evaluate(i, namespace, env) for i in node.indices)
+        try:
+            return domain(node.name, namespace)[key[0] if len(key) == 1 else key]
+        except KeyError:
+            raise Exception(f"Error: {node.name} has no entry {key}")
+    if kind is Lag:
+        return lookup(node.name, namespace, env) + node.offset
+    if kind is BinOp:
+        return ARITHMETIC[node.op](evaluate(node.left, namespace, env), evaluate(node.right, namespace, env))
+    if kind is Neg:
+        return -evaluate(node.operand, namespace, env)
+    if kind is Sum:
+        return gp.quicksum(iterate(node, namespace, env))
+    if kind is Conditional:
+        return evaluate(node.body, namespace, env) if evaluate(node.condition, namespace, env) else 0
+    if kind is Compare:
+        return RELATIONS[node.op](evaluate(node.left, namespace, env), evaluate(node.right, namespace, env))
+    if kind is Member:
+        found = evaluate(node.element, namespace, env) in evaluate(node.container, namespace, env)
+        return not found if node.negated else found
+    if kind is BoolOp:
+        if node.op == "and":
+            return all(evaluate(o, namespace, env) for o in node.operands)
+        return any(evaluate(o, namespace, env) for o in node.operands)
+    if kind is Not:
+        return not evaluate(node.operand, namespace, env)
+    raise Exception(f"Error: Cannot evaluate {kind.__name__}")
+
+
+def iterate(node, namespace, env):
+    """
+    Generate the terms of a sum
+    :param node: Sum node
+    :param namespace: mapping of data and variable names
+    :param env: dictionary of the current iterator values
+    :return: generator of terms
+    """
+    shadowed = env.get(node.index)
+    for value in domain(node.domain, namespace):
+        env[node.index] = value
+        if node.condition is None or evaluate(node.condition, namespace, env):
+            yield evaluate(node.body, namespace, env)
+    if shadowed is None:
+        env.pop(node.index, None)
+    else:
+        env[node.index] = shadowed
+
+
+def rows(constraint, namespace):
+    """
+    Generate the iterator values of every row of a constraint family
+    :param constraint: Constraint node
+    :param namespace: mapping of data and variable names
+    :return: generator of env dictionaries
+    """
+    indices = [f.index for f in constraint.foralls]
+    domains = [domain(f.domain, namespace) for f in constraint.foralls]
+    for values in itertools.product(*domains):
+        env = dict(zip(indices, values))
+        if constraint.condition is None or evaluate(constraint.condition, namespace, env):
+            yield env
+
+
+class NonLinearError(Exception):
+    """
+    Raised when an expression cannot be written as sparse linear rows
+    """
+
+
+def mentions(node, name):
+    """
+    Check if an expression refers to a name
+    :param node: expression node
+    :param name: string
+    :return: bool
+    """
+    if type(node) is Symbol or type(node) is Lag:
+        return node.name == name
+    if type(node) is Number:
+        return False
+    return any(mentions(child, name) for child in node if isinstance(child, tuple))
+
+
+class Table:
+    """
+    The iterator values of many terms at once: one numpy array per iterator name,
+    and for every entry the constraint row it contributes to.
+    """
+
+    def __init__(self, env, size, row):
+        self.env = env
+        self.size = size
+        self.row = row
+
+    def expand(self, index, values):
+        """
+        Repeat every entry once for each value of a new iterator
+        :param index: iterator name
+        :param values: numpy array of the iterator values
+        :return: expanded Table and the parent entry of every new entry
+        """
+        parent = np.repeat(np.arange(self.size), len(values))
+        env = {name: array[parent] for name, array in self.env.items()}
+        env[index] = np.tile(values, self.size)
+        return Table(env, len(parent), self.row[parent]), parent
+
+    def expand_groups(self, index, groups):
+        """
+        Repeat every entry once for each value in its own group of iterator values
+        :param index: iterator name
+        :param groups: list of numpy arrays, one per entry
+        :return: expanded Table and the parent entry of every new entry
+        """
+        counts = np.fromiter((len(g) for g in groups), dtype=np.int64, count=self.size)
+        parent = np.repeat(np.arange(self.size), counts)
+        env = {name: array[parent] for name, array in self.env.items()}
+        env[index] = np.concatenate(groups) if counts.sum() > 0 else np.zeros(0, dtype=np.int64)
+        return Table(env, len(parent), self.row[parent]), parent
+
+    def select(self, mask):
+        """
+        Keep the entries where mask is true
+        :param mask: boolean numpy array or bool
+        :return: filtered Table and the positions of the kept entries
+        """
+        keep = np.flatnonzero(np.broadcast_to(mask, (self.size,)))
+        env = {name: array[keep] for name, array in self.env.items()}
+        return Table(env, len(keep), self.row[keep]), keep
+
+
+class Linearizer:
+    """
+    Expand expression trees into sparse matrices without building gurobi expressions.
+    Every node is evaluated once for all rows of a constraint family with numpy arrays,
+    the columns are the positions of the decision variables in the model.
+    """
+
+    def __init__(self, namespace, columns):
+        """
+        :param namespace: mapping of data and variable names
+        :param columns: dictionary of variable name to a dictionary of index to model column
+        """
+        self.namespace = namespace
+        self.columns = columns
+        self.memo = {}
+        self.inverted = {}
+
+    def has_var(self, node):
+        """
+        Check if a subtree references a decision variable
+        :param node: expression node
+        :return: bool
+        """
+        # keyed by identity, the node is kept in the memo so its id cannot be reused
+        key = id(node)
+        if key not in self.memo:
+            kind = type(node)
+            if kind is Indexed or kind is Symbol:
+                found = node.name in self.columns
+            elif kind is BinOp:
+                found = self.has_var(node.left) or self.has_var(node.right)
+            elif kind is Neg:
+                found = self.has_var(node.operand)
+            elif kind is Sum or kind is Conditional:
+                found = self.has_var(node.body)
+            else:
+                found = False
+            self.memo[key] = (node, found)
+        return self.memo[key][1]
+
+    def domain(self, name):
+        values = domain(name, self.namespace)
+        if isinstance(values, IndexSet):
+            return values.array
+        return as_array(values)
+
+    def membership(self, node):
+        """
+        Find a condition like `r in Coverage_t` on a sum over t, where the element does not depend on t
+        :param node: Sum node
+        :return: the Member node and the rest of the condition, or None
+        """
+        operands = node.condition.operands if type(node.condition) is BoolOp and node.condition.op == "and" \
+            else (node.condition,)
+        for k, operand in enumerate(operands):
+            if type(operand) is Member and not operand.negated and type(operand.container) is Indexed \
+                    and operand.container.indices == (Symbol(node.index),) and not mentions(operand.element, node.index):
+                rest = operands[:k] + operands[k + 1:]
+                if len(rest) == 0:
+                    return operand, None
+                return operand, rest[0] if len(rest) == 1 else BoolOp("and", rest)
+        return None
+
+    def inverted_index(self, container, domain_name):
+        """
+        Map every element of the set valued parameter to the iterator values whose set contains it
+        :param container: name of a parameter mapping index to a set, list or dict
+        :param domain_name: name of the set the sum runs over
+        :return: dictionary of element to numpy array of iterator values in domain order, or None
+        """
+        key = (container, domain_name)
+        if key not in self.inverted:
+            sets = domain(container, self.namespace)
+            values = domain(domain_name, self.namespace)
+            # a column of the file the sum runs over is inverted straight from its arrays
+            if isinstance(sets, Parameter) and sets.index is values:
+                self.inverted[key] = sets.inverted()
+                if self.inverted[key] is not None:
+                    return self.inverted[key]
+            index = {}
+            for t in values:
+                members = sets[t]
+                if not isinstance(members, (set, frozenset, list, tuple, dict)):
+                    index = None
+                    break
+                for element in members:
+                    index.setdefault(element, []).append(t)
+            if index is not None:
+                index = {element: as_array(values) for element, values in index.items()}
+            self.inverted[key] = index
+        return self.inverted[key]
+
+    def expand_sum(self, node, table):
+        """
+        Expand the table by the iterations of a sum that pass its condition.
+        Membership conditions are served from an inverted index so only the matching iterations are generated.
+        :param node: Sum node
+        :param table: Table
+        :return: expanded Table and the parent entry of every new entry
+        """
+        found = self.membership(node) if node.condition is not None else None
+        index = self.inverted_index(found[0].container.name, node.domain) if found is not None else None
+        if index is not None:
+            member, condition = found
+            elements = np.broadcast_to(self.values(member.element, table), (table.size,)).tolist()
+            empty = np.zeros(0, dtype=np.int64)
+            child, parent = table.expand_groups(node.index, [index.get(e, empty) for e in elements])
+        else:
+            condition = node.condition
+            child, parent = table.expand(node.index, self.domain(node.domain))
+        if condition is not None:
+            child, keep = child.select(self.values(condition, child))
+            parent = parent[keep]
+        return child, parent
+
+    def keys(self, node, table):
+        """
+        Evaluate the subscripts of an indexed node for every entry
+        :param node: Indexed node
+        :param table: Table
+        :return: list of keys
+        """
+        parts = [np.broadcast_to(self.values(i, table), (table.size,)).tolist() for i in node.indices]
+        return parts[0] if len(parts) == 1 else list(zip(*parts))
+
+    def values(self, node, table):
+        """
+        Evaluate a data expression for every entry of the table
+        :param node: expression node without decision variables
+        :param table: Table
+        :return: scalar or numpy array with one value per entry
+        """
+        kind = type(node)
+        if kind is Number:
+            return node.value
+        if kind is Symbol:
+            if node.name in table.env:
+                return table.env[node.name]
+            return lookup(node.name, self.namespace, {})
+        if kind is Indexed:
+            container = domain(node.name, self.namespace)
+            try:
+                if isinstance(container, Parameter) and len(node.indices) == 1:
+                    return container.take(self.keys(node, table))
+                return as_array([container[k] for k in self.keys(node, table)])
+            except KeyError as e:
+                raise Exception(f"Error: {node.name} has no entry {e}")
+        if kind is Lag:
+            return self.values(Symbol(node.name), table) + node.offset
+        if kind is BinOp:
+            return ARITHMETIC[node.op](self.values(node.left, table), self.values(node.right, table))
+        if kind is Neg:
+            return -self.values(node.operand, table)
+        if kind is Sum:
+            child, parent = self.expand_sum(node, table)
+            body = np.broadcast_to(self.values(node.body, child), (child.size,))
+            return np.bincount(parent, weights=body, minlength=table.size)
+        if kind is Conditional:
+            return np.where(self.values(node.condition, table), self.values(node.body, table), 0)
+        if kind is Compare:
+            return np.asarray(RELATIONS[node.op](self.values(node.left, table), self.values(node.right, table)))
+        if kind is Member:
+            elements = np.broadcast_to(self.values(node.element, table), (table.size,)).tolist()
+            containers = np.broadcast_to(self.values(node.container, table), (table.size,)).tolist()
+            found = np.fromiter((e in c for e, c in zip(elements, containers)), dtype=bool, count=table.size)
+            return ~found if node.negated else found
+        if kind is BoolOp:
+            operands = [self.values(o, table) for o in node.operands]
+            if node.op == "and":
+                return np.logical_and.reduce(np.broadcast_arrays(*operands))
+            return np.logical_or.reduce(np.broadcast_arrays(*operands))
+        if kind is Not:
+            return np.logical_not(self.values(node.operand, table))
+        raise Exception(f"Error: Cannot evaluate {kind.__name__}")
+
+    def accumulate(self, node, scale, table, blocks):
+        """
+        Add scale * node into the sparse rows of the table entries
+        :param node: expression node
+        :param scale: scalar or numpy array with one coefficient per entry
+        :param table: Table
+        :param blocks: list of (rows, columns, coefficients) arrays, appended to
+        :return: the constant part of scale * node, scalar or one value per entry
+        """
+        if not self.has_var(node):
+            return scale * self.values(node, table)
+        kind = type(node)
+        if kind is Indexed:
+            columns = self.columns[node.name]
+            try:
+                cols = np.array([columns[k] for k in self.keys(node, table)], dtype=np.int64)
+            except KeyError as e:
+                raise Exception(f"Error: {node.name} has no entry {e}")
+            blocks.append((table.row, cols, np.broadcast_to(scale, (table.size,))))
+            return 0
+        if kind is BinOp:
+            if node.op == "+":
+                return self.accumulate(node.left, scale, table, blocks) + self.accumulate(node.right, scale, table, blocks)
+            if node.op == "-":
+                return self.accumulate(node.left, scale, table, blocks) + self.accumulate(node.right, -scale, table, blocks)
+            if node.op == "*" and not self.has_var(node.left):
+                return self.accumulate(node.right, scale * self.values(node.left, table), table, blocks)
+            if node.op == "*" and not self.has_var(node.right):
+                return self.accumulate(node.left, scale * self.values(node.right, table), table, blocks)
+            if node.op == "/" and not self.has_var(node.right):
+                return self.accumulate(node.left, scale / self.values(node.right, table), table, blocks)
+            raise NonLinearError()
+        if kind is Neg:
+            return self.accumulate(node.operand, -scale, table, blocks)
+        if kind is Sum:
+            child, parent = self.expand_sum(node, table)
+            child_scale = scale[parent] if isinstance(scale, np.ndarray) else scale
+            constant = np.broadcast_to(self.accumulate(node.body, child_scale, child, blocks), (child.size,))
+            return np.bincount(parent, weights=constant, minlength=table.size)
+        if kind is Conditional:
+            mask = np.broadcast_to(self.values(node.condition, table), (table.size,))
+            child, keep = table.select(mask)
+            child_scale = scale[keep] if isinstance(scale, np.ndarray) else scale
+            constant = np.zeros(table.size)
+            constant[keep] = self.accumulate(node.body, child_scale, child, blocks)
+            return constant
+        raise NonLinearError()
+
+    def rows(self, constraint):
+        """
+        Build the table of every row of a constraint family
+        :param constraint: Constraint node
+        :return: Table with one entry per row
+        """
+        table = Table({}, 1, np.zeros(1, dtype=np.int64))
+        for forall in constraint.foralls:
+            table, _ = table.expand(forall.index, self.domain(forall.domain))
+        if constraint.condition is not None:
+            table, _ = table.select(self.values(constraint.condition, table))
+        table.row = np.arange(table.size)
+        return table
+
+    def matrix(self, lhs, rhs, table, num_vars):
+        """
+        Assemble lhs - rhs over the rows of the table
+        :param lhs: expression node
+        :param rhs: expression node, or None
+        :param table: Table
+        :param num_vars: number of columns
+        :return: scipy csr matrix and the constant of every row moved to the right hand side
+        """
+        blocks = []
+        constant = self.accumulate(lhs, 1.0, table, blocks)
+        if rhs is not None:
+            constant = constant + self.accumulate(rhs, -1.0, table, blocks)
+        if len(blocks) > 0:
+            row_index = np.concatenate([b[0] for b in blocks])
+            col_index = np.concatenate([b[1] for b in blocks])
+            values = np.concatenate([b[2] for b in blocks]).astype(float)
+        else:
+            row_index = col_index = np.zeros(0, dtype=np.int64)
+            values = np.zeros(0)
+        # duplicate entries are summed by scipy, terms that cancel out are dropped
+        A = sp.csr_matrix((values, (row_index, col_index)), shape=(table.size, num_vars))
+        A.sum_duplicates()
+        A.eliminate_zeros()
+        return A, -np.broadcast_to(constant, (table.size,)).astype(float)
+
+    def constraint_matrix(self, constraint, num_vars):
+        """
+        Assemble a whole constraint family
+        :param constraint: Constraint node
+        :param num_vars: number of columns
+        :return: scipy csr matrix A and right hand side b, A x (sense) b
+        """
+        if constraint.sense not in SENSES:
+            raise Exception(f"Error: Unsupported constraint sense '{constraint.sense}'")
+        return self.matrix(constraint.lhs, constraint.rhs, self.rows(constraint), num_vars)
+
+    def objective_vector(self, objective, num_vars):
+        """
+        Assemble a linear objective
+        :param objective: expression node
+        :param num_vars: number of columns
+        :return: scipy csr matrix with one row of objective coefficients and the objective constant
+        """
+        c, constant = self.matrix(objective, None, Table({}, 1, np.zeros(1, dtype=np.int64)), num_vars)
+        return c, -constant[0]
+
+
+def variable_columns(m, namespace, variables):
+    """
+    Map every decision variable index to its column in the model
+    :param m: gurobi model
+    :param namespace: mapping of data and variable names
+    :param variables: list of variable names
+    :return: dictionary of variable name to a dictionary of index to column
+    """
+    m.update()
+    return {name: {key: var.index for key, var in namespace[name].items()} for name in variables}
+
+
+def add_matrix_constraint(m, constraint, linearizer):
+    """
+    Add a whole constraint family with a single sparse matrix
+    :param m: gurobi model
+    :param constraint: Constraint node
+    :param linearizer: Linearizer for the model
+    :return: gurobi MConstr, or None if the family has no rows
+    """
+    A, b = linearizer.constraint_matrix(constraint, m.NumVars)
+    if A.shape[0] == 0:
+        return None
+    return m.addMConstr(A, None, SENSES[constraint.sense], b)
+
+
+def add_constraint(m, constraint, namespace, linearizer=None):
+    """
+    Add a constraint, or a family of constraints for each forall, to the model.
+    Linear families go in as one sparse matrix when a linearizer is given, anything else row by row.
+    :param m: gurobi model
+    :param constraint: Constraint node
+    :param namespace: mapping of data and variable names
+    :param linearizer: optional Linearizer for the model
+    :return: gurobi MConstr or list of gurobi constraints
+    """
+    if not isinstance(constraint, Constraint):
+        raise Exception("Error: Constraint is missing a comparison")
+    if linearizer is not None:
+        try:
+            return add_matrix_constraint(m, constraint, linearizer)
+        except NonLinearError:
+            pass
+    added = []
+    for env in rows(constraint, namespace):
+        lhs = evaluate(constraint.lhs, namespace, env)
+        rhs = evaluate(constraint.rhs, namespace, env)
+        if constraint.sense == "<=":
+            added.append(m.addConstr(lhs <= rhs))
+        elif constraint.sense == ">=":
+            added.append(m.addConstr(lhs >= rhs))
+        elif constraint.sense == "==":
+            added.append(m.addConstr(lhs == rhs))
+        else:
+            raise Exception(f"Error: Unsupported constraint sense '{constraint.sense}'")
+    return added
+
+
+def set_objective(m, objective, sense, namespace, linearizer=None):
+    """
+    Set the model objective
+    :param m: gurobi model
+    :param objective: expression node
+    :param sense: GRB.MAXIMIZE or GRB.MINIMIZE
+    :param namespace: mapping of data and variable names
+    :param linearizer: optional Linearizer for the model
+    :return: True if the objective went in as a linear vector
+    """
+    if isinstance(objective, Constraint):
+        raise Exception("Error: Objective cannot contain a comparison")
+    if linearizer is not None:
+        try:
+            c, constant = linearizer.objective_vector(objective, m.NumVars)
+            variables = m.getVars()
+            m.setObjective(gp.LinExpr(c.data.tolist(), [variables[j] for j in c.indices]) + constant, sense=sense)
+            return True
+        except NonLinearError:
+            pass
+    m.setObjective(evaluate(objective, namespace, {}), sense=sense)
+    return False
@@ -0,0 +1,26 @@
+from functools import lru_cache
+
+from formula import parse_formula
+
+# The same handful of formulas gets submitted over and over with different csv files,
+# so the parsed expression trees are kept around keyed by the formula text
+FORMULA_CACHE_SIZE = 256
+
+
+@lru_cache(maxsize=FORMULA_CACHE_SIZE)
+def compile_formula(formula):
+    """
+    Parse a formula once into its expression tree
+    :param formula: string, a constraint or an objective
+    :return: Constraint for constraints, an expression node for objectives
+    """
+    return parse_formula(formula)
+
+
+def formula_cache_info():
+    """
+    Report the formula cache statistics
+    :return: dictionary with hits, misses, size and maxsize
+    """
+    info = compile_formula.cache_info()
+    return {"hits": info.hits, "misses": info.misses, "size": info.currsize, "maxsize": info.maxsize}
@@ -0,0 +1,199 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from returnstats import return_stats
+from risk import factor_model
+
+# Covariance estimator used when a request does not pick one
+COVARIANCE_ESTIMATOR = os.environ.get("COVARIANCE_ESTIMATOR", "sample")
+# Trading days until the weight of a day of returns halves in the EWMA estimator
+EWMA_HALFLIFE = int(os.environ.get("EWMA_HALFLIFE", 63))
+# Largest ratio of the biggest to the smallest eigenvalue of an estimated covariance, smaller ones are raised
+CONDITION_LIMIT = 1e6
+# Number of estimated covariances kept with their decompositions
+MAX_COVARIANCES = 16
+
+
+def sample(returns):
+    """
+    :param returns: numpy array with the returns of a day per row and a column per asset
+    :return: sample covariance matrix, like np.cov
+    """
+    centered = returns - returns.mean(axis=0)
+    return centered.T @ centered / (len(returns) - 1)
+
+
+def ledoit_wolf(returns):
+    """
+    Ledoit and Wolf (2004), the sample covariance shrunk towards a multiple of the identity
+    with the intensity that minimizes the expected squared error
+    :param returns: numpy array with the returns of a day per row and a column per asset
+    :return: covariance matrix
+    """
+    T, n = returns.shape
+    X = returns - returns.mean(axis=0)
+    S = X.T @ X / T
+    mu = np.trace(S) / n
+    prior = mu * np.eye(n)
+    d2 = ((S - prior) ** 2).sum()
+    # Σ_t ||x_t x_tᵀ - S||² without building the T outer products
+    b2 = min((((X ** 2).sum(axis=1) ** 2).sum() - T * (S ** 2).sum()) / T ** 2, d2)
+    shrinkage = b2 / d2 if d2 > 0 else 1.0
+    return shrinkage * prior + (1 - shrinkage) * S
+
+
+def constant_correlation(returns):
+    """
+    Ledoit and Wolf (2003), the sample covariance shrunk towards the matrix where every pair
+    of assets has the average correlation, with the intensity that minimizes the expected squared error
+    :param returns: numpy array with the returns of a day per row and a column per asset
+    :return: covariance matrix
+    """
+    T, n = returns.shape
+    X = returns - returns.mean(axis=0)
+    S = X.T @ X / T
+    var = np.diag(S).copy()
+    root = np.sqrt(var)
+    r_bar = ((S / np.outer(root, root)).sum() - n) / (n * (n - 1)) if n > 1 else 0.0
+    prior = r_bar * np.outer(root, root)
+    np.fill_diagonal(prior, var)
+    # asymptotic variances of the entries of S and covariances of the variances with the entries
+    pi = (X ** 2).T @ (X ** 2) / T - S ** 2
+    theta = (X ** 3).T @ X / T - var[:, None] * S
+    np.fill_diagonal(theta, 0)
+    rho = np.trace(pi) + r_bar * ((root[None, :] / root[:, None]) * theta).sum()
+    gamma = ((S - prior) ** 2).sum()
+    shrinkage = max(0.0, min(1.0, (pi.sum() - rho) / gamma / T)) if gamma > 0 else 1.0
+    return shrinkage * prior + (1 - shrinkage) * S
+
+
+def ewma(returns, halflife=EWMA_HALFLIFE):
+    """
+    Exponentially weighted covariance, recent days count more
+    :param returns: numpy array with the returns of a day per row and a column per asset, oldest day first
+    :param halflife: trading days until the weight of a day halves
+    :return: covariance matrix
+    """
+    weights = 0.5 ** (np.arange(len(returns))[::-1] / halflife)
+    weights /= weights.sum()
+    X = returns - weights @ returns
+    # bias correction for the effective number of days, like np.cov with aweights
+    return (X * weights[:, None]).T @ X / (1 - (weights ** 2).sum())
+
+
+ESTIMATORS = {"sample": sample, "ledoit_wolf": ledoit_wolf, "constant_correlation": constant_correlation,
+              "ewma": ewma}
+
+
+def estimator_option(data_dict):
+    """
+    :param data_dict: dictionary of data of the request, with an optional estimator
+    :return: name of the covariance estimator
+    """
+    estimator = (data_dict or {}).get("estimator") or COVARIANCE_ESTIMATOR
+    if estimator not in ESTIMATORS:
+        raise Exception(f"Error: Unknown covariance estimator '{estimator}', use one of {', '.join(ESTIMATORS)}")
+    return estimator
+
+
+def condition(sigma, limit=CONDITION_LIMIT):
+    """
+    :param sigma: symmetric covariance matrix
+    :param limit: largest allowed ratio of the biggest to the smallest eigenvalue
+    :return: covariance with the small eigenvalues raised, its eigenvalues ascending and eigenvectors
+    """
+    values, vectors = np.linalg.eigh(sigma)
+    floor = max(values[-1], 0) / limit
+    if values[0] < floor:
+        values = np.maximum(values, floor)
+        sigma = (vectors * values) @ vectors.T
+        # rounding leaves the rebuilt matrix a hair off symmetric, gurobi wants it exactly symmetric
+        sigma = (sigma + sigma.T) / 2
+    return sigma, values, vectors
+
+
+class CovarianceCache:
+    """
+    Estimated covariances with their eigendecomposition and factor models by universe, window and estimator.
+    An entry is reused until the return window of its universe moves, so repeated solves of the same
+    stocks skip estimating and decomposing the covariance.
+    """
+
+    def __init__(self, size=MAX_COVARIANCES):
+        self.size = size
+        # (tickers, window, estimator) to {"stamp", "sigma", "values", "vectors", "factors"}
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, tickers, estimator, window=None):
+        window = return_stats.window if window is None else window
+        key = (tuple(tickers), window, estimator)
+        stamp = return_stats.stamp(tickers, window)
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry["stamp"] == stamp:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry
+            self.misses += 1
+        returns = return_stats.window_returns(tickers, window)
+        entry = {"stamp": stamp, "returns": None, "sigma": None, "values": None, "vectors": None, "factors": {}}
+        if estimator == "sample":
+            # the sample covariance is left as it is, a factor model of it comes from the svd of the returns
+            entry["returns"] = returns
+        else:
+            entry["sigma"], entry["values"], entry["vectors"] = condition(ESTIMATORS[estimator](returns))
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+        return entry
+
+    def sigma(self, tickers, estimator, window=None):
+        """
+        :param tickers: list of ticker symbols of a universe brought up to date by return_stats.update
+        :param estimator: name of the estimator, other than sample
+        :param window: trading days of returns, the default window if None
+        :return: numpy covariance matrix
+        """
+        return self.entry(tickers, estimator, window)["sigma"]
+
+    def factors(self, tickers, estimator, k, window=None):
+        """
+        Factor model of the estimated covariance from its k largest eigenvalues, kept with the entry
+        :param tickers: list of ticker symbols of a universe brought up to date by return_stats.update
+        :param estimator: name of the estimator
+        :param k: number of factors
+        :param window: trading days of returns, the default window if None
+        :return: numpy arrays of the loadings B, the factor covariance F and the idiosyncratic variances D
+        """
+        entry = self.entry(tickers, estimator, window)
+        with self.lock:
+            if k in entry["factors"]:
+                return entry["factors"][k]
+        if entry["returns"] is not None:
+            found = factor_model(entry["returns"], k)
+        else:
+            count = max(1, min(k, len(entry["values"])))
+            B = entry["vectors"][:, ::-1][:, :count]
+            values = entry["values"][::-1][:count]
+            D = np.maximum(np.diag(entry["sigma"]) - (B ** 2) @ values, 0)
+            found = (B, np.diag(values), D)
+        with self.lock:
+            entry["factors"][k] = found
+        return found
+
+    def info(self):
+        """
+        :return: dictionary with hits, misses and the number of covariances kept
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.size}
+
+
+covariances = CovarianceCache()
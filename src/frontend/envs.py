@@ -0,0 +1,139 @@
+import os
+import threading
+from contextlib import contextmanager
+
+import gurobipy as gp
+
+# Number of idle started environments kept per process
+ENV_POOL_SIZE = int(os.environ.get("ENV_POOL_SIZE", 4))
+
+
+class EnvPool:
+    """
+    Started gurobi environments that models borrow and hand back, so a request doesn't pay for the
+    license check of a new environment. An environment is used by one model at a time, gurobi
+    environments are not thread safe.
+    """
+
+    def __init__(self, size=ENV_POOL_SIZE):
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        # called when no env is idle, frees one held by an idle model and returns True, or returns False
+        self.reclaim = None
+        # borrowed and not handed back yet, idle templates keep theirs borrowed
+        self.borrowed_count = 0
+        self.created = 0
+        self.reused = 0
+        self.reclaimed = 0
+        self.discarded = 0
+
+    def start(self):
+        """
+        :return: a new started environment
+        """
+        env = gp.Env()
+        self.created += 1
+        return env
+
+    def warm(self, count=None):
+        """
+        Start environments ahead of the first requests
+        :param count: number of idle environments to have, the pool size if None
+        :return: None
+        """
+        count = self.size if count is None else min(count, self.size)
+        while len(self.idle) < count:
+            env = self.start()
+            with self.lock:
+                self.idle.append(env)
+
+    def healthy(self, env):
+        """
+        Check an environment still works and put its parameters back to the defaults
+        :param env: gurobi environment
+        :return: bool
+        """
+        try:
+            env.resetParams()
+            return True
+        except gp.GurobiError:
+            return False
+
+    def borrow(self):
+        """
+        Take an environment out of the pool. When none is idle and the pool size is already borrowed,
+        the env of an idle model is taken back, a new one is only started when there is none of those either
+        :return: gurobi environment
+        """
+        while True:
+            with self.lock:
+                env = self.idle.pop() if self.idle else None
+                full = self.borrowed_count >= self.size
+            if env is None:
+                if full and self.reclaim is not None and self.reclaim():
+                    self.reclaimed += 1
+                    continue
+                env = self.start()
+            elif not self.healthy(env):
+                self.discard(env)
+                continue
+            else:
+                self.reused += 1
+            with self.lock:
+                self.borrowed_count += 1
+            return env
+
+    def release(self, env):
+        """
+        Hand an environment back once its model is disposed
+        :param env: gurobi environment
+        :return: None
+        """
+        with self.lock:
+            self.borrowed_count -= 1
+        if not self.healthy(env):
+            self.discard(env)
+            return
+        with self.lock:
+            if len(self.idle) < self.size:
+                self.idle.append(env)
+                return
+        env.dispose()
+
+    def discard(self, env):
+        self.discarded += 1
+        try:
+            env.dispose()
+        except gp.GurobiError:
+            pass
+
+    @contextmanager
+    def borrowed(self):
+        """
+        Borrow an environment for the duration of a with block
+        :return: gurobi environment
+        """
+        env = self.borrow()
+        try:
+            yield env
+        finally:
+            self.release(env)
+
+    def info(self):
+        """
+        :return: dictionary with the number of idle, created, reused and discarded environments
+        """
+        return {"idle": len(self.idle), "created": self.created, "reused": self.reused,
+                "borrowed": self.borrowed_count, "reclaimed": self.reclaimed, "discarded": self.discarded, "maxsize": self.size}
+
+
+envs = EnvPool()
+
+
+def warm_envs():
+    """
+    Start the environments of a new worker process
+    :return: None
+    """
+    envs.warm()
@@ -0,0 +1,255 @@
+import re
+from collections import namedtuple
+
+# Expression tree for the formula language used in the problem forms, e.g.
+#   /sum_t^{Tower} (build_t if r in Coverage_t) >= iscovered_{r} /forall_r^{Region}
+#   z_{i,h} - z_{i,h-1} <= r_i * Capacity_i /forall_i^{Plant} /forall_h^{H} if h > 1
+Number = namedtuple("Number", ["value"])
+Symbol = namedtuple("Symbol", ["name"])
+Indexed = namedtuple("Indexed", ["name", "indices"])
+Lag = namedtuple("Lag", ["name", "offset"])
+BinOp = namedtuple("BinOp", ["op", "left", "right"])
+Neg = namedtuple("Neg", ["operand"])
+Sum = namedtuple("Sum", ["index", "domain", "body", "condition"])
+Conditional = namedtuple("Conditional", ["body", "condition"])
+Compare = namedtuple("Compare", ["op", "left", "right"])
+Member = namedtuple("Member", ["element", "container", "negated"])
+BoolOp = namedtuple("BoolOp", ["op", "operands"])
+Not = namedtuple("Not", ["operand"])
+Forall = namedtuple("Forall", ["index", "domain"])
+Constraint = namedtuple("Constraint", ["lhs", "sense", "rhs", "foralls", "condition"])
+
+Token = namedtuple("Token", ["kind", "text", "pos"])
+
+KEYWORDS = {"if", "in", "and", "or", "not"}
+COMPARISONS = {"=": "==", "==": "==", "<=": "<=", ">=": ">=", "<": "<", ">": ">", "!=": "!="}
+
+TOKEN_PATTERN = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>(?:\d+\.?\d*|\.\d+)(?:[eE][+-]?\d+)?)
+  | (?P<command>/(?:sum|forall)(?![A-Za-z0-9]))
+  | (?P<name>[A-Za-z][A-Za-z0-9]*)
+  | (?P<op><=|>=|==|!=|[=<>+\-*/^_(){},])
+""", re.VERBOSE)
+
+
+def tokenize(formula):
+    """
+    Split a formula into tokens in a single pass
+    :param formula: string
+    :return: list of Tokens, terminated by an "end" token
+    """
+    tokens = []
+    pos = 0
+    while pos < len(formula):
+        match = TOKEN_PATTERN.match(formula, pos)
+        if match is None:
+            raise Exception(f"Error: Unexpected character '{formula[pos]}' at position {pos}")
+        kind = match.lastgroup
+        text = match.group()
+        if kind == "name" and text in KEYWORDS:
+            kind = "keyword"
+        if kind != "space":
+            tokens.append(Token(kind, text, pos))
+        pos = match.end()
+    tokens.append(Token("end", "", pos))
+    return tokens
+
+
+class Parser:
+    """
+    Recursive descent parser from tokens to the expression tree.
+
+    Grammar, loosest binding first:
+        formula    := expr [comparison expr] forall* ['if' condition]
+        expr       := term (('+' | '-') term)*
+        term       := unary (('*' | '/') unary)*
+        unary      := '-' unary | sum | primary
+        sum        := '/sum' '_' name '^' '{' setname '}' expr
+        primary    := number | name ['_' subscript] | '(' expr ['if' condition] ')'
+        subscript  := index | '{' index (',' index)* '}'
+        index      := number | name [('+' | '-') number]
+        forall     := '/forall' '_' name '^' '{' setname '}'
+        condition  := conjunction ('or' conjunction)*
+    A sum takes everything to its right up to the next comparison, closing parenthesis or forall,
+    which is how the formulas are written in the forms.
+    """
+
+    def __init__(self, formula):
+        self.formula = formula
+        self.tokens = tokenize(formula)
+        self.pos = 0
+
+    def peek(self):
+        return self.tokens[self.pos]
+
+    def advance(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, text):
+        if self.peek().text == text and self.peek().kind != "name":
+            return self.advance()
+        return None
+
+    def expect(self, text):
+        token = self.accept(text)
+        if token is None:
+            self.error(f"expected '{text}'")
+        return token
+
+    def expect_name(self):
+        token = self.advance()
+        if token.kind != "name":
+            self.pos -= 1
+            self.error("expected a name")
+        return token.text
+
+    def error(self, message):
+        token = self.peek()
+        found = token.text if token.kind != "end" else "end of formula"
+        raise Exception(f"Error: {message} but found '{found}' at position {token.pos} in '{self.formula}'")
+
+    def parse(self):
+        lhs = self.expr()
+        if self.peek().text not in COMPARISONS:
+            if self.peek().kind != "end":
+                self.error("expected a comparison")
+            return lhs
+        sense = COMPARISONS[self.advance().text]
+        rhs = self.expr()
+        foralls = []
+        while self.peek().text == "/forall":
+            self.advance()
+            foralls.append(Forall(*self.iterator()))
+        condition = None
+        if self.accept("if"):
+            condition = self.condition()
+        if self.peek().kind != "end":
+            self.error("expected end of formula")
+        return Constraint(lhs, sense, rhs, tuple(foralls), condition)
+
+    def iterator(self):
+        # _i^{Set} after a /sum or /forall, set names may contain underscores such as P_N
+        self.expect("_")
+        index = self.expect_name()
+        self.expect("^")
+        self.expect("{")
+        domain = self.expect_name()
+        while self.accept("_"):
+            domain += "_" + self.expect_name()
+        self.expect("}")
+        return index, domain
+
+    def expr(self):
+        node = self.term()
+        while self.peek().text in ("+", "-") and self.peek().kind == "op":
+            op = self.advance().text
+            node = BinOp(op, node, self.term())
+        return node
+
+    def term(self):
+        node = self.unary()
+        while self.peek().text in ("*", "/") and self.peek().kind == "op":
+            op = self.advance().text
+            node = BinOp(op, node, self.unary())
+        return node
+
+    def unary(self):
+        if self.accept("-"):
+            return Neg(self.unary())
+        if self.peek().text == "/sum":
+            self.advance()
+            index, domain = self.iterator()
+            body = self.expr()
+            # a conditional body filters the iterations of the sum
+            if isinstance(body, Conditional):
+                return Sum(index, domain, body.body, body.condition)
+            return Sum(index, domain, body, None)
+        return self.primary()
+
+    def primary(self):
+        token = self.peek()
+        if token.kind == "number":
+            self.advance()
+            return Number(number(token.text))
+        if token.kind == "name":
+            self.advance()
+            if self.accept("_"):
+                return Indexed(token.text, self.subscript())
+            return Symbol(token.text)
+        if self.accept("("):
+            node = self.expr()
+            if self.accept("if"):
+                node = Conditional(node, self.condition())
+            self.expect(")")
+            return node
+        self.error("expected a number, name or '('")
+
+    def subscript(self):
+        if not self.accept("{"):
+            return (self.index(),)
+        indices = [self.index()]
+        while self.accept(","):
+            indices.append(self.index())
+        self.expect("}")
+        return tuple(indices)
+
+    def index(self):
+        token = self.advance()
+        if token.kind == "number":
+            return Number(number(token.text))
+        if token.kind != "name":
+            self.pos -= 1
+            self.error("expected an index")
+        if self.peek().text in ("+", "-") and self.tokens[self.pos + 1].kind == "number":
+            sign = 1 if self.advance().text == "+" else -1
+            return Lag(token.text, sign * number(self.advance().text))
+        return Symbol(token.text)
+
+    def condition(self):
+        operands = [self.conjunction()]
+        while self.accept("or"):
+            operands.append(self.conjunction())
+        return operands[0] if len(operands) == 1 else BoolOp("or", tuple(operands))
+
+    def conjunction(self):
+        operands = [self.negation()]
+        while self.accept("and"):
+            operands.append(self.negation())
+        return operands[0] if len(operands) == 1 else BoolOp("and", tuple(operands))
+
+    def negation(self):
+        if self.peek().text == "not" and self.tokens[self.pos + 1].text != "in":
+            self.advance()
+            return Not(self.negation())
+        left = self.expr()
+        if self.accept("in"):
+            return Member(left, self.expr(), False)
+        if self.accept("not"):
+            self.expect("in")
+            return Member(left, self.expr(), True)
+        if self.peek().text in COMPARISONS:
+            op = COMPARISONS[self.advance().text]
+            return Compare(op, left, self.expr())
+        return left
+
+
+def number(text):
+    """
+    Convert a number token to an int when possible
+    :param text: string
+    :return: int or float
+    """
+    value = float(text)
+    return int(value) if value.is_integer() and "." not in text and "e" not in text.lower() else value
+
+
+def parse_formula(formula):
+    """
+    Parse a constraint or objective formula into an expression tree
+    :param formula: string
+    :return: Constraint for constraints, an expression node for objectives
+    """
+    return Parser(formula).parse()
@@ -0,0 +1,96 @@
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import gurobipy as gp
+from gurobipy import GRB
+
+from envs import envs
+
+# Number of target returns the frontier is solved at when a request does not say
+FRONTIER_POINTS = 15
+# Fewest and most points a request can ask for
+MIN_FRONTIER_POINTS = 2
+MAX_FRONTIER_POINTS = 100
+# Number of model copies solving frontier points at the same time, 1 solves them in order on one copy
+FRONTIER_WORKERS = int(os.environ.get("FRONTIER_WORKERS", min(4, os.cpu_count() or 1)))
+
+
+def frontier_points(data_dict):
+    """
+    :param data_dict: dictionary of data of the request, with an optional frontier_points
+    :return: number of target returns to solve the frontier at
+    """
+    value = (data_dict or {}).get("frontier_points")
+    if value is None or value == "":
+        return FRONTIER_POINTS
+    try:
+        points = int(value)
+    except (TypeError, ValueError):
+        raise Exception("Error: Please check the frontier points, it has to be a whole number")
+    if not MIN_FRONTIER_POINTS <= points <= MAX_FRONTIER_POINTS:
+        raise Exception(f"Error: Please check the frontier points, it has to be between "
+                        f"{MIN_FRONTIER_POINTS} and {MAX_FRONTIER_POINTS}")
+    return points
+
+
+def solve_points(copy, variables, delta, targets, volatility):
+    """
+    Solve a run of frontier points on one model copy, each solve starts from the basis of the one before
+    :param copy: gurobi model, disposed afterwards
+    :param variables: list of the portfolio variables in the copy
+    :param delta: numpy array of expected returns
+    :param targets: list of (position, target return)
+    :param volatility: numpy array the volatilities are written to
+    :return: None
+    """
+    try:
+        # simplex keeps the basis when only the right hand side changes, barrier would start over every time
+        copy.Params.Method = 1
+        copy.Params.OutputFlag = 0
+        target = copy.addLConstr(gp.LinExpr(delta.tolist(), variables), GRB.EQUAL, targets[0][1], "target")
+        for position, r in targets:
+            target.RHS = r
+            copy.optimize()
+            if copy.status == GRB.OPTIMAL:
+                volatility[position] = math.sqrt(max(copy.ObjVal, 0))
+    finally:
+        copy.dispose()
+
+
+def efficient_frontier(m, x, delta, points=FRONTIER_POINTS, workers=FRONTIER_WORKERS):
+    """
+    Solve the minimum risk portfolio for evenly spaced target returns.
+    The points are solved on copies of the model, the caller's model is left as it is.
+    :param m: gurobi model minimizing the portfolio variance
+    :param x: gurobi MVar of the portfolio weights
+    :param delta: numpy array of expected returns
+    :param points: number of target returns
+    :param workers: number of copies solving in parallel
+    :return: numpy arrays of the volatility and the target return of every point, nan where a target is infeasible
+    """
+    m.update()
+    targets = np.linspace(delta.min(), delta.max(), points)
+    volatility = np.full(points, np.nan)
+    columns = [v.index for v in x.tolist()]
+    runs = [run for run in np.array_split(np.arange(points), max(1, min(workers, points))) if len(run) > 0]
+
+    # copying reads the caller's model, so the copies are made here and only solved in the threads
+    borrowed = [envs.borrow() for _ in runs]
+    try:
+        jobs = []
+        for run, env in zip(runs, borrowed):
+            copy = m.copy(env)
+            variables = copy.getVars()
+            jobs.append((copy, [variables[c] for c in columns], delta, [(p, targets[p]) for p in run], volatility))
+        if len(jobs) == 1:
+            solve_points(*jobs[0])
+        else:
+            with ThreadPoolExecutor(max_workers=len(jobs)) as pool:
+                for future in [pool.submit(solve_points, *job) for job in jobs]:
+                    future.result()
+    finally:
+        for env in borrowed:
+            envs.release(env)
+    return volatility, targets
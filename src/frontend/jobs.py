@@ -0,0 +1,359 @@
+import hashlib
+import io
+import json
+import multiprocessing
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from envs import warm_envs
+from progress import Progress
+from timings import Timings, metrics
+
+# Number of worker processes solving at the same time
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", os.cpu_count() or 1))
+# Seconds a finished job is kept for clients to fetch its result
+JOB_TTL = 3600
+# Seconds between keep alive events while streaming a job that is still running
+STREAM_HEARTBEAT = 15
+# Seconds between checks for new progress events while streaming
+STREAM_POLL = 0.25
+# Columns of the consolidated batch table taken from the solve summary
+SUMMARY_COLUMNS = ("status", "objective", "bound", "gap", "runtime")
+
+
+class Upload:
+    """
+    An uploaded file copied out of the request so it can be sent to a worker process, held in memory
+    or, for batches, in a file on disk shared by every scenario.
+    Reads like the werkzeug FileStorage the models are written against.
+    """
+
+    def __init__(self, filename, content=None, path=None, digest=None):
+        """
+        :param filename: name of the uploaded file
+        :param content: bytes of the file, or None if it is on disk
+        :param path: path of the copy on disk
+        :param digest: content hash, so large files are not hashed again by every scenario
+        """
+        self.filename = filename
+        self.content = content
+        self.path = path
+        self.digest = digest
+        self._stream = None
+
+    @property
+    def stream(self):
+        if self._stream is None:
+            self._stream = io.BytesIO(self.content) if self.path is None else open(self.path, "rb")
+        return self._stream
+
+    def read(self, size=-1):
+        # pandas reads uploads in chunks
+        return self.stream.read(size)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+
+    def __getstate__(self):
+        return {"filename": self.filename, "content": self.content, "path": self.path, "digest": self.digest}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+
+def save_upload(f, directory):
+    """
+    Copy an uploaded file to disk, hashing it on the way
+    :param f: uploaded file
+    :param directory: directory to copy to
+    :return: Upload reading the copy
+    """
+    path = os.path.join(directory, str(len(os.listdir(directory))) + "-" + os.path.basename(f.filename))
+    hasher = hashlib.sha256()
+    with open(path, "wb") as out:
+        for chunk in iter(lambda: f.stream.read(2 ** 20), b""):
+            hasher.update(chunk)
+            out.write(chunk)
+    return Upload(f.filename, path=path, digest=hasher.hexdigest())
+
+
+def run_job(data_dict, files, events, stop, timings=None):
+    """
+    Solve a request in a worker process
+    :param data_dict: dictionary of data
+    :param files: list of Upload
+    :param events: queue the progress of the solve is put on
+    :param stop: event set when the client accepts the best plan found so far
+    :param timings: Timings of the request so far
+    :return: dictionary for the json response
+    """
+    # imported here, the worker processes load the models on their first job
+    from script import solve
+    timings = Timings() if timings is None else timings
+    if timings.sent is not None:
+        timings.add("queued", time.time() - timings.sent)
+    try:
+        return solve(data_dict, files, Progress(events.put, stop), timings)
+    finally:
+        # a spilled upload is read from an open file, the worker would keep one handle per job otherwise
+        for f in files:
+            f.close()
+
+
+class Job:
+    """
+    A request handed to the worker pool and its outcome
+    """
+
+    def __init__(self, job_id, future, events, stop):
+        self.id = job_id
+        self.future = future
+        self.events_queue = events
+        self.stop_event = stop
+        self.progress = []
+        self.lock = threading.Lock()
+        self.submitted = time.time()
+        self.finished = None
+        future.add_done_callback(self.done)
+
+    def done(self, future):
+        self.finished = time.time()
+        # the worker's timings are added to the latency histograms of this process
+        if not future.cancelled() and future.exception() is None and "timings" in future.result():
+            metrics.observe(future.result()["timings"])
+
+    @property
+    def state(self):
+        if not self.future.done():
+            return "running" if self.future.running() else "queued"
+        if self.future.cancelled() or self.future.exception() is not None:
+            return "failed"
+        return "done"
+
+    def drain(self):
+        """
+        Collect the progress events the worker published so far
+        :return: None
+        """
+        with self.lock:
+            while True:
+                try:
+                    self.progress.append(self.events_queue.get_nowait())
+                except (queue.Empty, EOFError, OSError):
+                    return
+
+    def stop(self):
+        """
+        Ask the solve to finish with its best incumbent, a job still waiting in the queue is cancelled
+        :return: None
+        """
+        if not self.future.cancel():
+            self.stop_event.set()
+
+    def status(self):
+        """
+        :return: dictionary with the job id, its state, the latest progress and the response or error once finished
+        """
+        self.drain()
+        status = {"job": self.id, "status": self.state, "submitted": self.submitted, "finished": self.finished,
+                  "progress": self.progress[-1] if self.progress else None}
+        if status["status"] == "done":
+            status["response"] = self.future.result()
+        elif status["status"] == "failed":
+            status["error"] = "Job was cancelled" if self.future.cancelled() else str(self.future.exception())
+        return status
+
+    def events(self):
+        """
+        Server sent events with every incumbent and bound update and the state of the job until it finishes
+        :return: generator of event strings
+        """
+        state, sent, quiet = None, 0, time.time()
+        while True:
+            done = self.future.done()
+            status = self.status()
+            for event in self.progress[sent:]:
+                yield f"event: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                sent, quiet = sent + 1, time.time()
+            if status["status"] != state:
+                state = status["status"]
+                yield f"event: status\ndata: {json.dumps(status)}\n\n"
+                quiet = time.time()
+            elif time.time() - quiet >= STREAM_HEARTBEAT:
+                yield ": keep alive\n\n"
+                quiet = time.time()
+            if done:
+                return
+            wait([self.future], timeout=STREAM_POLL)
+
+
+class Batch:
+    """
+    One formulation solved for a list of scenarios, every scenario is a job of its own
+    """
+
+    def __init__(self, batch_id, scenarios, jobs, directory):
+        self.id = batch_id
+        self.scenarios = scenarios
+        self.jobs = jobs
+        self.directory = directory
+
+    @property
+    def finished(self):
+        if not all(job.future.done() for job in self.jobs):
+            return None
+        return max([job.finished or time.time() for job in self.jobs], default=time.time())
+
+    def table(self):
+        """
+        :return: list with one row per scenario, its fields followed by the outcome of its solve
+        """
+        rows = []
+        for i, (scenario, job) in enumerate(zip(self.scenarios, self.jobs)):
+            status = job.status()
+            row = {"scenario": i, "job": job.id}
+            row.update({key: json.dumps(value) if isinstance(value, (dict, list)) else value
+                        for key, value in scenario.items()})
+            summary = status.get("response", {}).get("summary", {})
+            row.update({column: summary.get(column) for column in SUMMARY_COLUMNS})
+            if status["status"] != "done":
+                row["status"] = status["status"]
+            row["error"] = status.get("error") or status.get("response", {}).get("error")
+            rows.append(row)
+        return rows
+
+    def status(self):
+        """
+        :return: dictionary with the batch id, the number of finished scenarios and the results table
+        """
+        done = sum(job.future.done() for job in self.jobs)
+        return {"batch": self.id, "status": "done" if done == len(self.jobs) else "running",
+                "finished": done, "scenarios": len(self.jobs), "results": self.table()}
+
+
+class JobQueue:
+    """
+    Runs solves in a bounded pool of worker processes, so a long solve never holds a web server thread
+    and every core can work on its own model.
+    """
+
+    def __init__(self, workers=JOB_WORKERS, ttl=JOB_TTL):
+        self.workers = workers
+        self.ttl = ttl
+        self.pool = None
+        self.manager = None
+        self.jobs = {}
+        self.batches = {}
+        self.lock = threading.Lock()
+
+    def executor(self):
+        # started on the first job, so importing the app in a worker doesn't start a pool of its own
+        if self.pool is None:
+            context = multiprocessing.get_context("spawn")
+            self.pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=context, initializer=warm_envs)
+            # the progress queues and stop flags of the jobs are shared with the workers through a manager
+            self.manager = context.Manager()
+        return self.pool
+
+    def submit(self, data_dict, files, timings=None):
+        """
+        Queue a request
+        :param data_dict: dictionary of data
+        :param files: list of uploaded files
+        :param timings: Timings of the request so far
+        :return: Job
+        """
+        timings = Timings() if timings is None else timings
+        with timings.phase("upload"):
+            uploads = [Upload(f.filename, f.read()) for f in files]
+        with self.lock:
+            self.expire()
+            pool = self.executor()
+            events, stop = self.manager.Queue(), self.manager.Event()
+            timings.sent = time.time()
+            job = Job(uuid.uuid4().hex, pool.submit(run_job, data_dict, uploads, events, stop, timings), events, stop)
+            self.jobs[job.id] = job
+        return job
+
+    def submit_batch(self, data_dict, files, scenarios):
+        """
+        Queue one job per scenario, the scenario fields replace the fields of the request
+        :param data_dict: dictionary of data, the formulation shared by the scenarios
+        :param files: list of uploaded files, written to disk once for all scenarios
+        :param scenarios: list of dictionaries, such as {"date": "2011-07-02", "mip_gap": 0.01, "overrides": {...}}
+        :return: Batch
+        """
+        if not isinstance(scenarios, list) or len(scenarios) == 0 or not all(isinstance(s, dict) for s in scenarios):
+            raise Exception("Error: Please add the scenarios as a list of dictionaries")
+        directory = tempfile.mkdtemp(prefix="batch-")
+        started = time.perf_counter()
+        uploads = [save_upload(f, directory) for f in files]
+        # the copy is shared, every scenario reports its share of it
+        copied = (time.perf_counter() - started) / len(scenarios)
+        with self.lock:
+            self.expire()
+            pool = self.executor()
+            jobs = []
+            for scenario in scenarios:
+                # plots are left out of batches unless a scenario asks for them
+                data = dict(data_dict, plots=False)
+                data.update(scenario)
+                events, stop = self.manager.Queue(), self.manager.Event()
+                timings = Timings()
+                timings.add("upload", copied)
+                timings.sent = time.time()
+                job = Job(uuid.uuid4().hex, pool.submit(run_job, data, uploads, events, stop, timings), events, stop)
+                self.jobs[job.id] = job
+                jobs.append(job)
+            batch = Batch(uuid.uuid4().hex, scenarios, jobs, directory)
+            self.batches[batch.id] = batch
+        return batch
+
+    def get_batch(self, batch_id):
+        """
+        :param batch_id: id returned by submit_batch
+        :return: Batch, or None if there is no such batch
+        """
+        with self.lock:
+            return self.batches.get(batch_id)
+
+    def stop(self, job_id):
+        """
+        Stop a job early
+        :param job_id: id returned by submit
+        :return: Job, or None if there is no such job
+        """
+        job = self.get(job_id)
+        if job is not None:
+            job.stop()
+        return job
+
+    def get(self, job_id):
+        """
+        :param job_id: id returned by submit
+        :return: Job, or None if there is no such job
+        """
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def expire(self):
+        """
+        Forget the jobs that finished more than ttl seconds ago, call with the lock held
+        :return: None
+        """
+        now = time.time()
+        for job_id in [i for i, job in self.jobs.items() if job.finished is not None and now - job.finished > self.ttl]:
+            del self.jobs[job_id]
+        for batch_id in [i for i, b in self.batches.items() if b.finished is not None and now - b.finished > self.ttl]:
+            shutil.rmtree(self.batches.pop(batch_id).directory, ignore_errors=True)
+
+
+jobs = JobQueue()
@@ -0,0 +1,330 @@
+import json
+import os
+from abc import ABC, abstractmethod
+import threading
+import time
+import zlib
+from urllib.parse import quote
+
+import numpy as np
+import pandas as pd
+
+# Directory the price history is kept in between restarts, only kept in memory when unset
+PRICE_STORE_DIR = os.environ.get("PRICE_STORE_DIR")
+# Where prices come from, yahoo or file
+PRICE_PROVIDER = os.environ.get("PRICE_PROVIDER", "yahoo")
+# Directory of the csv files read by the file provider
+PRICE_FILE_DIR = os.environ.get("PRICE_FILE_DIR", "prices")
+# Days of history a portfolio is computed from
+PRICE_HISTORY_DAYS = 730
+# Seconds before the days up to today are asked for again, the last close changes while the market is open
+PRICE_REFRESH = 3600
+# Relative change of a stored close that means the provider adjusted the history, for a dividend or a split
+ADJUSTMENT_TOLERANCE = 1e-6
+# dtype of the stored series, one row per trading day
+SERIES_DTYPE = np.dtype([("day", "i8"), ("close", "f8")])
+
+
+def day_number(date):
+    """
+    :param date: anything numpy understands as a date
+    :return: days since 1970-01-01 as int
+    """
+    return int(np.datetime64(pd.Timestamp(date).date(), "D").astype(np.int64))
+
+
+def day_date(day):
+    return pd.Timestamp(np.datetime64(int(day), "D"))
+
+
+class PriceProvider(ABC):
+    """
+    Source of daily closing prices
+    """
+
+    @abstractmethod
+    def fetch(self, tickers, first, last):
+        """
+        :param tickers: list of ticker symbols
+        :param first: first day number, inclusive
+        :param last: last day number, inclusive
+        :return: dictionary of ticker to a structured array of the days it traded and the closes
+        """
+
+    @abstractmethod
+    def sector(self, ticker):
+        """
+        :param ticker: ticker symbol
+        :return: name of the sector of the company, None if it has none
+        """
+
+
+def series_from_frame(closes):
+    """
+    :param closes: DataFrame of closes indexed by date with a column per ticker
+    :return: dictionary of ticker to a structured array, tickers without prices left out
+    """
+    found = {}
+    for ticker in closes.columns:
+        column = closes[ticker].dropna()
+        if len(column) == 0:
+            continue
+        series = np.empty(len(column), dtype=SERIES_DTYPE)
+        series["day"] = pd.DatetimeIndex(column.index).tz_localize(None).values.astype("datetime64[D]").astype(np.int64)
+        series["close"] = column.to_numpy(dtype=float)
+        found[str(ticker)] = series
+    return found
+
+
+class YahooProvider(PriceProvider):
+    """
+    Prices downloaded from yahoo finance, every range asked for is one download for all its tickers
+    """
+
+    def fetch(self, tickers, first, last):
+        import yfinance as yf
+        # the end date of a download is exclusive
+        data = yf.download(tickers, start=day_date(first).date(), end=day_date(last + 1).date(), progress=False)
+        if data is None or len(data) == 0:
+            return {}
+        closes = data["Close"]
+        if isinstance(closes, pd.Series):
+            closes = closes.to_frame(tickers[0])
+        return series_from_frame(closes)
+
+    def sector(self, ticker):
+        import yfinance as yf
+        return yf.Ticker(ticker).info.get("sector")
+
+
+class FileProvider(PriceProvider):
+    """
+    Prices read from csv files named after the ticker with Date and Close columns, for offline runs and tests.
+    A ticker without a file gets a random walk seeded by its name, so the same ticker always has the same prices.
+    """
+
+    def __init__(self, directory=PRICE_FILE_DIR):
+        self.directory = directory
+        self.sectors = None
+
+    def synthetic(self, ticker, first, last):
+        # the walk starts at a fixed day, so a day has the same price whatever range it is asked in
+        days = pd.bdate_range(day_date(min(first, day_number("2000-01-03"))), day_date(last))
+        rng = np.random.default_rng(zlib.crc32(ticker.encode()))
+        closes = 20 + 180 * rng.random() * np.exp(np.cumsum(rng.normal(0.0003, 0.015, len(days))))
+        return pd.Series(closes, index=days)
+
+    def fetch(self, tickers, first, last):
+        columns = {}
+        for ticker in tickers:
+            path = os.path.join(self.directory, ticker + ".csv")
+            if os.path.exists(path):
+                frame = pd.read_csv(path, parse_dates=["Date"])
+                column = frame.set_index("Date")["Close"]
+            else:
+                column = self.synthetic(ticker, first, last)
+            days = pd.DatetimeIndex(column.index).values.astype("datetime64[D]").astype(np.int64)
+            columns[ticker] = column[(days >= first) & (days <= last)]
+        return series_from_frame(pd.DataFrame(columns))
+
+    def sector(self, ticker):
+        # sectors.csv with Ticker and Sector columns, tickers not in it have no sector
+        if self.sectors is None:
+            path = os.path.join(self.directory, "sectors.csv")
+            frame = pd.read_csv(path) if os.path.exists(path) else pd.DataFrame(columns=["Ticker", "Sector"])
+            self.sectors = dict(zip(frame["Ticker"].astype(str), frame["Sector"]))
+        return self.sectors.get(ticker)
+
+
+def make_provider(name=PRICE_PROVIDER):
+    """
+    :param name: yahoo or file
+    :return: PriceProvider
+    """
+    providers = {"yahoo": YahooProvider, "file": FileProvider}
+    if name not in providers:
+        raise Exception(f"Error: Unknown price provider '{name}', use one of {', '.join(providers)}")
+    return providers[name]()
+
+
+class PriceStore:
+    """
+    Daily closes by ticker in front of a price provider.
+    Every ticker keeps the range of days already asked for, a request only fetches the days outside of it
+    and the rest is read from one memory mapped numpy file per ticker.
+    """
+
+    def __init__(self, provider=None, directory=PRICE_STORE_DIR, refresh=PRICE_REFRESH):
+        self.provider = make_provider() if provider is None else provider
+        self.directory = directory
+        self.refresh = refresh
+        # ticker to (structured array, {"first", "last", "fetched"})
+        self.series = {}
+        self.lock = threading.Lock()
+        self.fetches = 0
+        self.hits = 0
+
+    def paths(self, ticker):
+        name = quote(ticker, safe="")
+        return os.path.join(self.directory, name + ".npy"), os.path.join(self.directory, name + ".json")
+
+    def stored(self, ticker):
+        """
+        :param ticker: ticker symbol
+        :return: structured array and coverage of the ticker, an empty array and None if it was never fetched
+        """
+        if ticker in self.series:
+            return self.series[ticker]
+        entry = (np.empty(0, dtype=SERIES_DTYPE), None)
+        if self.directory is not None:
+            data, meta = self.paths(ticker)
+            if os.path.exists(data) and os.path.exists(meta):
+                try:
+                    with open(meta) as file:
+                        entry = (np.load(data, mmap_mode="r"), json.load(file))
+                except (OSError, ValueError):
+                    pass
+        self.series[ticker] = entry
+        return entry
+
+    def save(self, ticker, series, coverage):
+        self.series[ticker] = (series, coverage)
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        data, meta = self.paths(ticker)
+        suffix = f".{threading.get_ident()}.tmp"
+        with open(data + suffix, "wb") as file:
+            np.save(file, series)
+        with open(meta + suffix, "w") as file:
+            json.dump(coverage, file)
+        os.replace(data + suffix, data)
+        os.replace(meta + suffix, meta)
+        # read back memory mapped, so the store holds no copy of what is on disk
+        self.series[ticker] = (np.load(data, mmap_mode="r"), coverage)
+
+    def missing(self, ticker, first, last, now):
+        """
+        :return: list of (first, last) day ranges of the ticker that have to be fetched
+        """
+        series, coverage = self.stored(ticker)
+        if coverage is None:
+            return [(first, last)]
+        ranges = []
+        if first < coverage["first"]:
+            ranges.append((first, coverage["first"] - 1))
+        if last > coverage["last"] or (last == coverage["last"] and now - coverage["fetched"] > self.refresh):
+            # the last stored day may have been stored while the market was open and is asked for again,
+            # with the stored day before it, a settled close that shows whether the history was adjusted
+            since = int(series["day"][-2]) if len(series) > 1 else coverage["last"]
+            ranges.append((min(since, last), last))
+        return ranges
+
+    def merge(self, ticker, fetched, first, last, now):
+        """
+        Add fetched days to a ticker
+        :return: False if the provider adjusted the history and the ticker has to be fetched in full
+        """
+        series, coverage = self.stored(ticker)
+        if len(series) > 0 and len(fetched) > 0:
+            overlap, old, new = np.intersect1d(series["day"], fetched["day"], return_indices=True)
+            # the close of the last stored day can be from before the market closed, it is overwritten
+            settled = overlap < series["day"][-1]
+            if settled.any() and not np.allclose(series["close"][old[settled]], fetched["close"][new[settled]],
+                                                 rtol=ADJUSTMENT_TOLERANCE, atol=0):
+                return False
+        # fetched days replace stored ones, np.unique keeps the first of each day and sorts by day
+        merged = np.concatenate([fetched, np.asarray(series)])
+        days, position = np.unique(merged["day"], return_index=True)
+        merged = merged[position]
+        coverage = {"first": min(first, coverage["first"]) if coverage else first,
+                    "last": max(last, coverage["last"]) if coverage else last, "fetched": now}
+        self.save(ticker, merged, coverage)
+        return True
+
+    def fetch(self, wanted):
+        """
+        Fetch ranges of days, tickers missing the same range share one call to the provider.
+        Called without the lock, the provider can take seconds and other requests keep reading the store.
+        :param wanted: dictionary of ticker to list of (first, last)
+        :return: list of (first, last, tickers, dictionary of ticker to structured array)
+        """
+        groups = {}
+        for ticker, ranges in wanted.items():
+            for days in ranges:
+                groups.setdefault(days, []).append(ticker)
+        return [(first, last, tickers, self.provider.fetch(tickers, first, last))
+                for (first, last), tickers in groups.items()]
+
+    def add(self, fetched, now):
+        """
+        Merge what fetch returned, called with the lock held
+        :param fetched: list of (first, last, tickers, dictionary of ticker to structured array)
+        :return: list of tickers whose history was adjusted
+        """
+        adjusted = []
+        for first, last, tickers, found in fetched:
+            self.fetches += 1
+            for ticker in tickers:
+                series = found.get(ticker, np.empty(0, dtype=SERIES_DTYPE))
+                if not self.merge(ticker, series, first, last, now) and ticker not in adjusted:
+                    adjusted.append(ticker)
+        return adjusted
+
+    def history(self, tickers, days=PRICE_HISTORY_DAYS, end=None):
+        """
+        Daily closes of the last days, shaped like a yfinance download
+        :param tickers: list of ticker symbols
+        :param days: number of calendar days up to the end date
+        :param end: last date, today if None
+        :return: DataFrame indexed by Date with a ("Close", ticker) column per ticker in the order asked for
+        """
+        last = day_number(pd.Timestamp.today() if end is None else end)
+        first = last - days
+        now = time.time()
+        with self.lock:
+            wanted = {}
+            for ticker in tickers:
+                ranges = self.missing(ticker, first, last, now)
+                if ranges:
+                    wanted[ticker] = ranges
+            if not wanted:
+                self.hits += 1
+        # the provider is asked without the lock, a request for stored tickers does not wait on another's download.
+        # two requests missing the same days both fetch them, merging the same closes twice changes nothing
+        fetched = self.fetch(wanted)
+        with self.lock:
+            adjusted = self.add(fetched, now)
+            # adjusted closes are rescaled all the way back, the stored history is replaced
+            refetch = {}
+            for ticker in adjusted:
+                coverage = self.stored(ticker)[1]
+                refetch[ticker] = [(min(first, coverage["first"]) if coverage else first, last)]
+        if refetch:
+            fetched = self.fetch(refetch)
+            with self.lock:
+                for ticker in refetch:
+                    self.series[ticker] = (np.empty(0, dtype=SERIES_DTYPE), None)
+                self.add(fetched, now)
+        with self.lock:
+            columns = {}
+            for ticker in tickers:
+                series = self.stored(ticker)[0]
+                lo, hi = np.searchsorted(series["day"], [first, last + 1])
+                if hi > lo:
+                    columns[ticker] = pd.Series(np.array(series["close"][lo:hi]),
+                                                index=np.array(series["day"][lo:hi]).astype("datetime64[D]"))
+        if len(columns) == 0:
+            raise Exception("Error: Please check the stock symbols")
+        closes = pd.DataFrame(columns).reindex(columns=list(tickers))
+        closes.index = pd.DatetimeIndex(closes.index, name="Date")
+        return pd.concat({"Close": closes}, axis=1)
+
+    def info(self):
+        """
+        :return: dictionary with the requests served without fetching, the provider calls and the tickers held
+        """
+        return {"hits": self.hits, "fetches": self.fetches, "tickers": len(self.series), "directory": self.directory}
+
+
+prices = PriceStore()
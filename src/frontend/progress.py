@@ -0,0 +1,122 @@
+import time
+
+from gurobipy import GRB
+
+# Seconds between two bound updates while no new incumbent is found
+PROGRESS_INTERVAL = 1.0
+# Names of the statuses a solve can end with
+STATUSES = {GRB.OPTIMAL: "optimal", GRB.TIME_LIMIT: "time_limit", GRB.INTERRUPTED: "stopped",
+            GRB.INFEASIBLE: "infeasible", GRB.UNBOUNDED: "unbounded", GRB.INF_OR_UNBD: "infeasible_or_unbounded",
+            GRB.SUBOPTIMAL: "suboptimal"}
+# Callbacks the stop flag is looked at in, at most once per interval, a Manager Event is a round trip to another process
+STOP_CHECKS = (GRB.Callback.MIP, GRB.Callback.MIPNODE, GRB.Callback.SIMPLEX, GRB.Callback.BARRIER)
+# Request fields that limit a solve and the gurobi parameter they set, with the default the parameter goes back to
+BUDGETS = {"time_limit": ("TimeLimit", GRB.INFINITY), "mip_gap": ("MIPGap", 1e-4)}
+
+
+def set_budget(m, data_dict):
+    """
+    Apply the time limit and gap of a request to a model, a reused model gets the defaults back when the request has none
+    :param m: gurobi model
+    :param data_dict: dictionary of data
+    :return: dictionary of the parameters that were set
+    """
+    budget = {}
+    for key, (param, default) in BUDGETS.items():
+        value = data_dict.get(key)
+        if value is None or value == "":
+            m.setParam(param, default)
+            continue
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise Exception(f"Error: Please check the {key.replace('_', ' ')}, it has to be a number")
+        if value < 0:
+            raise Exception(f"Error: Please check the {key.replace('_', ' ')}, it can't be negative")
+        m.setParam(param, value)
+        budget[param] = value
+    return budget
+
+
+def gap(objective, bound):
+    if abs(objective) == GRB.INFINITY or abs(bound) == GRB.INFINITY:
+        return None
+    if objective == 0:
+        return 0.0 if bound == 0 else None
+    return abs(objective - bound) / abs(objective)
+
+
+def solve_summary(m):
+    """
+    :param m: gurobi model after optimize
+    :return: dictionary with the status, objective, bound, gap and runtime
+    """
+    summary = {"status": STATUSES.get(m.status, str(m.status)), "runtime": m.Runtime,
+               "objective": None, "bound": None, "gap": None}
+    if m.SolCount > 0:
+        summary["objective"] = m.ObjVal
+        if m.IsMIP:
+            summary["bound"] = m.ObjBound
+            summary["gap"] = m.MIPGap
+    return summary
+
+
+class Progress:
+    """
+    Optimize callback that publishes every new incumbent and, at most once per interval, the best bound and the gap.
+    Setting the stop flag ends the solve with the best incumbent found so far.
+    """
+
+    def __init__(self, publish=None, stop=None, interval=PROGRESS_INTERVAL):
+        """
+        :param publish: function called with every event dictionary
+        :param stop: object with an is_set method, such as a threading or multiprocessing Event
+        :param interval: seconds between bound updates and between looks at the stop flag
+        """
+        self.publish = publish
+        self.stop = stop
+        self.interval = interval
+        self.started = time.time()
+        self.reported = 0
+        self.checked = 0
+        self.last = (None, None)
+        self.incumbents = 0
+
+    def send(self, kind, objective, bound):
+        event = {"type": kind, "objective": objective, "bound": bound, "gap": gap(objective, bound),
+                 "time": round(time.time() - self.started, 3)}
+        self.reported = time.time()
+        self.last = (objective, bound)
+        if self.publish is not None:
+            self.publish(event)
+
+    def __call__(self, model, where):
+        if where == GRB.Callback.MIPSOL:
+            self.incumbents += 1
+            self.send("incumbent", model.cbGet(GRB.Callback.MIPSOL_OBJ), model.cbGet(GRB.Callback.MIPSOL_OBJBND))
+        elif where == GRB.Callback.MIP:
+            objective, bound = model.cbGet(GRB.Callback.MIP_OBJBST), model.cbGet(GRB.Callback.MIP_OBJBND)
+            if (objective, bound) != self.last and time.time() - self.reported >= self.interval:
+                self.send("bound", objective, bound)
+        if self.stop is not None and where in STOP_CHECKS and time.time() - self.checked >= self.interval:
+            self.checked = time.time()
+            if self.stop.is_set():
+                model.terminate()
+
+
+def chain(*callbacks):
+    """
+    Combine optimize callbacks
+    :param callbacks: callbacks or None
+    :return: a callback calling each of them in order, or None if there are none
+    """
+    callbacks = [c for c in callbacks if c is not None]
+    if len(callbacks) == 0:
+        return None
+    if len(callbacks) == 1:
+        return callbacks[0]
+
+    def callback(model, where):
+        for c in callbacks:
+            c(model, where)
+    return callback
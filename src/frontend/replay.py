@@ -0,0 +1,136 @@
+"""
+Re-solve model snapshots offline under different parameter sets and record the timings.
+
+    python replay.py snapshots/ --params '[{}, {"Method": 1}, {"MIPFocus": 2}]' --repeat 3 --out timings.csv
+
+Every snapshot is read with the parameters it was solved with, then a parameter set is applied on top,
+so {} reproduces the production solve. The timings of every run are written as csv and the median
+runtime per parameter set is printed.
+"""
+import argparse
+import json
+import os
+import time
+
+import gurobipy as gp
+import pandas as pd
+
+from progress import STATUSES
+from snapshots import model_file
+
+
+def snapshot_paths(paths):
+    """
+    :param paths: snapshot directories or directories holding snapshots
+    :return: sorted list of snapshot directories
+    """
+    found = []
+    for path in paths:
+        if os.path.exists(os.path.join(path, "meta.json")):
+            found.append(path)
+            continue
+        for name in sorted(os.listdir(path)):
+            if os.path.exists(os.path.join(path, name, "meta.json")):
+                found.append(os.path.join(path, name))
+    return found
+
+
+def read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as file:
+        return json.load(file)
+
+
+def load_snapshot(path, env):
+    """
+    Read a snapshot back into a model
+    :param path: snapshot directory
+    :param env: gurobi environment
+    :return: gurobi model with the recorded parameters and starts, and the metadata
+    """
+    m = gp.read(model_file(path), env)
+    m.read(os.path.join(path, "params.prm"))
+    if os.path.exists(os.path.join(path, "start.attr")):
+        m.read(os.path.join(path, "start.attr"))
+    return m, read_json(os.path.join(path, "meta.json"), {})
+
+
+def replay(path, params=None, repeat=1, env=None):
+    """
+    Solve a snapshot a number of times
+    :param path: snapshot directory
+    :param params: dictionary of gurobi parameters set on top of the recorded ones
+    :param repeat: number of solves
+    :param env: gurobi environment
+    :return: list of dictionaries, one per solve
+    """
+    params = params or {}
+    recorded = read_json(os.path.join(path, "summary.json"), {})
+    rows = []
+    for run in range(repeat):
+        m, meta = load_snapshot(path, env)
+        try:
+            for name, value in params.items():
+                m.setParam(name, value)
+            started = time.perf_counter()
+            m.optimize()
+            wall = time.perf_counter() - started
+            objective = m.ObjVal if m.SolCount > 0 else None
+            rows.append({"snapshot": os.path.basename(os.path.normpath(path)), "kind": meta.get("kind"),
+                         "params": json.dumps(params, sort_keys=True), "run": run,
+                         "status": STATUSES.get(m.status, str(m.status)), "objective": objective,
+                         "bound": m.ObjBound if m.IsMIP else None, "gap": m.MIPGap if m.IsMIP and m.SolCount > 0 else None,
+                         "runtime": m.Runtime, "wall": wall, "iterations": m.IterCount,
+                         "nodes": m.NodeCount if m.IsMIP else None,
+                         "recorded_runtime": recorded.get("runtime"), "recorded_objective": recorded.get("objective")})
+        finally:
+            m.dispose()
+    return rows
+
+
+def parse_params(value):
+    """
+    :param value: json list or object of parameter sets, or the path of a file holding one
+    :return: list of parameter dictionaries
+    """
+    if value is None:
+        return [{}]
+    if os.path.exists(value):
+        with open(value) as file:
+            value = file.read()
+    try:
+        sets = json.loads(value)
+    except ValueError:
+        raise Exception("Error: Please check the parameter sets, they have to be json")
+    if isinstance(sets, dict):
+        sets = [sets]
+    return sets
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-solve model snapshots and record the timings")
+    parser.add_argument("paths", nargs="+", help="snapshot directories or directories holding snapshots")
+    parser.add_argument("--params", help="json list of parameter sets, or a file holding one, {} replays as recorded")
+    parser.add_argument("--repeat", type=int, default=1, help="solves per snapshot and parameter set")
+    parser.add_argument("--out", help="csv file the timings are written to")
+    parser.add_argument("--log", action="store_true", help="show the gurobi log")
+    args = parser.parse_args()
+
+    env = gp.Env(params={"OutputFlag": 1 if args.log else 0})
+    rows = []
+    for path in snapshot_paths(args.paths):
+        for params in parse_params(args.params):
+            rows.extend(replay(path, params, args.repeat, env))
+    timings = pd.DataFrame(rows)
+    if args.out:
+        timings.to_csv(args.out, index=False)
+    if len(timings) == 0:
+        print("No snapshots found")
+        return
+    print(timings.groupby("params").agg(runs=("runtime", "size"), median_runtime=("runtime", "median"),
+                                       total_runtime=("runtime", "sum"), unsolved=("status", lambda s: (s != "optimal").sum())))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+# Seconds a solved result is served from the cache
+RESULT_TTL = 3600
+# Number of results kept in memory
+MAX_RESULTS = 128
+# Directory results are also written to, memory only when unset
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR")
+# Bytes of results kept on disk before the oldest are deleted
+RESULT_DISK_BYTES = 512 * 2 ** 20
+# Parameters that change what a solve returns
+RESULT_PARAMS = ("MIPGap", "MIPGapAbs", "TimeLimit", "OptimalityTol", "FeasibilityTol", "IntFeasTol", "NonConvex",
+                 "SolutionLimit")
+
+
+def model_fingerprint(m, extra=None):
+    """
+    Hash everything that decides the solution of a model: the variable names, which carry the index labels
+    of the data when the variables are named after their keys, the types and bounds,
+    the sparse constraint matrix with senses and right hand sides, the objective and the solver parameters
+    :param m: gurobi model
+    :param extra: string or bytes with inputs of the rendered output that are not part of the model
+    :return: hex digest
+    """
+    m.update()
+    h = hashlib.sha256()
+
+    def add(*values):
+        for value in values:
+            if isinstance(value, np.ndarray):
+                h.update(str(value.dtype).encode())
+                h.update(np.ascontiguousarray(value).tobytes())
+            else:
+                h.update(json.dumps(value).encode())
+            h.update(b"|")
+
+    variables = m.getVars()
+    constrs = m.getConstrs()
+    add(m.NumVars, m.NumConstrs, m.NumQConstrs, m.NumGenConstrs, m.NumSOS, m.ModelSense, m.ObjCon)
+    add(m.getAttr("VarName", variables), "".join(m.getAttr("VType", variables)))
+    add(np.array(m.getAttr("LB", variables)), np.array(m.getAttr("UB", variables)),
+        np.array(m.getAttr("Obj", variables)))
+    if m.NumConstrs > 0:
+        A = m.getA().tocsr()
+        A.sort_indices()
+        add(A.indptr.astype(np.int64), A.indices.astype(np.int64), A.data)
+        add("".join(m.getAttr("Sense", constrs)), np.array(m.getAttr("RHS", constrs)))
+    if m.IsQP:
+        q = m.getObjective()
+        terms = np.array([(q.getVar1(i).index, q.getVar2(i).index, q.getCoeff(i)) for i in range(q.size())])
+        # the same quadratic can be written with its terms in any order
+        add(terms[np.lexsort(terms[:, :2].T[::-1])] if len(terms) > 0 else terms)
+    add([m.getParamInfo(name)[2] for name in RESULT_PARAMS])
+    if extra is not None:
+        h.update(extra if isinstance(extra, bytes) else str(extra).encode())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """
+    Solved results by model fingerprint, so a scenario submitted again is answered without solving.
+    Entries expire after a ttl, memory holds the most recently used ones and the disk copy is
+    trimmed to a byte budget oldest first.
+    """
+
+    def __init__(self, size=MAX_RESULTS, ttl=RESULT_TTL, directory=RESULT_CACHE_DIR, disk_bytes=RESULT_DISK_BYTES):
+        self.size = size
+        self.ttl = ttl
+        self.directory = directory
+        self.disk_bytes = disk_bytes
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".json")
+
+    def get(self, key):
+        """
+        :param key: model fingerprint
+        :return: the stored result, or None
+        """
+        now = time.time()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and now - entry[0] <= self.ttl:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            self.entries.pop(key, None)
+        if self.directory is not None and os.path.exists(self.path(key)):
+            try:
+                with open(self.path(key)) as file:
+                    stored = json.load(file)
+            except (OSError, ValueError):
+                stored = None
+            if stored is not None and now - stored["time"] <= self.ttl:
+                self.remember(key, stored["time"], stored["value"])
+                self.hits += 1
+                return stored["value"]
+        self.misses += 1
+        return None
+
+    def remember(self, key, stamp, value):
+        with self.lock:
+            self.entries[key] = (stamp, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def put(self, key, value):
+        """
+        :param key: model fingerprint
+        :param value: json serializable result
+        :return: None
+        """
+        stamp = time.time()
+        self.remember(key, stamp, value)
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path(key) + f".{threading.get_ident()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump({"time": stamp, "value": value}, file)
+        os.replace(temporary, self.path(key))
+        self.trim()
+
+    def trim(self):
+        """
+        Delete expired results on disk, then the oldest ones until the directory fits the byte budget
+        :return: None
+        """
+        files = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, name))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        now = time.time()
+        for mtime, size, name in files:
+            if total <= self.disk_bytes and now - mtime <= self.ttl:
+                continue
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            total -= size
+
+    def info(self):
+        """
+        :return: dictionary with hits, misses and the number of results in memory
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries), "maxsize": self.size}
+
+
+results = ResultCache()
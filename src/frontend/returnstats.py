@@ -0,0 +1,212 @@
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Trading days of returns the statistics are computed over, about two years
+STATS_WINDOW = int(os.environ.get("STATS_WINDOW", 504))
+# Fewest days of returns a portfolio is computed from
+STATS_MIN_PERIODS = int(os.environ.get("STATS_MIN_PERIODS", 20))
+# Number of universes whose running sums are kept
+MAX_UNIVERSES = 16
+
+
+def returns(closes, previous=None):
+    """
+    Relative size of the daily moves, |close - previous close| / previous close
+    :param closes: numpy array with a row per day and a column per ticker
+    :param previous: closes of the day before the first row, None to start from the first row
+    :return: numpy array with a row per day after the first
+    """
+    if previous is not None:
+        closes = np.vstack([previous, closes])
+    return np.abs(np.diff(closes, axis=0)) / closes[:-1]
+
+
+class RollingStats:
+    """
+    Mean, standard deviation and covariance of the last window of daily returns of a universe.
+    The sums and cross products of the returns in the window are kept, so a new day costs O(n²)
+    instead of the O(n²·T) of recomputing over the whole window. The sums are recomputed from the
+    kept returns once per window of new days so rounding errors don't build up.
+    """
+
+    def __init__(self, n, window=STATS_WINDOW, min_periods=STATS_MIN_PERIODS):
+        self.window = window
+        self.min_periods = min_periods
+        # the returns in the window, the oldest one is overwritten by the next day
+        self.ring = np.zeros((window, n))
+        self.head = 0
+        self.count = 0
+        self.sums = np.zeros(n)
+        self.products = np.zeros((n, n))
+        self.since_rebase = 0
+        # days added since the start, with the serial number of the build it tells whether the window moved
+        self.added = 0
+        self.serial = 0
+
+    def append(self, r):
+        """
+        :param r: numpy array of the returns of one day
+        :return: None
+        """
+        if self.count == self.window:
+            oldest = self.ring[self.head]
+            self.sums -= oldest
+            self.products -= np.outer(oldest, oldest)
+        else:
+            self.count += 1
+        self.ring[self.head] = r
+        self.head = (self.head + 1) % self.window
+        self.sums += r
+        self.products += np.outer(r, r)
+        self.added += 1
+        self.since_rebase += 1
+        if self.since_rebase >= self.window:
+            self.rebase()
+
+    def extend(self, rows):
+        """
+        :param rows: numpy array with the returns of a day per row
+        :return: None
+        """
+        # a batch longer than the window only leaves its last window behind
+        rows = rows[-self.window:]
+        if len(rows) > 1 and (self.count == 0 or len(rows) == self.window):
+            self.ring[:len(rows)] = rows
+            self.count = len(rows)
+            self.head = len(rows) % self.window
+            self.added += len(rows)
+            self.rebase()
+            return
+        for r in rows:
+            self.append(r)
+
+    def rebase(self):
+        kept = self.ring[:self.count] if self.count < self.window else self.ring
+        self.sums = kept.sum(axis=0)
+        self.products = kept.T @ kept
+        self.since_rebase = 0
+
+    def returns(self):
+        """
+        :return: numpy array of the returns in the window, oldest day first
+        """
+        if self.count < self.window:
+            return self.ring[:self.count].copy()
+        return np.roll(self.ring, -self.head, axis=0)
+
+    def check(self):
+        if self.count < max(self.min_periods, 2):
+            raise Exception(f"Error: Not enough price history, {self.count} days of returns "
+                            f"and at least {max(self.min_periods, 2)} are needed")
+
+    def mean(self):
+        self.check()
+        return self.sums / self.count
+
+    def cov(self):
+        """
+        :return: sample covariance matrix, like np.cov
+        """
+        mean = self.mean()
+        return (self.products - self.count * np.outer(mean, mean)) / (self.count - 1)
+
+    def std(self):
+        """
+        :return: population standard deviation, like np.std
+        """
+        mean = self.mean()
+        return np.sqrt(np.maximum(np.diag(self.products) / self.count - mean ** 2, 0))
+
+
+class ReturnStats:
+    """
+    Rolling statistics by universe and window. Every universe remembers the last day and closes it has seen,
+    a request only adds the days after them. Closes that changed since, like a history adjusted for a
+    dividend or a split, start the universe over.
+    """
+
+    def __init__(self, window=STATS_WINDOW, min_periods=STATS_MIN_PERIODS, size=MAX_UNIVERSES):
+        self.window = window
+        self.min_periods = min_periods
+        self.size = size
+        # (tickers, window) to [RollingStats, last day, last closes]
+        self.universes = OrderedDict()
+        self.lock = threading.Lock()
+        self.appended = 0
+        self.rebuilt = 0
+
+    def update(self, tickers, closes, window=None):
+        """
+        Bring the statistics of a universe up to date
+        :param tickers: list of ticker symbols
+        :param closes: DataFrame of closes indexed by date with a column per ticker in the same order
+        :param window: trading days of returns, the default window if None
+        :return: numpy arrays of the mean returns, the covariance matrix and the standard deviations
+        """
+        window = self.window if window is None else window
+        # a day only counts when every ticker traded, returns over a missing close would be nan
+        complete = closes.dropna()
+        days, values = complete.index.values, complete.to_numpy(dtype=float)
+        key = (tuple(tickers), window)
+        with self.lock:
+            entry = self.universes.get(key)
+            if entry is not None:
+                self.universes.move_to_end(key)
+                stats, last_day, last_close = entry
+                position = np.searchsorted(days, last_day)
+                if position < len(days) and days[position] == last_day and np.allclose(values[position], last_close,
+                                                                                          rtol=1e-9, atol=0):
+                    new = returns(values[position + 1:], last_close) if position + 1 < len(days) else values[:0]
+                    stats.extend(new)
+                    self.appended += len(new)
+                else:
+                    entry = None
+            if entry is None:
+                stats = RollingStats(len(tickers), window, self.min_periods)
+                stats.extend(returns(values))
+                self.rebuilt += 1
+                stats.serial = self.rebuilt
+                self.universes[key] = entry = [stats, None, None]
+                while len(self.universes) > self.size:
+                    self.universes.popitem(last=False)
+            if len(days) > 0:
+                entry[1], entry[2] = days[-1], values[-1].copy()
+            return stats.mean(), stats.cov(), stats.std()
+
+    def stats(self, tickers, window=None):
+        window = self.window if window is None else window
+        entry = self.universes.get((tuple(tickers), window))
+        if entry is None:
+            raise Exception("Error: The return statistics of the stocks were not computed")
+        return entry[0]
+
+    def window_returns(self, tickers, window=None):
+        """
+        :param tickers: list of ticker symbols of a universe brought up to date by update
+        :param window: trading days of returns, the default window if None
+        :return: numpy array with the returns of a day per row and a column per ticker, oldest day first
+        """
+        with self.lock:
+            return self.stats(tickers, window).returns()
+
+    def stamp(self, tickers, window=None):
+        """
+        :param tickers: list of ticker symbols of a universe brought up to date by update
+        :param window: trading days of returns, the default window if None
+        :return: tuple that changes whenever the returns in the window change
+        """
+        with self.lock:
+            stats = self.stats(tickers, window)
+            return stats.serial, stats.added
+
+    def info(self):
+        """
+        :return: dictionary with the days appended, the universes built from scratch and the number kept
+        """
+        return {"appended": self.appended, "rebuilt": self.rebuilt, "size": len(self.universes), "maxsize": self.size}
+
+
+return_stats = ReturnStats()
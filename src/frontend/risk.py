@@ -0,0 +1,75 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+from gurobipy import GRB
+
+# How the portfolio risk is handed to gurobi, dense or factor
+RISK_MODEL = os.environ.get("RISK_MODEL", "dense")
+# Number of factors of the factor model
+RISK_FACTORS = int(os.environ.get("RISK_FACTORS", 10))
+RISK_MODELS = ("dense", "factor")
+
+
+def risk_options(data_dict):
+    """
+    :param data_dict: dictionary of data of the request, with optional risk_model and factors
+    :return: name of the risk model and the number of factors
+    """
+    data_dict = data_dict or {}
+    model = data_dict.get("risk_model") or RISK_MODEL
+    if model not in RISK_MODELS:
+        raise Exception(f"Error: Unknown risk model '{model}', use one of {', '.join(RISK_MODELS)}")
+    try:
+        factors = int(data_dict.get("factors") or RISK_FACTORS)
+    except (TypeError, ValueError):
+        raise Exception("Error: Please check the number of factors, it has to be a whole number")
+    if factors < 1:
+        raise Exception("Error: Please check the number of factors, it has to be at least 1")
+    return model, factors
+
+
+def factor_model(returns, k):
+    """
+    Statistical factor model of the returns from their k leading principal components,
+    sigma ≈ B F Bᵀ + D with the diagonal of sigma kept exactly
+    :param returns: numpy array with the returns of a day per row and a column per asset
+    :param k: number of factors, fewer if the returns have fewer days or assets
+    :return: numpy arrays of the loadings B (n×k), the factor covariance F (k×k) and the idiosyncratic variances D (n)
+    """
+    T, n = returns.shape
+    k = max(1, min(k, n, T - 1))
+    centered = returns - returns.mean(axis=0)
+    # the svd of the T×n returns is O(T·n·min(T, n)), sigma itself is never decomposed
+    _, s, vt = np.linalg.svd(centered, full_matrices=False)
+    B = vt[:k].T
+    F = np.diag(s[:k] ** 2 / (T - 1))
+    variance = (centered ** 2).sum(axis=0) / (T - 1)
+    # what the factors leave of every variance, rounding can push it a hair below zero
+    D = np.maximum(variance - (B ** 2) @ np.diag(F), 0)
+    return B, F, D
+
+
+def dense_risk(x, sigma):
+    """
+    :param x: gurobi MVar of the portfolio weights
+    :param sigma: numpy covariance matrix
+    :return: quadratic expression xᵀ sigma x, n² nonzeros in Q
+    """
+    return x @ sigma @ x
+
+
+def factor_risk(m, x, B, F, D):
+    """
+    Add the factor exposures y = Bᵀx to a model, the risk becomes yᵀFy + xᵀDx
+    with k² + n nonzeros in Q and n·k in the constraints, instead of n² in Q
+    :param m: gurobi model
+    :param x: gurobi MVar of the portfolio weights
+    :param B: numpy array of the loadings
+    :param F: numpy factor covariance matrix
+    :param D: numpy array of the idiosyncratic variances
+    :return: quadratic expression of the portfolio risk
+    """
+    y = m.addMVar(B.shape[1], lb=-GRB.INFINITY, name="exposure")
+    m.addConstr(B.T @ x - y == 0, name="exposure")
+    return y @ F @ y + x @ sp.diags(D) @ x
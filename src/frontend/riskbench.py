@@ -0,0 +1,114 @@
+"""
+Compare the dense and the factor model formulation of the minimum risk portfolio.
+
+    python riskbench.py --assets 250 500 1000 1900 --factors 10 --days 504 --out riskbench.csv
+
+The returns are simulated from a factor structure with a seeded generator, so runs are comparable.
+For every universe size both formulations are built and solved, and the build time, the solve time,
+the memory gurobi used, the nonzeros and the risk of the factor solution under the dense covariance
+are written as csv and printed.
+"""
+import argparse
+import time
+import tracemalloc
+
+import gurobipy as gp
+import numpy as np
+import pandas as pd
+from gurobipy import GRB
+
+from risk import dense_risk, factor_model, factor_risk
+
+
+def simulate_returns(days, assets, factors, seed=0):
+    """
+    :param days: number of days
+    :param assets: number of assets
+    :param factors: number of factors driving the returns
+    :param seed: seed of the generator
+    :return: numpy array with the returns of a day per row
+    """
+    rng = np.random.default_rng(seed)
+    loadings = rng.normal(0, 1, (assets, factors))
+    moves = rng.normal(0, 0.01, (days, factors)) @ loadings.T + rng.normal(0, 0.01, (days, assets))
+    return np.abs(moves) + 0.0005
+
+
+def build(env, formulation, sigma, returns, factors):
+    """
+    :return: gurobi model, its portfolio MVar and the python memory peak in bytes while building
+    """
+    tracemalloc.start()
+    m = gp.Model("portfolio", env=env)
+    x = m.addMVar(sigma.shape[0])
+    if formulation == "factor":
+        B, F, D = factor_model(returns, factors)
+        portfolio_risk = factor_risk(m, x, B, F, D)
+    else:
+        portfolio_risk = dense_risk(x, sigma)
+    m.setObjective(portfolio_risk, GRB.MINIMIZE)
+    m.addConstr(x.sum() == 1, "Budget")
+    m.update()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return m, x, peak
+
+
+def bench(env, assets, factors, days, repeat, seed=0):
+    """
+    :return: list of dictionaries, one per formulation and run
+    """
+    returns = simulate_returns(days, assets, factors, seed)
+    sigma = np.cov(returns, rowvar=False)
+    rows = []
+    for formulation in ("dense", "factor"):
+        for run in range(repeat):
+            started = time.perf_counter()
+            m, x, peak = build(env, formulation, sigma, returns, factors)
+            built = time.perf_counter() - started
+            row = {"assets": assets, "formulation": formulation, "run": run, "build": built,
+                   "python_peak_mb": peak / 2 ** 20, "vars": m.NumVars, "constrs": m.NumConstrs,
+                   "nzs": m.NumNZs, "qnzs": m.NumQNZs, "error": None}
+            try:
+                m.optimize()
+            except gp.GurobiError as e:
+                # a size limited license refuses the larger dense models, the row keeps the build numbers
+                row["error"] = str(e)
+            solved = row["error"] is None and m.SolCount > 0
+            weights = x.X if solved else np.full(assets, np.nan)
+            row.update({"solve": m.Runtime if solved else np.nan, "gurobi_mem_gb": m.MaxMemUsed if solved else np.nan,
+                        "risk": float(weights @ sigma @ weights)})
+            rows.append(row)
+            m.dispose()
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dense and the factor model portfolio formulations")
+    parser.add_argument("--assets", type=int, nargs="+", default=[250, 500, 1000], help="universe sizes")
+    parser.add_argument("--factors", type=int, default=10, help="number of factors")
+    parser.add_argument("--days", type=int, default=504, help="days of returns")
+    parser.add_argument("--repeat", type=int, default=1, help="builds and solves per size and formulation")
+    parser.add_argument("--out", help="csv file the timings are written to")
+    parser.add_argument("--log", action="store_true", help="show the gurobi log")
+    args = parser.parse_args()
+
+    env = gp.Env(params={"OutputFlag": 1 if args.log else 0})
+    rows = []
+    for assets in args.assets:
+        rows.extend(bench(env, assets, args.factors, args.days, args.repeat))
+    timings = pd.DataFrame(rows)
+    if args.out:
+        timings.to_csv(args.out, index=False)
+    summary = timings.groupby(["assets", "formulation"]).agg(
+        build=("build", "median"), solve=("solve", "median"), python_peak_mb=("python_peak_mb", "max"),
+        gurobi_mem_gb=("gurobi_mem_gb", "max"), qnzs=("qnzs", "first"), nzs=("nzs", "first"), risk=("risk", "first"),
+        errors=("error", "count"))
+    # how much riskier the factor portfolio is under the full covariance
+    dense = summary.xs("dense", level="formulation")["risk"]
+    summary["risk_excess"] = summary["risk"] / summary.index.get_level_values("assets").map(dense).values - 1
+    print(summary.to_string())
+
+
+if __name__ == "__main__":
+    main()
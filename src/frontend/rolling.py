@@ -0,0 +1,45 @@
+import numpy as np
+
+# Hours committed by every window of a rolling horizon run
+ROLLING_BLOCK = 24
+# Hours every window looks past the hours it commits
+ROLLING_OVERLAP = 12
+
+
+def demand_series(table):
+    """
+    Put the hourly demand of a date range in chronological order
+    :param table: DataTable of the demand file indexed by YEAR with MONTH, DAY, HOUR and LOAD columns
+    :return: list of "YYYY-MM-DD H" labels and a numpy array of the loads
+    """
+    years = np.asarray(table.index.array, dtype=np.int64)
+    months, days, hours = [table[c].vector().astype(np.int64) for c in ("MONTH", "DAY", "HOUR")]
+    order = np.lexsort((hours, days, months, years))
+    labels = [f"{y:04d}-{m:02d}-{d:02d} {h}" for y, m, d, h in
+              zip(years[order].tolist(), months[order].tolist(), days[order].tolist(), hours[order].tolist())]
+    return labels, table["LOAD"].vector()[order].astype(float)
+
+
+def windows(length, block=ROLLING_BLOCK, overlap=ROLLING_OVERLAP):
+    """
+    Split a series of hours into overlapping windows.
+    Every window commits block hours, the last one what is left.
+    Window hour 1 of every window after the first is the last hour the window before committed,
+    so its generator states are known and only link the window to the past.
+    :param length: number of hours in the series
+    :param block: hours committed per window
+    :param overlap: hours looked at past the committed ones
+    :return: generator of (start, stop, first, last), the window covers the series positions start to stop
+             and commits its hours first to last, counted from 1
+    """
+    start = 0
+    while True:
+        # the first window has no carried hour in front of the hours it commits
+        carried = 0 if start == 0 else 1
+        stop = min(start + carried + block + overlap, length)
+        last = min(carried + block, stop - start)
+        yield start, stop, carried + 1, last
+        if start + last >= length:
+            break
+        # the last committed hour becomes hour 1 of the next window
+        start += last - 1
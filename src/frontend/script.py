@@ -1,25 +1,50 @@
 import io
 import json
+import datetime
 import base64
-import yfinance as yf
+from types import SimpleNamespace
 import numpy as np
 import pandas as pd
 import gurobipy as gp
 from gurobipy import GRB
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 
-from utils import parse, typeparse
+from compiler import compile_formula, formula_cache_info
+from templates import ModelTemplate, formulation_signature, templates, variable_names
+from symbols import SymbolTable
+from store import IndexSet, Parameter, parse_table
+from uploads import uploads
+from timeseries import timeseries
+from jobs import jobs
+from envs import envs
+from results import model_fingerprint, results
+from warmstart import warm_starts
+from progress import chain, set_budget, solve_summary
+from snapshots import snapshots
+from timings import Timings, metrics, record_solve, recording, span
+from prices import prices
+from sectors import sectors
+from returnstats import return_stats
+from risk import dense_risk, factor_risk, risk_options
+from covariance import covariances, estimator_option
+from frontier import frontier_points
+from rolling import ROLLING_BLOCK, ROLLING_OVERLAP, demand_series, windows
 from visualizations import *
 
 app = Flask(__name__)
 CORS(app)
 CORS(app, resources={r"/api/*": {"origins": "http://localhost:3000"}})
 verbose=True
+# Hours of a rolling horizon plan that are plotted
+ROLLING_PLOT_HOURS = 168
 
-@app.route('/api/home', methods=['POST'])
-def home():
+def parse_request():
+    """
+    Read the form fields and the uploaded files of a request
+    :return: dictionary of data and list of files
+    """
     # 'data' is an 'ImmutableMultiDict'. See the following documentation:
     # https://tedboy.github.io/flask/generated/generated/werkzeug.ImmutableMultiDict.html
     data = request.form
@@ -36,17 +61,46 @@ def home():
     files = request.files.getlist('file')
     if verbose:
         print("Got files:", [file.filename for file in files])
+    return data_dict, files
 
-    # prep the dict for json response simply return the list of dict items
-    response = {}
-
+def solve(data_dict, files, progress=None, timings=None):
+    """
+    Run the model picked by the problem type
+    :param data_dict: dictionary of data
+    :param files: list of files
+    :param progress: Progress callback for the solve, or None
+    :param timings: Timings the phases are added to, a new one if None
+    :return: dictionary for the json response
+    """
     try:
         problemType = data_dict["problem"]
     except:
-        return jsonify({"error": "Please select a problem type"})
-    
+        return {"error": "Please select a problem type"}
+
+    timings = Timings() if timings is None else timings
+    timings.problem = problemType
+    with recording(timings):
+        response = run_model(problemType, data_dict, files, progress)
+    response["timings"] = timings.block()
+    return response
+
+def run_model(problemType, data_dict, files, progress=None):
+    """
+    :param problemType: problem type of the request
+    :param data_dict: dictionary of data
+    :param files: list of files
+    :param progress: Progress callback for the solve, or None
+    :return: dictionary for the json response
+    """
+    # prep the dict for json response simply return the list of dict items
+    response = {}
+
     if problemType == "mathematical_optimization":
-        result, fig = general_model(data_dict, files, hardcode="PowerPlant")
+        summary = response["summary"] = {}
+        if data_dict.get("rolling"):
+            result, fig = rolling_model(data_dict, files, progress=progress, summary=summary)
+        else:
+            result, fig = general_model(data_dict, files, hardcode="PowerPlant", progress=progress, summary=summary)
         response["result"] = result
         try:
             response["fig"] = fig
@@ -54,7 +108,8 @@ def home():
             response["fig"] = None
 
     elif problemType == "location_analysis":
-        result, fig = general_model(data_dict, files, hardcode="Coverage")
+        summary = response["summary"] = {}
+        result, fig = general_model(data_dict, files, hardcode="Coverage", progress=progress, summary=summary)
         response["result"] = result
         try:
             response["fig"] = fig
@@ -62,15 +117,85 @@ def home():
             response["fig"] = None
 
     elif problemType == "portfolio_optimization":
-        result, fig = portfolio_model(files)
+        result, fig = portfolio_model(files, data_dict)
         response["result"] = result
         try:
             response["fig"] = fig
         except:
             response["fig"] = None
+    return response
+
+@app.route('/api/home', methods=['POST'])
+def home():
+    timings = Timings()
+    with timings.phase("decode"):
+        data_dict, files = parse_request()
+    response = solve(data_dict, files, timings=timings)
+    if "timings" in response:
+        metrics.observe(response["timings"])
     return jsonify(response)
 
-def portfolio_model(files):
+@app.route('/api/jobs', methods=['POST'])
+def submit_job():
+    # Same form as /api/home, the solve runs in a worker process and the job id is returned right away
+    timings = Timings()
+    with timings.phase("decode"):
+        data_dict, files = parse_request()
+    job = jobs.submit(data_dict, files, timings)
+    return jsonify(job.status()), 202
+
+@app.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    # Latency histograms of every request phase by problem type, and the state of the caches of this process.
+    # Jobs are solved in worker processes, their caches are not part of these numbers
+    return jsonify({"latency": metrics.info(),
+                    "caches": {"formulas": formula_cache_info(), "templates": templates.info(),
+                               "uploads": uploads.info(), "timeseries": timeseries.info(), "results": results.info(),
+                               "envs": envs.info(), "snapshots": snapshots.info(),
+                               "prices": prices.info(), "sectors": sectors.info(),
+                               "return_stats": return_stats.info(), "covariances": covariances.info()}})
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    # Poll for the status, or stream it as server sent events with ?stream=1 or Accept: text/event-stream
+    job = jobs.get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    if request.args.get("stream") or request.accept_mimetypes.best == "text/event-stream":
+        return Response(stream_with_context(job.events()), mimetype="text/event-stream")
+    return jsonify(job.status())
+
+@app.route('/api/batch', methods=['POST'])
+def submit_batch():
+    # One formulation and its files plus a json list of scenarios, each scenario is solved as a job
+    data_dict, files = parse_request()
+    scenarios = data_dict.pop("scenarios", None)
+    try:
+        batch = jobs.submit_batch(data_dict, files, scenarios)
+    except Exception as e:
+        return jsonify({"error": str(e)}), 400
+    return jsonify(batch.status()), 202
+
+@app.route('/api/batch/<batch_id>', methods=['GET'])
+def get_batch(batch_id):
+    # The consolidated results table, as json or as csv with ?format=csv
+    batch = jobs.get_batch(batch_id)
+    if batch is None:
+        return jsonify({"error": "Unknown batch"}), 404
+    status = batch.status()
+    if request.args.get("format") == "csv":
+        return Response(pd.DataFrame(status["results"]).to_csv(index=False), mimetype="text/csv")
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/stop', methods=['POST'])
+def stop_job(job_id):
+    # Accept the best plan found so far, the job finishes with it instead of proving optimality
+    job = jobs.stop(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown job"}), 404
+    return jsonify(job.status())
+
+def portfolio_model(files, data_dict=None):
     """
     Create a gurobi model from the dataframes and data_dict
     :param files: dictionary of dataframes
@@ -78,245 +203,555 @@ def portfolio_model(files):
     :return: None
     """
     # Load the data
-    try:
-        stocks = pd.read_csv(files[0])
-    except:
-        raise Exception("Error: Please upload a csv file")
-    stocks = stocks.iloc[1:, 0].str.upper().str.strip().tolist()
-    try:
-        data = yf.download(stocks, period="2y")
-    except:
-        raise Exception("Error: Please check the stock symbols")
+    with span("load"):
+        try:
+            stocks = pd.read_csv(files[0])
+        except:
+            raise Exception("Error: Please upload a csv file")
+        stocks = stocks.iloc[1:, 0].str.upper().str.strip().tolist()
+        # only the days not in the local price store are fetched
+        try:
+            data = prices.history(stocks)
+        except:
+            raise Exception("Error: Please check the stock symbols")
     
     # Compute statistics
-    closes = np.transpose(data['Close'].to_numpy())
-    absdiffs = np.abs(np.diff(closes))
-    reldiffs = absdiffs / closes[:, :-1]
-    delta = np.mean(reldiffs, axis=1)
-    sigma = np.cov(reldiffs)
-    std = np.std(reldiffs, axis=1)
-
-    m = gp.Model("portfolio")
-    x = m.addMVar(len(stocks))
-
-    # Objective is to minimize risk while maximizing return
-    portfolio_risk = x @ sigma @ x
-    m.setObjective(portfolio_risk, GRB.MINIMIZE)
-
-    # Fix budget with a constraint
-    m.addConstr(x.sum() == 1, "Budget")
-
-    m.optimize()
-
-    # Print the decision variables
-    result = "\nOptimal Portfolio:\n"
-    for i in range(len(stocks)):
-        if x.X[i] > 0.01:
-            result += f"{stocks[i]}: {x.X[i]*100:.2f}%\n"
-
-    bubble = plot_portfolio_bubble(std, delta, stocks, x)
-    pie = plot_portfolio_pie(stocks, x)
-    frontier = plot_efficient_frontier(m, x, delta, std, stocks)
-    forecast = plot_portfolio_forecast(data)
-
-    plots = []
-    for plot in [bubble, frontier, pie, forecast]:
-        img = io.BytesIO()
-        FigureCanvas(plot).print_png(img)
-        plots.append(base64.b64encode(img.getvalue()).decode())
-
-    return result, plots
+    with span("parameters"):
+        closes = np.transpose(data['Close'].to_numpy())
+        # running sums of the universe, only the days since its last request are added
+        delta, sigma, std = return_stats.update(stocks, data['Close'])
+        risk_model, factors = risk_options(data_dict)
+        estimator = estimator_option(data_dict)
+        points = frontier_points(data_dict)
+        # the estimate and its decomposition are kept until the window of the universe moves
+        if risk_model == "factor":
+            B, F, D = covariances.factors(stocks, estimator, factors)
+        elif estimator != "sample":
+            sigma = covariances.sigma(stocks, estimator)
+
+    plots_wanted = data_dict.get("plots", True) if data_dict else True
+
+    # the model is disposed and the env handed back to the pool however the request ends
+    with envs.borrowed() as env, gp.Model("portfolio", env=env) as m:
+        with span("constraints"):
+            x = m.addMVar(len(stocks))
+
+            # Objective is to minimize risk while maximizing return
+            if risk_model == "factor":
+                portfolio_risk = factor_risk(m, x, B, F, D)
+            else:
+                portfolio_risk = dense_risk(x, sigma)
+            m.setObjective(portfolio_risk, GRB.MINIMIZE)
+
+            # Fix budget with a constraint
+            m.addConstr(x.sum() == 1, "Budget")
+
+        # The plots also depend on the price history and the frontier points, not only on the model
+        with span("cache"):
+            fingerprint = model_fingerprint(m, json.dumps([stocks, points, plots_wanted]).encode() + closes.tobytes())
+            cached = results.get(fingerprint)
+        if cached is not None:
+            return cached[0], cached[1]
+
+        snapshot = snapshots.capture(m, "portfolio", data_dict, files, fingerprint,
+                                     extra={"stocks": stocks, "risk_model": risk_model, "estimator": estimator})
+        with span("optimize"):
+            m.optimize()
+        record_solve(m)
+        snapshots.finish(snapshot, solve_summary(m))
+
+        # Print the decision variables
+        with span("extract"):
+            result = "\nOptimal Portfolio:\n"
+            for i in range(len(stocks)):
+                if x.X[i] > 0.01:
+                    result += f"{stocks[i]}: {x.X[i]*100:.2f}%\n"
+
+        plots = []
+        if plots_wanted:
+            with span("render"):
+                bubble = plot_portfolio_bubble(std, delta, stocks, x)
+                pie = plot_portfolio_pie(stocks, x)
+                frontier = plot_efficient_frontier(m, x, delta, std, stocks, points=points)
+                forecast = plot_portfolio_forecast(data)
+
+            with span("encode"):
+                for plot in [bubble, frontier, pie, forecast]:
+                    img = io.BytesIO()
+                    FigureCanvas(plot).print_png(img)
+                    plots.append(base64.b64encode(img.getvalue()).decode())
+
+        with span("cache"):
+            if m.status == GRB.OPTIMAL:
+                results.put(fingerprint, [result, plots])
+        return result, plots
+
+
+def parse_date(date):
+    """
+    :param date: string written as YYYY-MM-DD
+    :return: year, month and day as ints
+    """
+    try:
+        year, month, day = [int(part) for part in date.split("-")]
+    except (AttributeError, ValueError):
+        raise Exception("Error: Please check the date, it has to be written as YYYY-MM-DD")
+    try:
+        datetime.date(year, month, day)
+    except ValueError:
+        raise Exception(f"Error: Please check the date, {date} is not a day of the calendar")
+    return year, month, day
 
+def set_costs(symbols, year):
+    """
+    Set the fuel, operating and startup cost of every plant for a year
+    :param symbols: SymbolTable with the power plant files loaded
+    :param year: int
+    :return: None
+    """
+    plants = symbols.tables["plant_capacities"]
+    fuel_types = plants["FuelType"].vector().tolist()
+    for key, costs in [("f", "fuel_costs"), ("o", "operating_costs"), ("s", "startup_costs")]:
+        costs = symbols.tables[costs]
+        try:
+            symbols[key] = Parameter(key, plants.index, np.array([costs[fuel][year] for fuel in fuel_types], dtype=float))
+        except KeyError:
+            raise Exception(f"Error: Please check the data, {costs.name} has no costs for {year}")
+    symbols["t"] = symbols["s"]
 
-def general_model(data_dict, files, hardcode="None"):
+def load_symbols(data_dict, files, hardcode="None"):
     """
-    Create a gurobi model from the dataframes and data_dict
+    Load the files of a request and derive the parameters of the model
     :param data_dict: dictionary of data
     :param files: list of file names
     :param hardcode: string to determine which model to run
-    :return: None
+    :return: SymbolTable
     """
-    m = gp.Model("general_model")
-    
+    # Every symbol of the request lives in its own table so requests can run concurrently
+    symbols = SymbolTable()
+
+    if hardcode == "PowerPlant":
+        year, month, day = parse_date(data_dict.get("date") or "2011-07-01")
+        # a demand window for rolling horizon runs, one day otherwise
+        last = parse_date(data_dict["end_date"]) if data_dict.get("end_date") else None
+
     # Load the data
-    for f in files:
-        name = f.filename.split(".")[0]
-        data = io.BytesIO(f.read())
-        try:
-            file = pd.read_csv(data)
-            if hardcode == "PowerPlant":
-                globals()[name.strip()] = file
-        except:
-            raise Exception("Error: Please upload a csv file")
-        # Parameterize the files
-        i = 0
-        for key, value in file.items():
-            key = key.strip()
-            # The first column is the index for the rest of the column dictionaries
-            if i == 0:
-                # since the first row is index, int/float dtype is assumed
-                try:
-                    globals()[key] = value.to_list()
-                except:
-                    raise Exception("Error: Please check the data")
-                index = value.to_list()
+    with span("load"):
+        for f in files:
+            name = f.filename.split(".")[0].strip()
+            # Parameterize the files, the first column is the index for the rest of the columns.
+            # A file uploaded again with the same content is served from the cache without parsing
+            if hardcode == "PowerPlant" and name == "demand":
+                # only the rows of the days being solved are read from the demand history
+                table = parse_table(name, timeseries.load(f.stream, (year, month, day), last, key=getattr(f, "digest", None)))
             else:
-                # parse the data type of the value
-                column = [typeparse(value[i]) for i in range(len(value))]
-                globals()[key] = {index[i]: column[i] for i in range(len(column))}
-            i += 1
+                table = uploads.load(name, f.read())
+            symbols.tables[name] = table
+            symbols[table.index.name] = table.index
+            symbols.update(table.columns)
 
     # Power Plant Hardcoded Data
-    if hardcode == "PowerPlant":
-        date = "2011-07-01"
-        year = int(date.split("-")[0])
-        month = int(date.split("-")[1])
-        day = int(date.split("-")[2])
-        # unfortunately the example problem performs data operations after loading the data, 
-        # something that can't be handled by the current implementation so we have to hardcode
-        # the data here, If I have time I will look into this bit more
-        globals()["d"] = globals()["demand"][(globals()["demand"]["YEAR"]==year)&(globals()["demand"]["MONTH"]==month)&(globals()["demand"]["DAY"]==day)].set_index(["HOUR"]).LOAD.to_dict()
-        globals()["H"] = set(globals()["d"].keys())
-        globals()["P"] = set(globals()["plant_capacities"]["Plant"].unique())
-        globals()["p_type"] = globals()["plant_capacities"].set_index(["Plant"]).PlantType.to_dict()
-        globals()["P_N"] = set([i for i in globals()["P"] if globals()["p_type"][i]=="NUCLEAR"])
-        globals()["fuel_type"] = globals()["plant_capacities"].set_index(["Plant"]).FuelType.to_dict()
-        globals()["c"] = globals()["plant_capacities"].set_index(["Plant"]).Capacity.to_dict()
-        globals()["f"] = {i: globals()["fuel_costs"].T.to_dict()[9][globals()["fuel_type"][i]] for i in globals()["fuel_type"].keys()}
-        globals()["o"] = {i: globals()["operating_costs"][globals()["operating_costs"]['year']==year].T.to_dict()[9][globals()["fuel_type"][i]] for i in globals()["fuel_type"].keys()}
-        globals()["s"] = {i: globals()["startup_costs"][globals()["startup_costs"]['year']==year].T.to_dict()[9][globals()["fuel_type"][i]] for i in globals()["fuel_type"].keys()}
-        globals()["t"] = globals()["s"].copy()
-        globals()["m"] = {i: 0.8 if i in globals()["P_N"] else 0.01 for i in globals()["P"]}
-        globals()["r"] = {i: 1 if i in ["BIOMASS", "GAS", "HYDRO", "OIL"] else .2 if i in globals()["P_N"] else .25 for i in globals()["P"]}
-        i = 0
-
-    # Create the variables
-    variables = []
+    with span("parameters"):
+        if hardcode == "PowerPlant":
+            # unfortunately the example problem performs data operations after loading the data, 
+            # something that can't be handled by the current implementation so we have to hardcode
+            # the data here, If I have time I will look into this bit more
+            demand = symbols.tables["demand"]
+            selected = (demand.index.array == year) & (demand["MONTH"].vector() == month) & (demand["DAY"].vector() == day)
+            symbols["d"] = dict(zip(demand["HOUR"].vector()[selected].tolist(), demand["LOAD"].vector()[selected].tolist()))
+            # without demand the model is empty and would be reported as optimal, rolling runs check their whole window
+            if len(symbols["d"]) == 0 and last is None:
+                raise Exception("Error: Please check the date, there is no demand on it")
+            symbols["H"] = set(symbols["d"].keys())
+            plants = symbols.tables["plant_capacities"]
+            symbols["P"] = set(plants.index)
+            symbols["p_type"] = plants["PlantType"]
+            symbols["P_N"] = set([i for i in symbols["P"] if symbols["p_type"][i]=="NUCLEAR"])
+            symbols["fuel_type"] = plants["FuelType"]
+            symbols["c"] = plants["Capacity"]
+            set_costs(symbols, year)
+            symbols["m"] = Parameter("m", plants.index, np.where(plants["PlantType"].vector() == "NUCLEAR", 0.8, 0.01))
+            symbols["r"] = {i: 1 if i in ["BIOMASS", "GAS", "HYDRO", "OIL"] else .2 if i in symbols["P_N"] else .25 for i in symbols["P"]}
+
+        # Scenario overrides of single parameter entries or whole parameters
+        for name, value in (data_dict.get("overrides") or {}).items():
+            symbols.override(name, value)
+    return symbols
+
+def build_model(data_dict, symbols, hardcode="None"):
+    """
+    Build the model of a formulation, or refill the one built for an earlier request with the same formulation
+    :param data_dict: dictionary of data
+    :param symbols: SymbolTable of the request, the decision variables are added to it
+    :param hardcode: string to determine which model to run
+    :return: ModelTemplate, list of variable names and the formulation signature
+    """
     try:
         var_test = data_dict["variables"]
     except:
         raise Exception("Error: Please add variables to the data")
-    for v in data_dict["variables"]:
-        var, Index = v.split("^")
-        h1, h2 = Index.replace("{", "").replace("}", "").split(",") if "," in Index else (Index.replace("{", "").replace("}", ""), None)
-        h1, h2 = h1.strip(), h2.strip() if h2 != None else None
-        if h2 == None:
-            try:
-                globals()[var] = m.addVars(globals()[h1], vtype=GRB.BINARY)
-            except:
-                raise Exception("Error: Please check the variable names")
-        else:
-            if hardcode == "PowerPlant":
-                # This could be fixed if there was more time, an oversight on my part, I thought I could intuit the vtype
-                # from the data, but it seems like it needs to be a parameter in the data_dict
-                # So I will hardcode the vtype here for the first powerplant variable
-                if i == 0:
-                    globals()[var] = m.addVars(globals()[h1], globals()[h2], lb=0)
-                    print("m.addVars(" + h1 + ", " + h2 + ", lb=0)")
-                    i += 1
-                    variables.append(var)
-                    continue
-            try:
-                globals()[var] = m.addVars(globals()[h1], globals()[h2], vtype=GRB.BINARY)
-            except:
-                raise Exception("Error: Please check the variable names")
-        variables.append(var)
-
-    # Add the constraints and objective
     try:
         cons_test = data_dict["constraints"]
     except:
         raise Exception("Error: Please add constraints to the data")
-    for c in data_dict["constraints"]:
-        cons = parse(c)
-        # count the number of 'for's in the constraint
-        iter_count = cons.count("for")
-        if iter_count == 1:
-            if verbose:
-                print("m.addConstr(" + cons + ")")
-            try:
-                exec("m.addConstr(" + cons + ")")
-            except:
-                raise Exception("Error: Please check the constraint")
-        elif iter_count == 2:
-            if verbose:
-                print("m.addConstrs(" + cons + ")")
-            try:
-                exec("m.addConstrs(" + cons + ")")
-            except:
-                raise Exception("Error: Please check the constraint")
     try:
         obj_test = data_dict["objective"]
     except:
         raise Exception("Error: Please add an objective to the data")
-    objective = data_dict["objective"]["formula"]
-    sense = "GRB.MAXIMIZE" if data_dict["objective"]["sense"].strip().lower() == "maximize" else "GRB.MINIMIZE"
-    obj = "m.setObjective(" + parse(objective) + ", sense=" + sense + ")"
-    if verbose:
-        print(obj)
-    try:
-        exec(obj)
-    except:
-        raise Exception("Error: Please check the objective")
 
-    m.optimize()
+    # Reuse the model built for an earlier request with the same formulation, only the data is refilled
+    signature = formulation_signature(data_dict, hardcode)
+    with span("patch"):
+        template = templates.acquire(signature, symbols)
+    if template is not None:
+        if verbose:
+            print("Reusing model template", signature[:12], templates.info())
+        return template, list(template.variables), signature
+
+    # gurobi environments are not thread safe, every model borrows its own from the pool
+    env = envs.borrow()
+    m = None
+    try:
+        with span("variables"):
+            m = gp.Model("general_model", env=env)
+
+            # Create the variables, named after their index tuples like z[GAS,3] so the labels of the data
+            # are part of the model fingerprint, the warm starts and the snapshot files
+            i = 0
+            variables = {}
+            for v in data_dict["variables"]:
+                var, Index = v.split("^")
+                h1, h2 = Index.replace("{", "").replace("}", "").split(",") if "," in Index else (Index.replace("{", "").replace("}", ""), None)
+                h1, h2 = h1.strip(), h2.strip() if h2 != None else None
+                if h2 == None:
+                    try:
+                        symbols[var] = m.addVars(symbols[h1], vtype=GRB.BINARY,
+                                                 name=variable_names(var, (h1,), symbols))
+                    except:
+                        raise Exception("Error: Please check the variable names")
+                    variables[var] = (h1,)
+                    continue
+                if hardcode == "PowerPlant":
+                    # This could be fixed if there was more time, an oversight on my part, I thought I could intuit the vtype
+                    # from the data, but it seems like it needs to be a parameter in the data_dict
+                    # So I will hardcode the vtype here for the first powerplant variable
+                    if i == 0:
+                        symbols[var] = m.addVars(symbols[h1], symbols[h2], lb=0,
+                                                 name=variable_names(var, (h1, h2), symbols))
+                        print("m.addVars(" + h1 + ", " + h2 + ", lb=0)")
+                        i += 1
+                        variables[var] = (h1, h2)
+                        continue
+                try:
+                    symbols[var] = m.addVars(symbols[h1], symbols[h2], vtype=GRB.BINARY,
+                                             name=variable_names(var, (h1, h2), symbols))
+                except:
+                    raise Exception("Error: Please check the variable names")
+                variables[var] = (h1, h2)
+        with span("constraints"):
+            template = ModelTemplate(signature, m, variables, symbols, env)
+            linearizer = template.linearizer(symbols)
+
+            # Add the constraints and objective
+            for c in data_dict["constraints"]:
+                try:
+                    cons = compile_formula(c)
+                    if verbose:
+                        print(cons)
+                    template.add_constraint(cons, symbols, linearizer)
+                except Exception as e:
+                    raise Exception(f"Error: Please check the constraint '{c}': {e}")
+            objective = data_dict["objective"]["formula"]
+            sense = GRB.MAXIMIZE if data_dict["objective"]["sense"].strip().lower() == "maximize" else GRB.MINIMIZE
+            try:
+                obj = compile_formula(objective)
+                if verbose:
+                    print(obj)
+                    print("Formula cache:", formula_cache_info())
+                template.set_objective(obj, sense, symbols, linearizer)
+            except Exception as e:
+                raise Exception(f"Error: Please check the objective: {e}")
+            template.finish()
+    except Exception:
+        # a formulation that fails to build hands its env back, the template owns it otherwise
+        if m is not None:
+            m.dispose()
+        envs.release(env)
+        raise
+    return template, list(variables), signature
+
+def general_model(data_dict, files, hardcode="None", progress=None, summary=None):
+    """
+    Create a gurobi model from the dataframes and data_dict
+    :param data_dict: dictionary of data
+    :param files: list of file names
+    :param hardcode: string to determine which model to run
+    :param progress: Progress callback reporting incumbents while the model solves
+    :param summary: dictionary filled with the status, objective, bound, gap and runtime of the solve
+    :return: None
+    """
+    summary = {} if summary is None else summary
+    plots_wanted = data_dict.get("plots", True)
 
-    if m.status == GRB.INFEASIBLE:
-        raise Exception("Model is infeasible")
-    
-    # Print the decision variables
-    result = "\nDecision Variables:\n"
+    symbols = load_symbols(data_dict, files, hardcode)
+    template, variables, signature = build_model(data_dict, symbols, hardcode)
+    m = template.model
 
-    for v in variables:
+    # the template goes back to the registry, with the env it holds, however the request ends
+    try:
+        # Per request time limit and gap, these are part of the fingerprint
+        with span("cache"):
+            budget = set_budget(m, data_dict)
+            if verbose and budget:
+                print("Solve budget:", budget)
+
+            # The same scenario submitted again is answered from the result cache
+            fingerprint = model_fingerprint(m, hardcode if plots_wanted else hardcode + ":noplots")
+            cached = results.get(fingerprint)
+        if cached is not None:
+            if verbose:
+                print("Cached result", fingerprint[:12], results.info())
+            summary.update(cached[2], cached=True)
+            return cached[0], cached[1]
+
+        # Start from the last solution of the same formulation
+        with span("warm_start"):
+            monitor = warm_starts.seed(signature, m)
+        snapshot = snapshots.capture(m, hardcode, data_dict, files, fingerprint)
+        with span("optimize"):
+            callback = chain(monitor, progress)
+            if callback is not None:
+                m.optimize(callback)
+            else:
+                m.optimize()
+        record_solve(m)
+        snapshots.finish(snapshot, solve_summary(m))
+
+        if m.status == GRB.INFEASIBLE:
+            raise Exception("Model is infeasible")
+        if m.SolCount == 0:
+            raise Exception("Error: The solve ended before a solution was found, please allow more time")
+        with span("warm_start"):
+            warm_starts.record(signature, m)
+
+        # Print the decision variables
+        with span("extract"):
+            result = "\nDecision Variables:\n"
+
+            for v in variables:
+                result += f"{v}: \n"
+                for key, value in symbols[v].items():
+                    result += f"{key}: {value.x}\n"
+
+        summary.update(solve_summary(m))
+        if m.status != GRB.OPTIMAL:
+            # stopped by the budget or by the client, the best plan found so far is returned
+            reason = {GRB.TIME_LIMIT: "time limit reached", GRB.INTERRUPTED: "stopped"}.get(m.status, f"status {m.status}")
+            result += f"\nSolve ended early ({reason}), gap {m.MIPGap:.2%}\n" if m.IsMIP else f"\nSolve ended early ({reason})\n"
+
+        if monitor is not None:
+            accepted = {True: "accepted", False: "rejected", None: "unknown"}[monitor.accepted]
+            result += f"\nWarm start: {accepted}\n"
+            if verbose:
+                print("Warm start", accepted, monitor.objective)
+
+        plots = []
+        if plots_wanted and hardcode == "PowerPlant":
+            with span("render"):
+                supply = plot_power_plant_supply(sorted(symbols["H"]), symbols["P"], symbols["z"])
+                demand = plot_power_demand(sorted(symbols["H"]), symbols["d"])
+            with span("encode"):
+                for plot in [supply, demand]:
+                    img = io.BytesIO()
+                    FigureCanvas(plot).print_png(img)
+                    plots.append(base64.b64encode(img.getvalue()).decode())
+
+        elif plots_wanted and hardcode == "Coverage":
+            # Find the coverage by extracting the first symbol mapping indexes to sets
+            coverage = symbols.find(lambda v: isinstance(v, Parameter) and v.ragged and v.values.kind == "set" and len(v) > 0)
+
+            # Find the regions by extracting the longest index
+            lists = [v for v in symbols.values() if isinstance(v, IndexSet)]
+            region = max(lists, key=len) if len(lists) > 0 else None
+
+            if coverage is None or region is None:
+                raise Exception("Error: Please check the data")
+
+            # Find the selected Towers by extracting the gurobi variable with the same indexes as the coverage
+            selected = symbols.find(lambda v: isinstance(v, gp.tupledict) and len(v) > 0 and set(v.keys()) == set(coverage.keys()))
+
+            # Find the covered regions by extracting the gurobi variable with the same indexes as the regions
+            covered = symbols.find(lambda v: isinstance(v, gp.tupledict) and len(v) > 0 and set(v.keys()) == set(region))
+            if selected is None or covered is None:
+                raise Exception("Error: Please check the data")
+
+            with span("render"):
+                tree = plot_coverage_tree(coverage, region, selected, covered)
+                voronoi = create_voronoi_diagram(coverage, region, selected, covered)
+            with span("encode"):
+                for plot in [tree, voronoi]:
+                    img = io.BytesIO()
+                    FigureCanvas(plot).print_png(img)
+                    plots.append(base64.b64encode(img.getvalue()).decode())
+
+        with span("cache"):
+            if m.status == GRB.OPTIMAL:
+                results.put(fingerprint, [result, plots, summary])
+        return result, plots
+    finally:
+        templates.release(template)
+
+def rolling_model(data_dict, files, progress=None, summary=None):
+    """
+    Solve the power plant model over a long demand window in overlapping blocks.
+    Every window commits its first hours, the generator states of the last committed hour are fixed
+    as the first hour of the next window, and the model of one window is refilled for the next one.
+    :param data_dict: dictionary of data, the horizon runs from date to end_date
+    :param files: list of files
+    :param progress: Progress callback reporting incumbents while the windows solve
+    :param summary: dictionary filled with the status, committed cost, runtime and the result of every window
+    :return: result text and plots
+    """
+    summary = {} if summary is None else summary
+    options = data_dict.get("rolling")
+    options = options if isinstance(options, dict) else {}
+    try:
+        block, overlap = int(options.get("block", ROLLING_BLOCK)), int(options.get("overlap", ROLLING_OVERLAP))
+    except (TypeError, ValueError):
+        raise Exception("Error: Please check the rolling horizon, block and overlap have to be whole hours")
+    if block < 1 or overlap < 0:
+        raise Exception("Error: Please check the rolling horizon, block needs at least one hour and overlap can't be negative")
+    if not data_dict.get("end_date"):
+        raise Exception("Error: Please add an end_date for the rolling horizon")
+
+    base = load_symbols(data_dict, files, "PowerPlant")
+    labels, loads = demand_series(base.tables["demand"])
+    if len(loads) == 0:
+        raise Exception("Error: Please check the dates, there is no demand between them")
+    year = parse_date(data_dict.get("date") or "2011-07-01")[0]
+    overrides = data_dict.get("overrides") or {}
+
+    def split(key):
+        # the hour is the last index of a variable over H
+        return (key[:-1], key[-1]) if isinstance(key, tuple) else ((), key)
+
+    schedule = {}
+    # values of the last committed hour, fixed as hour 1 of the next window
+    carried = None
+    # values from the last committed hour on, the start of the next window
+    starts = None
+    reports = []
+    stopped = False
+    for k, (start, stop, first, last) in enumerate(windows(len(loads), block, overlap)):
+        symbols = base.copy()
+        symbols["d"] = dict(enumerate(loads[start:stop].tolist(), 1))
+        symbols["H"] = set(symbols["d"])
+        if int(labels[start][:4]) != year:
+            # costs follow the year of the window, the scenario overrides still apply
+            set_costs(symbols, int(labels[start][:4]))
+            for name in ["f", "o", "s", "t"]:
+                if name in overrides:
+                    symbols.override(name, overrides[name])
+
+        template, variables, signature = build_model(data_dict, symbols, "PowerPlant")
+        m = template.model
+        try:
+            hourly = [v for v in variables if template.domains[v][-1] == "H"]
+            set_budget(m, data_dict)
+            fixed, seeded = [], []
+            for v in hourly:
+                for key, var in symbols[v].items():
+                    prefix, h = split(key)
+                    if carried is not None and h == 1:
+                        fixed.append((var, carried[v][prefix]))
+                    if starts is not None:
+                        seeded.append((var, starts[v].get((prefix, h), GRB.UNDEFINED)))
+            if fixed:
+                m.setAttr("LB", [var for var, _ in fixed], [x for _, x in fixed])
+                m.setAttr("UB", [var for var, _ in fixed], [x for _, x in fixed])
+            if seeded and m.IsMIP:
+                m.setAttr("Start", [var for var, _ in seeded], [x for _, x in seeded])
+            snapshot = snapshots.capture(m, "rolling", data_dict, files, extra={"window": k, "start": labels[start]})
+            with span("optimize"):
+                if progress is not None:
+                    m.optimize(progress)
+                else:
+                    m.optimize()
+            record_solve(m)
+            snapshots.finish(snapshot, solve_summary(m))
+
+            if m.status in (GRB.INFEASIBLE, GRB.INF_OR_UNBD) or m.SolCount == 0:
+                raise Exception(f"Error: No plan was found for the window starting {labels[start]}, "
+                                "please check the demand or allow more time")
+            report = solve_summary(m)
+            report.update(window=k, start=labels[start + first - 1], end=labels[start + last - 1], cost=0.0)
+            with span("extract"):
+                carried, starts = {}, {}
+                for v in variables:
+                    keys, columns = list(symbols[v].keys()), list(symbols[v].values())
+                    values, costs = m.getAttr("X", columns), m.getAttr("Obj", columns)
+                    types = m.getAttr("VType", columns)
+                    schedule.setdefault(v, {})
+                    if v not in hourly:
+                        schedule[v].update(zip(keys, values))
+                        continue
+                    carried[v], starts[v] = {}, {}
+                    for key, x, c, vtype in zip(keys, values, costs, types):
+                        prefix, h = split(key)
+                        if first <= h <= last:
+                            schedule[v][prefix + (labels[start + h - 1],)] = x
+                            report["cost"] += c * x
+                        if h == last:
+                            carried[v][prefix] = round(x) if vtype in "BI" else x
+                        if h >= last:
+                            # the next window starts at the last committed hour
+                            starts[v][(prefix, h - last + 1)] = x
+        finally:
+            templates.release(template)
+        reports.append(report)
+        if m.status == GRB.INTERRUPTED:
+            # stopped by the client, the hours committed so far are returned
+            stopped = True
+            break
+
+    cost = sum(r["cost"] for r in reports)
+    status = next((r["status"] for r in reports if r["status"] != "optimal"), "optimal")
+    summary.update(status=status, objective=cost, bound=None, gap=None,
+                   runtime=sum(r["runtime"] for r in reports), windows=reports)
+
+    result = f"\nRolling horizon from {labels[0]} to {labels[-1]}: {len(reports)} windows committing {block} hours, " \
+             f"looking {overlap} hours ahead\n"
+    result += f"Cost of the committed hours: {cost}\n"
+    for r in reports:
+        result += f"Window {r['window']} ({r['start']} to {r['end']}): {r['status']}, objective {r['objective']}, " \
+                  f"committed cost {r['cost']}\n"
+    if stopped:
+        result += f"\nSolve ended early (stopped), the plan ends at {reports[-1]['end']}\n"
+    result += "\nDecision Variables:\n"
+    for v in schedule:
         result += f"{v}: \n"
-        for key, value in globals()[v].items():
-            result += f"{key}: {value.x}\n"
+        for key, value in schedule[v].items():
+            result += f"{key}: {value}\n"
 
     plots = []
-    if hardcode == "PowerPlant":
-        supply = plot_power_plant_supply(globals()["H"], globals()["P"], globals()["z"])
-        demand = plot_power_demand(globals()["H"], globals()["d"])
-        for plot in [supply, demand]:
-            img = io.BytesIO()
-            FigureCanvas(plot).print_png(img)
-            plots.append(base64.b64encode(img.getvalue()).decode())        
-
-    elif hardcode == "Coverage":
-        # Find the coverage by extracting the first global variable mapping indexes to sets
-        for var in globals():
-            if isinstance(globals()[var], dict) and len(globals()[var]) > 0 and isinstance(list(globals()[var].values())[0], set):
-                coverage = globals()[var]
-                break
-
-        # Find the regions by extracting the longest global variable list
-        max_len = 0
-        for var in globals():
-            if isinstance(globals()[var], list) and len(globals()[var]) > max_len:
-                region = globals()[var]
-                max_len = len(globals()[var])
-
-        # Find the selected Towers by extracting the global variable with the same indexes as the coverage that is also a gurobi variable
-        for var in globals():
-            if isinstance(globals()[var], gp.tupledict) and len(globals()[var]) > 0 and set(globals()[var].keys()) == set(coverage.keys()):
-                selected = globals()[var]
-                break
-
-        # Find the covered regions by extracting the global variable with the same indexes as the regions that is also a gurobi variable
-        for var in globals():
-            if isinstance(globals()[var], gp.tupledict) and len(globals()[var]) > 0 and set(globals()[var].keys()) == set(region):
-                covered = globals()[var]
-                break
-        if coverage == None or region == None or selected == None or covered == None:
-            raise Exception("Error: Please check the data")
-        
-        tree = plot_coverage_tree(coverage, region, selected, covered)
-        voronoi = create_voronoi_diagram(coverage, region, selected, covered)
-        for plot in [tree, voronoi]:
-            img = io.BytesIO()
-            FigureCanvas(plot).print_png(img)
-            plots.append(base64.b64encode(img.getvalue()).decode())
-
+    committed_hours = {key[-1] for key in schedule.get("z", {})}
+    if data_dict.get("plots", True) and committed_hours:
+        # the first week is plotted, longer horizons would not fit the figure
+        committed = [label for label in labels if label in committed_hours][:ROLLING_PLOT_HOURS]
+        numbers = {label: n for n, label in enumerate(committed, 1)}
+        supply = {(key[0], numbers[key[-1]]): SimpleNamespace(X=x) for key, x in schedule["z"].items() if key[-1] in numbers}
+        demand = {numbers[label]: load for label, load in zip(labels, loads.tolist()) if label in numbers}
+        plants = sorted({key[0] for key in supply})
+        with span("render"):
+            figures = [plot_power_plant_supply(list(numbers.values()), plants, supply),
+                       plot_power_demand(list(numbers.values()), demand)]
+        with span("encode"):
+            for plot in figures:
+                img = io.BytesIO()
+                FigureCanvas(plot).print_png(img)
+                plots.append(base64.b64encode(img.getvalue()).decode())
     return result, plots
 
 if __name__ == '__main__':
-    app.run(debug=True, port=8080)
+    envs.warm()
+    app.run(debug=True, port=8080, threaded=True)
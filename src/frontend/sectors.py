@@ -0,0 +1,114 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from prices import prices
+
+# Directory the sectors are kept in between restarts, only kept in memory when unset
+SECTOR_CACHE_DIR = os.environ.get("SECTOR_CACHE_DIR")
+# Seconds a sector is trusted, companies rarely change sector
+SECTOR_TTL = 30 * 24 * 3600
+# Seconds before a ticker whose lookup failed is asked for again
+FAILURE_TTL = 3600
+# Number of lookups running at the same time
+SECTOR_WORKERS = int(os.environ.get("SECTOR_WORKERS", 8))
+# Sector of the tickers the provider has no sector for
+UNKNOWN_SECTOR = "Unknown"
+
+
+class SectorService:
+    """
+    The sector of every ticker, looked up from the price provider.
+    Tickers not in the cache are looked up concurrently on a bounded pool of threads,
+    the results are kept for a long time in memory and in a json file.
+    """
+
+    def __init__(self, provider=None, directory=SECTOR_CACHE_DIR, ttl=SECTOR_TTL, workers=SECTOR_WORKERS):
+        self.provider = provider
+        self.directory = directory
+        self.ttl = ttl
+        self.workers = workers
+        # ticker to {"sector", "time"}, a None sector marks a failed lookup
+        self.entries = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def path(self):
+        return os.path.join(self.directory, "sectors.json")
+
+    def load(self):
+        if self.entries is not None:
+            return
+        self.entries = {}
+        if self.directory is not None and os.path.exists(self.path()):
+            try:
+                with open(self.path()) as file:
+                    self.entries = json.load(file)
+            except (OSError, ValueError):
+                pass
+
+    def save(self):
+        if self.directory is None:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        temporary = self.path() + f".{threading.get_ident()}.tmp"
+        with open(temporary, "w") as file:
+            json.dump(self.entries, file)
+        os.replace(temporary, self.path())
+
+    def fresh(self, entry, now):
+        return entry is not None and now - entry["time"] <= (self.ttl if entry["sector"] is not None else FAILURE_TTL)
+
+    def fetch(self, ticker):
+        # the provider is looked up late, so the store can be swapped out for tests and offline runs
+        provider = self.provider if self.provider is not None else prices.provider
+        try:
+            return provider.sector(ticker)
+        except Exception:
+            return None
+
+    def lookup(self, tickers):
+        """
+        :param tickers: list of ticker symbols
+        :return: dictionary of ticker to sector name
+        """
+        now = time.time()
+        with self.lock:
+            self.load()
+            missing = [t for t in dict.fromkeys(tickers) if not self.fresh(self.entries.get(t), now)]
+        self.hits += len(set(tickers)) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.workers, len(missing)))) as pool:
+                found = list(pool.map(self.fetch, missing))
+            with self.lock:
+                for ticker, sector in zip(missing, found):
+                    self.entries[ticker] = {"sector": sector, "time": now}
+                self.save()
+        with self.lock:
+            return {t: self.entries[t]["sector"] or UNKNOWN_SECTOR for t in tickers}
+
+    def weights(self, tickers, allocation):
+        """
+        Add up an allocation by sector
+        :param tickers: list of ticker symbols
+        :param allocation: numpy array of the share of every ticker
+        :return: pandas Series of sector to share, in the order the sectors first appear
+        """
+        sectors = self.lookup(tickers)
+        return pd.Series(np.asarray(allocation, dtype=float)).groupby([sectors[t] for t in tickers], sort=False).sum()
+
+    def info(self):
+        """
+        :return: dictionary with hits, misses and the number of tickers known
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.entries or {})}
+
+
+sectors = SectorService()
@@ -0,0 +1,135 @@
+import json
+import os
+import shutil
+import threading
+import time
+import uuid
+
+import gurobipy as gp
+
+from timings import span
+
+# Directory every built model is written to before it is solved, only requests asking for a snapshot when unset
+SNAPSHOT_DIR = os.environ.get("SNAPSHOT_DIR")
+# Directory used for requests asking for a snapshot while SNAPSHOT_DIR is unset
+DEFAULT_SNAPSHOT_DIR = "snapshots"
+# File format of the model, mps keeps the full precision, lp is easier to read
+SNAPSHOT_FORMAT = os.environ.get("SNAPSHOT_FORMAT", "mps")
+# Number of snapshots kept, the oldest are deleted first
+MAX_SNAPSHOTS = int(os.environ.get("MAX_SNAPSHOTS", 500))
+# Model attributes recorded with every snapshot
+MODEL_STATS = ("NumVars", "NumConstrs", "NumNZs", "NumQConstrs", "NumQNZs", "NumIntVars", "NumBinVars",
+               "IsMIP", "IsQP")
+
+
+def model_file(path):
+    """
+    :param path: snapshot directory
+    :return: path of the model file in it
+    """
+    for name in sorted(os.listdir(path)):
+        if name.startswith("model."):
+            return os.path.join(path, name)
+    raise Exception(f"Error: {path} has no model file")
+
+
+class Snapshots:
+    """
+    Writes the models handed to the solver to disk so slow solves can be replayed offline.
+    A snapshot is a directory with the compressed model, the non default parameters, the start
+    and basis attributes, the request it was built for and, once the solve is done, its outcome.
+    """
+
+    def __init__(self, directory=SNAPSHOT_DIR, fmt=SNAPSHOT_FORMAT, size=MAX_SNAPSHOTS):
+        self.directory = directory
+        self.fmt = fmt
+        self.size = size
+        self.lock = threading.Lock()
+        self.written = 0
+
+    def wanted(self, data_dict):
+        return self.directory is not None or bool((data_dict or {}).get("snapshot"))
+
+    def capture(self, m, kind, data_dict=None, files=None, fingerprint=None, extra=None):
+        """
+        Write a model as it is about to be solved
+        :param m: gurobi model with its parameters and start values set
+        :param kind: name of the model, such as PowerPlant or portfolio
+        :param data_dict: dictionary of data of the request
+        :param files: list of the uploaded files
+        :param fingerprint: model fingerprint, if computed
+        :param extra: dictionary added to the metadata
+        :return: path of the snapshot, or None if the request is not captured
+        """
+        if not self.wanted(data_dict):
+            return None
+        with span("snapshot"):
+            return self.write(m, kind, data_dict, files, fingerprint, extra)
+
+    def write(self, m, kind, data_dict, files, fingerprint, extra):
+        directory = self.directory or DEFAULT_SNAPSHOT_DIR
+        m.update()
+        path = os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + f"-{kind}-{uuid.uuid4().hex[:8]}")
+        # written under a temporary name so a replay never picks up half a snapshot
+        temporary = path + ".tmp"
+        os.makedirs(temporary)
+        m.write(os.path.join(temporary, f"model.{self.fmt}.gz"))
+        m.write(os.path.join(temporary, "params.prm"))
+        try:
+            # MIP starts, LP basis and primal/dual starts, only written by gurobi 11 and later
+            m.write(os.path.join(temporary, "start.attr"))
+        except gp.GurobiError:
+            pass
+        meta = {"kind": kind, "created": time.time(), "fingerprint": fingerprint,
+                "gurobi": ".".join(str(part) for part in gp.gurobi.version()),
+                "model": {stat: getattr(m, stat) for stat in MODEL_STATS},
+                "request": data_dict or {},
+                "files": [{"name": f.filename, "digest": getattr(f, "digest", None)} for f in files or []]}
+        meta.update(extra or {})
+        with open(os.path.join(temporary, "meta.json"), "w") as file:
+            json.dump(meta, file, indent=1, default=str)
+        os.replace(temporary, path)
+        self.written += 1
+        self.trim(directory)
+        return path
+
+    def finish(self, path, summary):
+        """
+        Record how the solve of a snapshot went
+        :param path: snapshot directory, None does nothing
+        :param summary: dictionary with the status, objective, bound, gap and runtime
+        :return: None
+        """
+        if path is None:
+            return
+        with open(os.path.join(path, "summary.json"), "w") as file:
+            json.dump(summary, file, indent=1, default=str)
+
+    def trim(self, directory):
+        """
+        Delete the oldest snapshots beyond the limit
+        :param directory: snapshot directory
+        :return: None
+        """
+        with self.lock:
+            found = []
+            for name in os.listdir(directory):
+                path = os.path.join(directory, name)
+                if name.endswith(".tmp") or not os.path.isdir(path):
+                    continue
+                try:
+                    found.append((os.stat(path).st_mtime, name))
+                except OSError:
+                    continue
+            found.sort()
+            for _, name in found[:max(0, len(found) - self.size)]:
+                shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+    def info(self):
+        """
+        :return: dictionary with the directory and the number of snapshots written by this process
+        """
+        return {"directory": self.directory, "written": self.written, "maxsize": self.size}
+
+
+snapshots = Snapshots()
@@ -0,0 +1,169 @@
+from collections.abc import Mapping
+
+import numpy as np
+
+from utils import RaggedColumn, as_array, parse_column
+
+
+class IndexSet(list):
+    """
+    The index column of an uploaded file.
+    It is still the list of keys the rest of the code iterates over, plus a single key to row position map
+    shared by every parameter of the file.
+    """
+
+    def __init__(self, name, keys):
+        super().__init__(keys)
+        self.name = name
+        self.positions = {key: i for i, key in enumerate(self)}
+        self._array = None
+
+    @property
+    def array(self):
+        """
+        :return: numpy array of the keys in row order
+        """
+        if self._array is None:
+            self._array = as_array(self)
+        return self._array
+
+    def take(self, keys):
+        """
+        Look up the row positions of many keys at once
+        :param keys: iterable of keys
+        :return: int64 numpy array of positions
+        """
+        positions = self.positions
+        keys = list(keys)
+        return np.fromiter((positions[k] for k in keys), dtype=np.int64, count=len(keys))
+
+
+class Parameter(Mapping):
+    """
+    A data column stored as one contiguous numpy array, or CSR style for list, set and dictionary columns.
+    Reads like a dictionary from index to value for scalar lookups, and as a whole vector through vector and take.
+    """
+
+    def __init__(self, name, index, values):
+        """
+        :param name: column name
+        :param index: IndexSet the rows are addressed by
+        :param values: numpy array or RaggedColumn with one entry per row of the index
+        """
+        self.name = name
+        self.index = index
+        self.values = values
+
+    @property
+    def ragged(self):
+        return isinstance(self.values, RaggedColumn)
+
+    def __getitem__(self, key):
+        value = self.values[self.index.positions[key]]
+        return value.item() if isinstance(value, np.generic) else value
+
+    def __iter__(self):
+        return iter(self.index.positions)
+
+    def __len__(self):
+        return len(self.index.positions)
+
+    def __contains__(self, key):
+        return key in self.index.positions
+
+    def vector(self):
+        """
+        :return: numpy array of the values in row order
+        """
+        if self.ragged:
+            raise Exception(f"Error: {self.name} holds collections, not numbers")
+        return self.values
+
+    def take(self, keys):
+        """
+        Look up many keys at once
+        :param keys: iterable of keys
+        :return: numpy array of values, object array of python collections for list, set and dictionary columns
+        """
+        positions = self.index.take(keys)
+        if not self.ragged:
+            return self.values[positions]
+        taken = np.empty(len(positions), dtype=object)
+        for i, position in enumerate(positions.tolist()):
+            taken[i] = self.values[position]
+        return taken
+
+    def inverted(self):
+        """
+        Map every element of a set or list column to the index keys whose collection contains it
+        :return: dictionary of element to numpy array of keys in row order, or None if the column can't be inverted
+        """
+        if not self.ragged or self.values.kind == "dict" or self.values.values.dtype == object \
+                or len(self.index.positions) != len(self.index):
+            return None
+        counts = np.diff(self.values.offsets)
+        rows = np.repeat(np.arange(len(counts)), counts)
+        elements = self.values.values
+        # group by element with the rows ascending, a row listing an element twice is only kept once
+        order = np.lexsort((rows, elements))
+        elements, rows = elements[order], rows[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = (elements[1:] != elements[:-1]) | (rows[1:] != rows[:-1])
+        elements, rows = elements[first], rows[first]
+        starts = np.flatnonzero(np.concatenate([[True], elements[1:] != elements[:-1]]))
+        keys = self.index.array
+        groups = np.split(rows, starts[1:])
+        return {element: keys[group] for element, group in zip(elements[starts].tolist(), groups)}
+
+
+class DataTable:
+    """
+    The parameters parsed from one uploaded file, the first column is the index of the others
+    """
+
+    def __init__(self, name, index, columns):
+        self.name = name
+        self.index = index
+        self.columns = columns
+
+    def __getitem__(self, column):
+        return self.columns[column]
+
+    def __contains__(self, column):
+        return column in self.columns
+
+    @property
+    def nbytes(self):
+        """
+        :return: approximate size of the parsed arrays in bytes
+        """
+        size = 0
+        for parameter in self.columns.values():
+            values = parameter.values
+            if parameter.ragged:
+                size += values.offsets.nbytes + values.values.nbytes + (values.keys.nbytes if values.keys is not None else 0)
+            else:
+                size += values.nbytes
+        return size + 100 * len(self.index)
+
+
+def parse_table(name, frame):
+    """
+    Parse a csv DataFrame into an index set and one parameter per remaining column
+    :param name: file name without extension
+    :param frame: pandas DataFrame
+    :return: DataTable
+    """
+    items = [(key.strip(), value) for key, value in frame.items()]
+    if len(items) == 0:
+        raise Exception("Error: Please check the data")
+    # since the first row is index, int/float dtype is assumed
+    index = IndexSet(items[0][0], items[0][1].to_list())
+    columns = {}
+    for key, value in items[1:]:
+        # parse the whole column at once
+        try:
+            columns[key] = Parameter(key, index, parse_column(value))
+        except Exception:
+            raise Exception(f"Error: Please check the data in column {key}")
+    return DataTable(name, index, columns)
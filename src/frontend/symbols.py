@@ -0,0 +1,68 @@
+import numpy as np
+
+from store import Parameter
+
+
+class SymbolTable(dict):
+    """
+    The data columns, derived parameters and decision variables of one request, by name.
+    Every request gets its own table, so concurrent solves never see each other's symbols.
+    """
+
+    def __init__(self):
+        super().__init__()
+        # the parsed DataTables of the uploaded files, by file name
+        self.tables = {}
+
+    def copy(self):
+        """
+        :return: SymbolTable with the same symbols and tables, so symbols can be replaced without touching this one
+        """
+        table = SymbolTable()
+        table.update(self)
+        table.tables = dict(self.tables)
+        return table
+
+    def find(self, predicate):
+        """
+        Find the first symbol matching a predicate, in the order the symbols were added
+        :param predicate: function of the value returning bool
+        :return: value, or None if no symbol matches
+        """
+        for value in self.values():
+            if predicate(value):
+                return value
+        return None
+
+    def override(self, name, value):
+        """
+        Replace a parameter for this request only, the shared parsed data is never written to.
+        A dictionary changes single entries, json keys are matched to the index by their text,
+        a number given for an indexed parameter is used for every entry.
+        :param name: parameter name
+        :param value: number, string or dictionary of index to value
+        :return: None
+        """
+        if name not in self:
+            raise Exception(f"Error: Unknown parameter '{name}' in the scenario")
+        current = self[name]
+        if isinstance(current, Parameter) and current.ragged:
+            raise Exception(f"Error: {name} holds collections and can't be overridden")
+        if not isinstance(current, (Parameter, dict)):
+            self[name] = value
+            return
+        if not isinstance(value, dict):
+            value = {key: value for key in current}
+        keys = {str(key): key for key in current}
+        try:
+            changes = {keys[str(key)]: v for key, v in value.items()}
+        except KeyError as e:
+            raise Exception(f"Error: {name} has no entry {e} to override")
+        if isinstance(current, dict):
+            self[name] = {**current, **changes}
+            return
+        new = np.asarray(list(changes.values()))
+        values = current.values.astype(np.result_type(current.values, new)) if current.values.dtype != object \
+            else current.values.copy()
+        values[current.index.take(changes)] = new
+        self[name] = Parameter(name, current.index, values)
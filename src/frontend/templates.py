@@ -0,0 +1,269 @@
+import hashlib
+import itertools
+import json
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from envs import envs
+from builder import Linearizer, NonLinearError, SENSES, add_constraint, set_objective, variable_columns
+from formula import Constraint
+
+# Number of formulations whose built model is kept around between requests
+MAX_TEMPLATES = 16
+# MPS and LP files take no whitespace in names, gurobi writes default names for every variable otherwise
+NAME_WHITESPACE = re.compile(r"\s+")
+
+
+def formulation_signature(data_dict, hardcode):
+    """
+    Hash the parts of a request that decide the structure of the model
+    :param data_dict: dictionary of data
+    :param hardcode: string to determine which model to run
+    :return: hex digest
+    """
+    formulation = {
+        "variables": data_dict.get("variables"),
+        "constraints": data_dict.get("constraints"),
+        "objective": data_dict.get("objective"),
+        "hardcode": hardcode,
+    }
+    return hashlib.sha256(json.dumps(formulation, sort_keys=True).encode()).hexdigest()
+
+
+def domain_keys(domains, namespace):
+    """
+    List the indexes addVars creates for a variable over the given sets
+    :param domains: tuple of set names
+    :param namespace: mapping of data and variable names
+    :return: list of keys
+    """
+    sets = [list(namespace[d]) for d in domains]
+    if len(sets) == 1:
+        return sets[0]
+    return list(itertools.product(*sets))
+
+
+def variable_names(name, domains, namespace):
+    """
+    Name the variables over the given sets after their indexes like z[GAS,3], whitespace in a label becomes _
+    :param name: name of the variable
+    :param domains: tuple of set names
+    :param namespace: mapping of data and variable names
+    :return: dictionary of key to variable name, for the name argument of addVars
+    """
+    names = {}
+    for key in domain_keys(domains, namespace):
+        labels = key if isinstance(key, tuple) else (key,)
+        names[key] = name + "[" + ",".join(NAME_WHITESPACE.sub("_", str(label)) for label in labels) + "]"
+    return names
+
+
+class ModelTemplate:
+    """
+    A built model together with what is needed to refill it with new data.
+    Linear constraint families are kept with their sparse matrix, so a request with the same
+    formulation and the same index sets only changes coefficients, right hand sides, the objective
+    and the bounds instead of building a new model.
+    """
+
+    def __init__(self, signature, m, variables, namespace, env=None):
+        """
+        :param signature: formulation signature
+        :param m: gurobi model with the decision variables added
+        :param variables: dictionary of variable name to the tuple of its index set names
+        :param namespace: mapping of data and variable names
+        :param env: gurobi environment borrowed for the model, handed back to the pool with it
+        """
+        self.signature = signature
+        self.model = m
+        self.env = env
+        self.domains = variables
+        self.variables = {name: namespace[name] for name in variables}
+        self.keys = {name: list(var.keys()) for name, var in self.variables.items()}
+        self.columns = variable_columns(m, namespace, list(variables))
+        self.families = []
+        self.objective = None
+        self.bounds = None
+        self.reusable = True
+
+    def linearizer(self, namespace):
+        """
+        :param namespace: mapping of data and variable names
+        :return: Linearizer over the columns of this model
+        """
+        return Linearizer(namespace, self.columns)
+
+    def add_constraint(self, constraint, namespace, linearizer):
+        """
+        Add a constraint family and remember its matrix
+        :param constraint: Constraint node
+        :param namespace: mapping of data and variable names
+        :param linearizer: Linearizer for the model
+        :return: None
+        """
+        if not isinstance(constraint, Constraint):
+            raise Exception("Error: Constraint is missing a comparison")
+        try:
+            A, b = linearizer.constraint_matrix(constraint, self.model.NumVars)
+        except NonLinearError:
+            # only linear families can be refilled, the model is still built but not kept
+            self.reusable = False
+            add_constraint(self.model, constraint, namespace)
+            return
+        constrs = None
+        if A.shape[0] > 0:
+            constrs = self.model.addMConstr(A, None, SENSES[constraint.sense], b)
+        self.families.append((constraint, constrs, A))
+
+    def set_objective(self, objective, sense, namespace, linearizer):
+        """
+        Set the objective of the model
+        :param objective: expression node
+        :param sense: GRB.MAXIMIZE or GRB.MINIMIZE
+        :param namespace: mapping of data and variable names
+        :param linearizer: Linearizer for the model
+        :return: None
+        """
+        if not set_objective(self.model, objective, sense, namespace, linearizer):
+            self.reusable = False
+        self.objective = objective
+
+    def finish(self):
+        """
+        Record the bounds the variables were created with, call once the model is built
+        :return: None
+        """
+        self.model.update()
+        variables = self.model.getVars()
+        self.bounds = (self.model.getAttr("LB", variables), self.model.getAttr("UB", variables))
+
+    def patch(self, namespace):
+        """
+        Refill the model with the data of a new request
+        :param namespace: mapping of data and variable names
+        :return: True if the model now matches the request, False if the structure is different
+        """
+        for name, domains in self.domains.items():
+            if domain_keys(domains, namespace) != self.keys[name]:
+                return False
+        # assemble everything first so a structural change leaves the model untouched
+        linearizer = self.linearizer(namespace)
+        num_vars = self.model.NumVars
+        updates = []
+        for constraint, constrs, A in self.families:
+            new_A, b = linearizer.constraint_matrix(constraint, num_vars)
+            if new_A.shape != A.shape or not np.array_equal(new_A.indptr, A.indptr) \
+                    or not np.array_equal(new_A.indices, A.indices):
+                return False
+            updates.append((new_A, b))
+        c, constant = linearizer.objective_vector(self.objective, num_vars)
+
+        m = self.model
+        variables = m.getVars()
+        for k, ((constraint, constrs, A), (new_A, b)) in enumerate(zip(self.families, updates)):
+            if constrs is None:
+                continue
+            changed = np.flatnonzero(A.data != new_A.data)
+            if len(changed) > 0:
+                rows = np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))
+                constr_list = constrs.tolist()
+                for j in changed:
+                    m.chgCoeff(constr_list[rows[j]], variables[A.indices[j]], new_A.data[j])
+            constrs.RHS = b
+            self.families[k] = (constraint, constrs, new_A)
+        m.setAttr("Obj", variables, c.toarray().ravel().tolist())
+        m.ObjCon = constant
+        m.setAttr("LB", variables, self.bounds[0])
+        m.setAttr("UB", variables, self.bounds[1])
+        for name, var in self.variables.items():
+            namespace[name] = var
+        return True
+
+    def dispose(self):
+        self.model.dispose()
+        if self.env is not None:
+            envs.release(self.env)
+
+
+class TemplateRegistry:
+    """
+    Keeps one idle model per formulation signature, least recently used first out.
+    A template is taken out of the registry while a request uses it, so two requests never share a model.
+    An idle template holds on to its env, so when the env pool runs dry the least recently used
+    template is disposed and its env goes back to the pool.
+    """
+
+    def __init__(self, size=MAX_TEMPLATES):
+        self.size = size
+        self.idle = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def acquire(self, signature, namespace):
+        """
+        Take the template for a formulation and refill it with the request data
+        :param signature: formulation signature
+        :param namespace: mapping of data and variable names
+        :return: ModelTemplate ready to optimize, or None if the model has to be built
+        """
+        with self.lock:
+            template = self.idle.pop(signature, None)
+        if template is not None:
+            try:
+                patched = template.patch(namespace)
+            except Exception:
+                patched = False
+            if patched:
+                self.hits += 1
+                return template
+            template.dispose()
+        self.misses += 1
+        return None
+
+    def release(self, template):
+        """
+        Hand a template back once the request is done with it
+        :param template: ModelTemplate
+        :return: None
+        """
+        if not template.reusable:
+            template.dispose()
+            return
+        with self.lock:
+            replaced = self.idle.pop(template.signature, None)
+            self.idle[template.signature] = template
+            evicted = []
+            while len(self.idle) > self.size:
+                evicted.append(self.idle.popitem(last=False)[1])
+        for old in evicted + ([replaced] if replaced is not None else []):
+            old.dispose()
+
+    def evict(self):
+        """
+        Dispose the least recently used idle template, which hands its env back to the pool
+        :return: True if a template was disposed, False if none is idle
+        """
+        with self.lock:
+            if len(self.idle) == 0:
+                return False
+            template = self.idle.popitem(last=False)[1]
+        self.evicted += 1
+        template.dispose()
+        return True
+
+    def info(self):
+        """
+        :return: dictionary with hits, misses, evictions for the env pool and the number of idle templates
+        """
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted, "size": len(self.idle),
+                "maxsize": self.size}
+
+
+templates = TemplateRegistry()
+# fresh builds take the envs of idle templates before new ones are started
+envs.reclaim = templates.evict
@@ -0,0 +1,6 @@
+import os
+import sys
+
+# the app modules import each other by name from src/frontend
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("MPLBACKEND", "Agg")
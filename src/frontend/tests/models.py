@@ -0,0 +1,60 @@
+import importlib.util
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+import script
+
+# the demo formulations and their files, shared by the tests
+DEMO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "demo")
+COVERAGE = {
+    "variables": ["build^{Tower}", "iscovered^{Region}"],
+    "objective": {"formula": "/sum_r^{Region} (iscovered_r * Population_r)", "sense": "maximize"},
+    "constraints": ["/sum_t^{Tower} (build_t * Cost_t) <= 20",
+                    "/sum_t^{Tower} (build_t if r in Coverage_t) >= iscovered_{r} /forall_r^{Region}"],
+}
+POWERPLANT = {
+    "objective": {"formula": "/sum_i^{Plant} /sum_h^{H} (f_i * z_{i,h} + o_i * u_{i,h} + s_i * v_{i,h} + t_i * w_{i,h})",
+                  "sense": "minimize"},
+    "constraints": ["/sum_i^{Plant} z_{i,h} = d_h /forall_h^{H}",
+                    "z_{i,h} <= Capacity_i * u_{i,h} /forall_i^{Plant} /forall_h^{H}",
+                    "z_{i,h} >= m_i * Capacity_i * u_{i,h} /forall_i^{Plant} /forall_h^{H}",
+                    "z_{i,h} >= m_i * Capacity_i /forall_i^{P_N} /forall_h^{H}",
+                    "z_{i,h} - z_{i,h-1} >= -r_i * Capacity_i /forall_i^{Plant} /forall_h^{H} if h > 1",
+                    "z_{i,h} - z_{i,h-1} <= r_i * Capacity_i /forall_i^{Plant} /forall_h^{H} if h > 1",
+                    "v_{i,h} <= u_{i,h} /forall_i^{Plant} /forall_h^{H}",
+                    "w_{i,h} <= 1 - u_{i,h} /forall_i^{Plant} /forall_h^{H}",
+                    "v_{i,h} - w_{i,h} = u_{i,h} - u_{i,h-1} /forall_i^{Plant} /forall_h^{H} if h > 1"],
+    "variables": ["z^{Plant,H}", "u^{Plant,H}", "v^{Plant,H}", "w^{Plant,H}"],
+}
+COVERAGE_FILES = ["coverage.csv", "population.csv"]
+POWERPLANT_FILES = ["fixed_costs_revised.csv", "demand.csv", "fuel_costs.csv", "startup_costs.csv",
+                    "plant_capacities.csv", "operating_costs.csv"]
+
+
+def demo_files(names):
+    """
+    :param names: names of files in demo/
+    :return: list of uploads like the ones of a request
+    """
+    files = []
+    for name in names:
+        with open(os.path.join(DEMO, name), "rb") as f:
+            files.append(FileStorage(io.BytesIO(f.read()), filename=name))
+    return files
+
+
+def load(data, names, hardcode):
+    return script.load_symbols(data, demo_files(names), hardcode)
+
+
+def old_utils():
+    """
+    :return: the module with the string formula parser and the cell by cell typeparse the app used to have,
+             still shipped with the demo scripts
+    """
+    spec = importlib.util.spec_from_file_location("demo_utils", os.path.join(DEMO, "utils.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
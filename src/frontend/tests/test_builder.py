@@ -0,0 +1,103 @@
+import gurobipy as gp
+import numpy as np
+import pytest
+from gurobipy import GRB
+
+from builder import Linearizer, add_constraint, set_objective, variable_columns
+from compiler import compile_formula
+from models import COVERAGE, COVERAGE_FILES, POWERPLANT, POWERPLANT_FILES, load
+
+
+def build(data, names, hardcode, env, matrix):
+    """
+    :return: gurobi model of a demo formulation, built with sparse matrices or row by row
+    """
+    symbols = load(data, names, hardcode)
+    m = gp.Model(env=env)
+    variables = []
+    for k, variable in enumerate(data["variables"]):
+        name, domains = variable.split("^")
+        domains = [d.strip() for d in domains.strip("{}").split(",")]
+        vtype = GRB.CONTINUOUS if hardcode == "PowerPlant" and k == 0 else GRB.BINARY
+        symbols[name] = m.addVars(*[symbols[d] for d in domains], vtype=vtype)
+        variables.append(name)
+    linearizer = Linearizer(symbols, variable_columns(m, symbols, variables)) if matrix else None
+    families = [add_constraint(m, compile_formula(c), symbols, linearizer) for c in data["constraints"]]
+    sense = GRB.MAXIMIZE if data["objective"]["sense"] == "maximize" else GRB.MINIMIZE
+    set_objective(m, compile_formula(data["objective"]["formula"]), sense, symbols, linearizer)
+    m.update()
+    return m, families
+
+
+@pytest.mark.parametrize("data, names, hardcode", [
+    (COVERAGE, COVERAGE_FILES, "Coverage"),
+    (POWERPLANT, POWERPLANT_FILES, "PowerPlant"),
+])
+def test_matrix_families_match_row_by_row(data, names, hardcode):
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        m, families = build(data, names, hardcode, env, matrix=True)
+        rows, added = build(data, names, hardcode, env, matrix=False)
+        # every family went in as one matrix
+        assert all(isinstance(f, gp.MConstr) for f in families if f is not None)
+        assert all(isinstance(f, list) for f in added)
+        assert (m.getA() != rows.getA()).nnz == 0
+        assert np.allclose(m.getAttr("RHS", m.getConstrs()), rows.getAttr("RHS", rows.getConstrs()))
+        assert m.getAttr("Sense", m.getConstrs()) == rows.getAttr("Sense", rows.getConstrs())
+        assert np.allclose(m.getAttr("Obj", m.getVars()), rows.getAttr("Obj", rows.getVars()))
+        m.dispose()
+        rows.dispose()
+
+
+def test_nonlinear_family_falls_back_to_rows():
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+        symbols = load(COVERAGE, COVERAGE_FILES, "Coverage")
+        symbols["build"] = m.addVars(symbols["Tower"], vtype=GRB.BINARY)
+        linearizer = Linearizer(symbols, variable_columns(m, symbols, ["build"]))
+        added = add_constraint(m, compile_formula("build_t * build_t <= 1 /forall_t^{Tower}"), symbols, linearizer)
+        m.update()
+        assert isinstance(added, list) and len(added) == len(symbols["Tower"]) == m.NumQConstrs
+
+
+def coverage_family(constraint, env, matrix):
+    """
+    :return: gurobi model of the coverage variables with one constraint family
+    """
+    symbols = load(COVERAGE, COVERAGE_FILES, "Coverage")
+    m = gp.Model(env=env)
+    symbols["build"] = m.addVars(symbols["Tower"], vtype=GRB.BINARY)
+    symbols["iscovered"] = m.addVars(symbols["Region"], vtype=GRB.BINARY)
+    linearizer = Linearizer(symbols, variable_columns(m, symbols, ["build", "iscovered"])) if matrix else None
+    add_constraint(m, compile_formula(constraint), symbols, linearizer)
+    m.update()
+    return m, linearizer, symbols
+
+
+def test_inverted_index_of_a_set_column():
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        m, linearizer, symbols = coverage_family("/sum_t^{Tower} (build_t if r in Coverage_t) >= iscovered_{r} "
+                                                 "/forall_r^{Region}", env, matrix=True)
+        index = linearizer.inverted[("Coverage", "Tower")]
+        expected = {}
+        for t in symbols["Tower"]:
+            for r in symbols["Coverage"][t]:
+                expected.setdefault(r, []).append(t)
+        assert {r: list(towers) for r, towers in index.items()} == expected
+        m.dispose()
+
+
+@pytest.mark.parametrize("constraint", [
+    "/sum_t^{Tower} (build_t if r in Coverage_t) >= iscovered_{r} /forall_r^{Region}",
+    # the rest of the condition is applied to the iterations the index found
+    "/sum_t^{Tower} (build_t if r in Coverage_t and Cost_t < 4) >= iscovered_{r} /forall_r^{Region}",
+    # a negated membership is not served from the index
+    "/sum_t^{Tower} (build_t if r not in Coverage_t) >= iscovered_{r} /forall_r^{Region}",
+])
+def test_membership_sums_match_row_by_row(constraint):
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        m, _, _ = coverage_family(constraint, env, matrix=True)
+        rows, _, _ = coverage_family(constraint, env, matrix=False)
+        assert m.NumConstrs == rows.NumConstrs
+        assert (m.getA() != rows.getA()).nnz == 0
+        assert np.allclose(m.getAttr("RHS", m.getConstrs()), rows.getAttr("RHS", rows.getConstrs()))
+        m.dispose()
+        rows.dispose()
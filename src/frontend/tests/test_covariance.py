@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import covariance
+import script
+from covariance import CovarianceCache, condition, constant_correlation, estimator_option, ewma, ledoit_wolf, sample
+from models import demo_files
+from prices import FileProvider, PriceStore
+from results import ResultCache
+from returnstats import ReturnStats
+from riskbench import simulate_returns
+
+
+def test_sample_is_np_cov():
+    returns = simulate_returns(50, 8, 2)
+    assert np.allclose(sample(returns), np.cov(returns, rowvar=False))
+
+
+def test_ledoit_wolf_matches_the_outer_product_sums():
+    returns = simulate_returns(40, 6, 2, seed=3)
+    T, n = returns.shape
+    X = returns - returns.mean(axis=0)
+    S = X.T @ X / T
+    prior = np.trace(S) / n * np.eye(n)
+    d2 = ((S - prior) ** 2).sum()
+    b2 = min(sum(((np.outer(x, x) - S) ** 2).sum() for x in X) / T ** 2, d2)
+    assert np.allclose(ledoit_wolf(returns), b2 / d2 * prior + (1 - b2 / d2) * S)
+
+
+def test_constant_correlation_shrinks_towards_the_average_correlation():
+    returns = simulate_returns(60, 5, 2, seed=4)
+    X = returns - returns.mean(axis=0)
+    S = X.T @ X / len(X)
+    shrunk = constant_correlation(returns)
+    root = np.sqrt(np.diag(S))
+    correlations = S / np.outer(root, root)
+    prior = correlations[~np.eye(5, dtype=bool)].mean() * np.outer(root, root)
+    np.fill_diagonal(prior, np.diag(S))
+    # shrunk = δ prior + (1 - δ) S for a single δ between 0 and 1
+    off = ~np.eye(5, dtype=bool)
+    delta = ((shrunk - S)[off] / (prior - S)[off])
+    assert np.allclose(delta, delta[0]) and 0 <= delta[0] <= 1
+    assert np.allclose(np.diag(shrunk), np.diag(S))
+
+
+def test_ewma_is_np_cov_with_weights():
+    returns = simulate_returns(80, 4, 2)
+    weights = 0.5 ** (np.arange(80)[::-1] / 10)
+    assert np.allclose(ewma(returns, halflife=10), np.cov(returns, rowvar=False, aweights=weights))
+
+
+def test_more_assets_than_days_is_well_conditioned():
+    returns = simulate_returns(20, 60, 3)
+    assert np.linalg.eigvalsh(sample(returns))[0] < 1e-12
+    for estimator in (ledoit_wolf, constant_correlation):
+        sigma, values, vectors = condition(estimator(returns))
+        assert values[-1] / values[0] <= 1e6 * (1 + 1e-9)
+        assert np.array_equal(sigma, sigma.T)
+        assert np.allclose((vectors * values) @ vectors.T, sigma)
+
+
+def test_estimator_option():
+    assert estimator_option(None) == "sample"
+    assert estimator_option({"estimator": "ewma"}) == "ewma"
+    with pytest.raises(Exception, match="Unknown covariance estimator"):
+        estimator_option({"estimator": "shrunk"})
+
+
+def test_decompositions_are_reused_until_the_window_moves(monkeypatch):
+    engine = ReturnStats(window=30, min_periods=5)
+    monkeypatch.setattr(covariance, "return_stats", engine)
+    tickers = ["A", "B", "C", "D"]
+    rng = np.random.default_rng(0)
+    closes = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0, 0.02, (41, 4)), axis=0)),
+                          index=pd.bdate_range("2024-01-01", periods=41), columns=tickers)
+    engine.update(tickers, closes.iloc[:40])
+    cache = CovarianceCache()
+    first = cache.sigma(tickers, "ledoit_wolf")
+    B, F, D = cache.factors(tickers, "ledoit_wolf", 2)
+    assert cache.factors(tickers, "ledoit_wolf", 2)[0] is B
+    assert cache.info()["hits"] == 2 and cache.info()["misses"] == 1
+    # the leading eigenpairs of the estimate, with the diagonal kept
+    assert np.allclose(np.diag(B @ F @ B.T) + D, np.diag(first))
+    # a sample factor model comes from the returns
+    assert cache.factors(tickers, "sample", 2)[0].shape == (4, 2)
+    engine.update(tickers, closes)
+    moved = cache.sigma(tickers, "ledoit_wolf")
+    assert cache.info()["misses"] == 3
+    assert np.allclose(moved, condition(ledoit_wolf(engine.window_returns(tickers)))[0])
+    assert not np.allclose(moved, first)
+
+
+@pytest.mark.parametrize("estimator", ["ledoit_wolf", "constant_correlation", "ewma"])
+def test_portfolio_with_an_estimator(monkeypatch, tmp_path, estimator):
+    monkeypatch.setattr(script, "prices", PriceStore(FileProvider(str(tmp_path)), directory=None))
+    monkeypatch.setattr(script, "results", ResultCache(directory=None))
+    result, _ = script.portfolio_model(demo_files(["stock_options.csv"]), {"plots": False, "estimator": estimator})
+    weights = [float(line.split(": ")[1][:-1]) for line in result.split("\n") if ": " in line]
+    assert "Optimal Portfolio" in result and sum(weights) == pytest.approx(100, abs=0.5)
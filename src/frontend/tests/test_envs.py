@@ -0,0 +1,58 @@
+import pytest
+
+import script
+from envs import EnvPool
+from models import COVERAGE, COVERAGE_FILES, load
+
+
+def test_released_env_is_reused_with_default_params():
+    pool = EnvPool(size=2)
+    env = pool.borrow()
+    env.setParam("TimeLimit", 5)
+    pool.release(env)
+    again = pool.borrow()
+    assert again is env and again.getParam("TimeLimit") > 5
+    assert pool.info()["created"] == 1 and pool.info()["reused"] == 1
+    pool.release(again)
+
+
+def test_pool_keeps_at_most_size_idle_envs():
+    pool = EnvPool(size=1)
+    first, second = pool.borrow(), pool.borrow()
+    pool.release(first)
+    pool.release(second)
+    assert pool.info()["idle"] == 1 and pool.info()["borrowed"] == 0
+
+
+def test_borrowed_block_hands_the_env_back_on_errors():
+    pool = EnvPool(size=1)
+    with pytest.raises(ValueError):
+        with pool.borrowed():
+            raise ValueError
+    assert pool.info()["borrowed"] == 0 and pool.info()["idle"] == 1
+
+
+def test_full_pool_reclaims_before_starting_an_env():
+    pool = EnvPool(size=1)
+    held = [pool.borrow()]
+
+    def reclaim():
+        # what an idle template does when it is evicted
+        if not held:
+            return False
+        pool.release(held.pop())
+        return True
+
+    pool.reclaim = reclaim
+    env = pool.borrow()
+    assert pool.info()["reclaimed"] == 1 and pool.info()["created"] == 1
+    pool.release(env)
+
+
+def test_failed_build_hands_the_env_back():
+    data = dict(COVERAGE, constraints=["/sum_t^{Tower} (build_t * Missing_t) <= 20"])
+    borrowed = script.envs.borrowed_count
+    for _ in range(3):
+        with pytest.raises(Exception, match="Please check the constraint"):
+            script.build_model(data, load(data, COVERAGE_FILES, "Coverage"), "Coverage")
+    assert script.envs.borrowed_count == borrowed
@@ -0,0 +1,68 @@
+import gurobipy as gp
+import pytest
+from gurobipy import GRB
+
+import script
+from formula import BinOp, Compare, Constraint, Forall, Indexed, Lag, Member, Number, Sum, Symbol, parse_formula, \
+    tokenize
+from models import COVERAGE, COVERAGE_FILES, POWERPLANT, POWERPLANT_FILES, load, old_utils
+
+
+def test_tokenize():
+    tokens = tokenize("/sum_t^{Tower} (build_t if r in Coverage_t) >= 2.5")
+    assert [t.kind for t in tokens] == ["command", "op", "name", "op", "op", "name", "op", "op", "name", "op", "name",
+                                        "keyword", "name", "keyword", "name", "op", "name", "op", "op", "number", "end"]
+    assert tokens[0].text == "/sum" and tokens[-2].text == "2.5"
+
+
+def test_parse_membership_sum():
+    tree = parse_formula(COVERAGE["constraints"][1])
+    assert tree == Constraint(Sum("t", "Tower", Indexed("build", (Symbol("t"),)),
+                                  Member(Symbol("r"), Indexed("Coverage", (Symbol("t"),)), False)),
+                              ">=", Indexed("iscovered", (Symbol("r"),)), (Forall("r", "Region"),), None)
+
+
+def test_parse_lag_and_condition():
+    tree = parse_formula(POWERPLANT["constraints"][4])
+    assert tree.lhs == BinOp("-", Indexed("z", (Symbol("i"), Symbol("h"))), Indexed("z", (Symbol("i"), Lag("h", -1))))
+    assert tree.foralls == (Forall("i", "Plant"), Forall("h", "H"))
+    assert tree.condition == Compare(">", Symbol("h"), Number(1))
+
+
+def test_parse_error_points_at_the_token():
+    with pytest.raises(Exception, match="position 11"):
+        parse_formula("build_t <= * 2")
+
+
+@pytest.mark.parametrize("data, names, hardcode", [
+    (COVERAGE, COVERAGE_FILES, "Coverage"),
+    (POWERPLANT, POWERPLANT_FILES, "PowerPlant"),
+])
+def test_same_model_as_the_old_parser(data, names, hardcode):
+    symbols = load(data, names, hardcode)
+    template, _, _ = script.build_model(data, symbols, hardcode)
+    try:
+        template.model.optimize()
+        built = (template.model.NumConstrs, template.model.NumNZs, template.model.ObjVal)
+    finally:
+        script.templates.release(template)
+
+    # the old parser wrote python that was run with the data as globals and the model as a local
+    parse = old_utils().parse
+    symbols = load(data, names, hardcode)
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+        namespace = {name: symbols[name] for name in symbols}
+        namespace["gp"] = gp
+        for k, variable in enumerate(data["variables"]):
+            name, domains = variable.split("^")
+            domains = [d.strip() for d in domains.strip("{}").split(",")]
+            # the first power plant variable is the continuous output, the others are binary
+            vtype = GRB.CONTINUOUS if hardcode == "PowerPlant" and k == 0 else GRB.BINARY
+            namespace[name] = m.addVars(*[symbols[d] for d in domains], vtype=vtype)
+        for constraint in data["constraints"]:
+            code = parse(constraint)
+            exec(("m.addConstr(" if code.count("for") == 1 else "m.addConstrs(") + code + ")", namespace, {"m": m})
+        sense = GRB.MAXIMIZE if data["objective"]["sense"] == "maximize" else GRB.MINIMIZE
+        m.setObjective(eval(parse(data["objective"]["formula"]), namespace), sense)
+        m.optimize()
+        assert built == (m.NumConstrs, m.NumNZs, pytest.approx(m.ObjVal))
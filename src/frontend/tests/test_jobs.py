@@ -0,0 +1,67 @@
+import io
+import json
+import os
+import time
+
+import pytest
+
+import script
+from jobs import JobQueue
+from models import DEMO, POWERPLANT, POWERPLANT_FILES
+
+
+@pytest.fixture
+def queue(monkeypatch, tmp_path):
+    # the worker is spawned with this environment, its prices come from the seeded walks of the file provider
+    monkeypatch.setenv("PRICE_PROVIDER", "file")
+    monkeypatch.setenv("PRICE_FILE_DIR", str(tmp_path))
+    monkeypatch.delenv("PRICE_STORE_DIR", raising=False)
+    queue = JobQueue(workers=1)
+    monkeypatch.setattr(script, "jobs", queue)
+    yield queue
+    if queue.pool is not None:
+        queue.pool.shutdown(cancel_futures=True)
+        queue.manager.shutdown()
+
+
+def finish(client, job_id, timeout=120):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        status = client.get(f"/api/jobs/{job_id}").get_json()
+        if status["status"] in ("done", "failed"):
+            return status
+        time.sleep(0.2)
+    raise AssertionError(f"job {job_id} did not finish")
+
+
+def test_portfolio_job_runs_to_completion(queue):
+    client = script.app.test_client()
+    with open(os.path.join(DEMO, "stock_options.csv"), "rb") as f:
+        content = f.read()
+    form = {"problem": json.dumps("portfolio_optimization"), "plots": json.dumps(False),
+            "file": (io.BytesIO(content), "stock_options.csv")}
+    submitted = client.post("/api/jobs", data=form, content_type="multipart/form-data")
+    assert submitted.status_code == 202
+    status = finish(client, submitted.get_json()["job"])
+    assert status["status"] == "done", status.get("error")
+    assert "error" not in status["response"]
+    assert "Optimal Portfolio" in status["response"]["result"]
+
+
+def test_job_streams_its_incumbents(queue):
+    client = script.app.test_client()
+    form = {key: json.dumps(value) for key, value in POWERPLANT.items()}
+    form.update(problem=json.dumps("mathematical_optimization"), plots=json.dumps(False))
+    form["file"] = [(open(os.path.join(DEMO, name), "rb"), name) for name in POWERPLANT_FILES]
+    submitted = client.post("/api/jobs", data=form, content_type="multipart/form-data")
+    for f, _ in form["file"]:
+        f.close()
+    # the stream ends when the job does
+    stream = client.get(f"/api/jobs/{submitted.get_json()['job']}?stream=1")
+    assert stream.mimetype == "text/event-stream"
+    events = [block.split("\n", 1) for block in stream.get_data(as_text=True).split("\n\n") if block.startswith("event")]
+    kinds = [kind[len("event: "):] for kind, _ in events]
+    assert "incumbent" in kinds
+    last = json.loads(events[-1][1][len("data: "):])
+    assert kinds[-1] == "status" and last["status"] == "done"
+    assert last["response"]["summary"]["status"] == "optimal"
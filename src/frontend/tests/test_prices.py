@@ -0,0 +1,68 @@
+import numpy as np
+
+from prices import FileProvider, PriceStore, day_number
+
+
+class Recording(FileProvider):
+    """
+    File provider that notes whether the store lock was held while it was asked, and can scale its closes
+    """
+
+    def __init__(self, directory):
+        super().__init__(directory)
+        self.store = None
+        self.locked = []
+        self.ranges = []
+        self.scale = 1.0
+        # day number to the factor its close is off by, like a close taken while the market is open
+        self.moved = {}
+
+    def fetch(self, tickers, first, last):
+        self.locked.append(self.store.lock.locked())
+        self.ranges.append((first, last))
+        found = super().fetch(tickers, first, last)
+        for series in found.values():
+            series["close"] *= self.scale
+            for day, factor in self.moved.items():
+                series["close"][series["day"] == day] *= factor
+        return found
+
+
+def make_store(tmp_path, refresh=3600):
+    provider = Recording(str(tmp_path))
+    store = PriceStore(provider=provider, directory=None, refresh=refresh)
+    provider.store = store
+    return provider, store
+
+
+def test_history_fetches_without_the_lock(tmp_path):
+    provider, store = make_store(tmp_path)
+    store.history(["AAA", "BBB"], days=60, end="2020-06-30")
+    store.history(["AAA", "BBB"], days=90, end="2020-06-30")
+    assert provider.locked and not any(provider.locked)
+    assert store.info()["fetches"] == len(provider.locked)
+
+
+def test_adjusted_history_is_replaced(tmp_path):
+    provider, store = make_store(tmp_path)
+    store.history(["AAA"], days=60, end="2020-06-30")
+    provider.scale = 0.5
+    # the later range overlaps the stored last day, whose close changed
+    closes = store.history(["AAA"], days=60, end="2020-07-31")[("Close", "AAA")]
+    expected = provider.synthetic("AAA", day_number("2020-05-01"), day_number("2020-07-31")) * 0.5
+    assert np.allclose(closes.to_numpy(), expected.reindex(closes.index).to_numpy())
+    assert not any(provider.locked)
+
+
+def test_refreshed_last_day_is_overwritten(tmp_path):
+    provider, store = make_store(tmp_path, refresh=-1)
+    last = day_number("2020-06-30")
+    # the last day is stored mid session, a refresh brings its settled close
+    provider.moved = {last: 1.02}
+    store.history(["AAA"], days=60, end="2020-06-30")
+    provider.moved = {}
+    closes = store.history(["AAA"], days=60, end="2020-06-30")[("Close", "AAA")]
+    # only the last two stored days were asked for again, the history was not fetched in full
+    assert provider.ranges[1:] == [(day_number("2020-06-29"), last)]
+    expected = provider.synthetic("AAA", last - 60, last)
+    assert np.allclose(closes.to_numpy(), expected.reindex(closes.index).to_numpy())
@@ -0,0 +1,63 @@
+import threading
+
+import gurobipy as gp
+import pytest
+
+import script
+from models import POWERPLANT, POWERPLANT_FILES, demo_files
+from progress import Progress, chain, set_budget
+
+
+def test_budget_is_set_and_put_back():
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+        assert set_budget(m, {"time_limit": "2.5", "mip_gap": 0.05}) == {"TimeLimit": 2.5, "MIPGap": 0.05}
+        assert (m.Params.TimeLimit, m.Params.MIPGap) == (2.5, 0.05)
+        # a reused model without a budget gets the defaults back
+        assert set_budget(m, {}) == {}
+        assert m.Params.TimeLimit >= gp.GRB.INFINITY and m.Params.MIPGap == 1e-4
+
+
+@pytest.mark.parametrize("budget", [{"time_limit": "soon"}, {"mip_gap": -1}])
+def test_bad_budget(budget):
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+        with pytest.raises(Exception, match="Please check the"):
+            set_budget(m, budget)
+
+
+def test_incumbents_are_published():
+    events = []
+    summary = {}
+    # a gap of its own keeps the solve out of the result cache of the other tests
+    data = dict(POWERPLANT, plots=False, mip_gap=1e-6)
+    script.general_model(data, demo_files(POWERPLANT_FILES), "PowerPlant", progress=Progress(events.append),
+                         summary=summary)
+    incumbents = [e for e in events if e["type"] == "incumbent"]
+    assert len(incumbents) > 0
+    objectives = [e["objective"] for e in incumbents]
+    assert objectives == sorted(objectives, reverse=True)
+    assert objectives[-1] == pytest.approx(summary["objective"])
+
+
+def test_stop_flag_ends_the_solve_with_the_incumbent():
+    stop = threading.Event()
+
+    def publish(event):
+        # the client accepts the first plan found
+        if event["type"] == "incumbent":
+            stop.set()
+
+    summary = {}
+    data = dict(POWERPLANT, plots=False, mip_gap=2e-6)
+    result, _ = script.general_model(data, demo_files(POWERPLANT_FILES), "PowerPlant",
+                                     progress=Progress(publish, stop, interval=0), summary=summary)
+    assert summary["status"] == "stopped"
+    assert summary["objective"] is not None
+    assert "Solve ended early (stopped)" in result
+
+
+def test_chain():
+    calls = []
+    assert chain(None, None) is None
+    callback = chain(lambda m, w: calls.append(("a", w)), None, lambda m, w: calls.append(("b", w)))
+    callback(None, 1)
+    assert calls == [("a", 1), ("b", 1)]
@@ -0,0 +1,68 @@
+import io
+import os
+
+from werkzeug.datastructures import FileStorage
+
+import script
+
+DEMO = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "demo")
+
+COVERAGE = 'Tower, Cost, Coverage\n{0}, 4.2,"{{0, 1}}"\n{1}, 6.1,"{{1, 2}}"\n{2}, 5.2,"{{0, 2}}"\n'
+POPULATION = "Region, Population\n0, 523\n1, 690\n2, 420\n"
+DATA = {
+    "variables": ["build^{Tower}", "iscovered^{Region}"],
+    "objective": {"formula": "/sum_r^{Region} (iscovered_r * Population_r)", "sense": "maximize"},
+    "constraints": ["/sum_t^{Tower} (build_t * Cost_t) <= 10",
+                    "/sum_t^{Tower} (build_t if r in Coverage_t) >= iscovered_{r} /forall_r^{Region}"],
+    "plots": False,
+}
+
+
+def upload(name, text):
+    return FileStorage(io.BytesIO(text.encode()), filename=name)
+
+
+def solve(towers):
+    files = [upload("coverage.csv", COVERAGE.format(*towers)), upload("population.csv", POPULATION)]
+    return script.general_model(DATA, files, hardcode="Coverage")
+
+
+def test_same_data_hits_the_result_cache():
+    first = solve((0, 1, 2))
+    hits = script.results.hits
+    assert solve((0, 1, 2)) == first
+    assert script.results.hits == hits + 1
+
+
+def test_relabeled_data_misses_the_result_cache():
+    solve((0, 1, 2))
+    misses = script.results.misses
+    # same structure and numbers, only the tower labels differ
+    result, _ = solve((100, 101, 102))
+    assert script.results.misses == misses + 1
+    assert "100: " in result and "\n0: " not in result.split("iscovered")[0]
+
+
+def test_snapshot_files_keep_the_variable_names(tmp_path):
+    # the demo plants have names like Jack McDonough, the space is not allowed in an mps file
+    data = {"variables": ["z^{Plant,H}", "u^{Plant,H}"],
+            "objective": {"formula": "/sum_i^{Plant} /sum_h^{H} (f_i * z_{i,h} + o_i * u_{i,h})", "sense": "minimize"},
+            "constraints": ["/sum_i^{Plant} z_{i,h} = d_h /forall_h^{H}",
+                            "z_{i,h} <= Capacity_i * u_{i,h} /forall_i^{Plant} /forall_h^{H}"]}
+    names = ["fixed_costs_revised.csv", "demand.csv", "fuel_costs.csv", "startup_costs.csv",
+             "plant_capacities.csv", "operating_costs.csv"]
+    files = [FileStorage(open(os.path.join(DEMO, name), "rb"), filename=name) for name in names]
+    try:
+        symbols = script.load_symbols(data, files, "PowerPlant")
+    finally:
+        for f in files:
+            f.close()
+    template, _, _ = script.build_model(data, symbols, "PowerPlant")
+    try:
+        path = str(tmp_path / "model.mps")
+        template.model.write(path)
+        written = open(path).read()
+    finally:
+        script.templates.release(template)
+    assert "z[Jack_McDonough,1]" in written
+    assert "u[Jack_McDonough,24]" in written
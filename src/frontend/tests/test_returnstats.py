@@ -0,0 +1,73 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from returnstats import ReturnStats, RollingStats, returns
+
+
+def closes(days, n=4, seed=0):
+    rng = np.random.default_rng(seed)
+    walk = 100 * np.exp(np.cumsum(rng.normal(0, 0.02, (days, n)), axis=0))
+    return pd.DataFrame(walk, index=pd.bdate_range("2024-01-01", periods=days), columns=[f"T{i}" for i in range(n)])
+
+
+def expected(values, window):
+    # what the portfolio model used to compute over the whole history
+    r = returns(values)[-window:]
+    return r.mean(axis=0), np.cov(r, rowvar=False), r.std(axis=0)
+
+
+def test_rolling_sums_match_a_full_recomputation():
+    rng = np.random.default_rng(1)
+    rows = rng.random((37, 5))
+    stats = RollingStats(5, window=10, min_periods=2)
+    stats.extend(rows[:3])
+    for r in rows[3:]:
+        stats.append(r)
+    # past the window the oldest days drop out, and the sums have been rebased on the way
+    kept = rows[-10:]
+    assert np.array_equal(stats.returns(), kept)
+    assert np.allclose(stats.mean(), kept.mean(axis=0))
+    assert np.allclose(stats.cov(), np.cov(kept, rowvar=False))
+    assert np.allclose(stats.std(), kept.std(axis=0))
+
+
+def test_new_days_are_appended():
+    history = closes(60)
+    engine = ReturnStats(window=30, min_periods=5)
+    engine.update(list(history.columns), history.iloc[:50])
+    delta, sigma, std = engine.update(list(history.columns), history)
+    assert engine.info()["appended"] == 10 and engine.info()["rebuilt"] == 1
+    for got, want in zip((delta, sigma, std), expected(history.to_numpy(), 30)):
+        assert np.allclose(got, want)
+    # the same closes again add nothing
+    stamp = engine.stamp(list(history.columns))
+    engine.update(list(history.columns), history)
+    assert engine.stamp(list(history.columns)) == stamp
+
+
+def test_adjusted_history_starts_over():
+    history = closes(40)
+    tickers = list(history.columns)
+    engine = ReturnStats(window=30, min_periods=5)
+    engine.update(tickers, history)
+    # a split adjusts every close before it
+    adjusted = history.copy()
+    adjusted.iloc[:, 0] /= 2
+    delta, _, _ = engine.update(tickers, adjusted)
+    assert engine.info()["rebuilt"] == 2
+    assert np.allclose(delta, expected(adjusted.to_numpy(), 30)[0])
+
+
+def test_days_with_a_missing_close_are_skipped():
+    history = closes(30)
+    gappy = history.copy()
+    gappy.iloc[10, 2] = np.nan
+    delta, _, _ = ReturnStats(window=100, min_periods=5).update(list(history.columns), gappy)
+    assert np.allclose(delta, expected(history.drop(history.index[10]).to_numpy(), 100)[0])
+
+
+def test_short_history_is_an_error():
+    history = closes(10)
+    with pytest.raises(Exception, match="Not enough price history"):
+        ReturnStats(window=30, min_periods=20).update(list(history.columns), history)
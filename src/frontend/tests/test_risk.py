@@ -0,0 +1,84 @@
+import os
+
+import gurobipy as gp
+import numpy as np
+import pandas as pd
+import pytest
+from gurobipy import GRB
+
+import script
+from models import DEMO, demo_files
+from prices import FileProvider, PriceStore
+from results import ResultCache
+from risk import dense_risk, factor_model, factor_risk, risk_options
+from riskbench import bench, simulate_returns
+
+
+def test_risk_options():
+    assert risk_options({}) == ("dense", 10)
+    assert risk_options({"risk_model": "factor", "factors": "4"}) == ("factor", 4)
+    for data_dict in ({"risk_model": "sparse"}, {"factors": "many"}, {"factors": -2}):
+        with pytest.raises(Exception, match="Error"):
+            risk_options(data_dict)
+
+
+def test_factor_model_keeps_the_variances():
+    returns = simulate_returns(120, 30, 3)
+    sigma = np.cov(returns, rowvar=False)
+    B, F, D = factor_model(returns, 3)
+    assert B.shape == (30, 3) and F.shape == (3, 3) and D.shape == (30,)
+    approx = B @ F @ B.T + np.diag(D)
+    assert np.allclose(np.diag(approx), np.diag(sigma))
+    # the factors explain the covariances the diagonal alone misses
+    assert np.linalg.norm(approx - sigma) < 0.5 * np.linalg.norm(np.diag(np.diag(sigma)) - sigma)
+    # as many factors as assets is the sample covariance itself
+    B, F, D = factor_model(returns, 30)
+    assert np.allclose(B @ F @ B.T + np.diag(D), sigma)
+
+
+def minimum_risk(risk):
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+        x = m.addMVar(30)
+        m.setObjective(risk(m, x), GRB.MINIMIZE)
+        m.addConstr(x.sum() == 1)
+        m.optimize()
+        return m.ObjVal, x.X, m.NumQNZs
+
+
+def test_factor_formulation_solves_the_same_portfolio():
+    returns = simulate_returns(120, 30, 3)
+    B, F, D = factor_model(returns, 3)
+    approx = B @ F @ B.T + np.diag(D)
+    dense, dense_x, dense_q = minimum_risk(lambda m, x: dense_risk(x, approx))
+    factor, factor_x, factor_q = minimum_risk(lambda m, x: factor_risk(m, x, B, F, D))
+    # both are solved by barrier to its default tolerance
+    assert factor == pytest.approx(dense, rel=1e-3)
+    assert np.allclose(factor_x, dense_x, atol=1e-3)
+    assert factor_q < dense_q
+
+
+def test_bench_rows():
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        rows = bench(env, assets=40, factors=3, days=100, repeat=1)
+    assert [row["formulation"] for row in rows] == ["dense", "factor"]
+    assert all(row["error"] is None and row["solve"] >= 0 for row in rows)
+    dense, factor = rows
+    assert factor["qnzs"] < dense["qnzs"]
+    # the factor solution is nearly as safe under the full covariance
+    assert factor["risk"] >= dense["risk"] * (1 - 1e-6) and factor["risk"] < 1.5 * dense["risk"]
+
+
+def test_portfolio_with_every_factor_matches_the_dense_one(monkeypatch, tmp_path):
+    # seeded walks instead of downloads, and solves that are never answered from the cache
+    monkeypatch.setattr(script, "prices", PriceStore(FileProvider(str(tmp_path)), directory=None))
+    monkeypatch.setattr(script, "results", ResultCache(directory=None))
+    # the first ticker of the file is skipped like the header
+    n = len(pd.read_csv(os.path.join(DEMO, "stock_options.csv"))) - 1
+    dense, _ = script.portfolio_model(demo_files(["stock_options.csv"]), {"plots": False})
+    factor, _ = script.portfolio_model(demo_files(["stock_options.csv"]),
+                                       {"plots": False, "risk_model": "factor", "factors": n})
+    assert "Optimal Portfolio" in dense
+    # the weights are printed to two decimals of a percent
+    weights = [[float(line.split(": ")[1][:-1]) for line in text.split("\n") if ": " in line] for text in (dense, factor)]
+    assert len(weights[0]) == len(weights[1])
+    assert np.allclose(weights[0], weights[1], atol=0.05)
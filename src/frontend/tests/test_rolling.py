@@ -0,0 +1,33 @@
+from rolling import windows
+
+
+def committed(length, block, overlap):
+    hours = []
+    for start, stop, first, last in windows(length, block, overlap):
+        assert stop - start <= (first - 1) + block + overlap
+        hours.append(list(range(start + first - 1, start + last)))
+    return hours
+
+
+def test_windows_commit_block_hours():
+    hours = committed(100, 24, 12)
+    # every window but the last commits block hours, the first one too
+    assert [len(h) for h in hours] == [24, 24, 24, 24, 4]
+    # every hour of the series is committed once, in order
+    assert sum(hours, []) == list(range(100))
+
+
+def test_windows_carry_the_last_committed_hour():
+    previous = None
+    for start, stop, first, last in windows(50, 12, 6):
+        if previous is None:
+            assert (start, first) == (0, 1)
+        else:
+            # window hour 1 is the last hour the window before committed
+            assert start == previous[0] + previous[3] - 1 and first == 2
+        previous = (start, stop, first, last)
+    assert previous[0] + previous[3] == 50
+
+
+def test_windows_short_series():
+    assert committed(5, 24, 12) == [[0, 1, 2, 3, 4]]
@@ -0,0 +1,68 @@
+import threading
+
+import numpy as np
+import pytest
+
+import visualizations
+from sectors import UNKNOWN_SECTOR, SectorService
+
+
+class Provider:
+    """
+    Sectors by ticker, counting the lookups, a missing ticker fails like an unknown symbol would
+    """
+
+    def __init__(self, known):
+        self.known = known
+        self.calls = []
+        self.lock = threading.Lock()
+
+    def sector(self, ticker):
+        with self.lock:
+            self.calls.append(ticker)
+        return self.known[ticker]
+
+
+def test_sectors_are_looked_up_once(tmp_path):
+    provider = Provider({"AAPL": "Technology", "XOM": "Energy", "MSFT": "Technology"})
+    service = SectorService(provider, directory=str(tmp_path), workers=2)
+    assert service.lookup(["AAPL", "XOM", "AAPL", "NOPE"]) == \
+        {"AAPL": "Technology", "XOM": "Energy", "NOPE": UNKNOWN_SECTOR}
+    assert sorted(provider.calls) == ["AAPL", "NOPE", "XOM"]
+    service.lookup(["AAPL", "XOM", "NOPE", "MSFT"])
+    # a failed lookup is not asked for again before its own ttl
+    assert sorted(provider.calls) == ["AAPL", "MSFT", "NOPE", "XOM"]
+    assert service.info() == {"hits": 3, "misses": 4, "size": 4}
+
+    # a new process reads them back from the file
+    restarted = SectorService(Provider({}), directory=str(tmp_path))
+    assert restarted.lookup(["XOM", "MSFT"]) == {"XOM": "Energy", "MSFT": "Technology"}
+    assert restarted.provider.calls == []
+
+
+def test_expired_sectors_are_refreshed():
+    provider = Provider({"XOM": "Energy"})
+    service = SectorService(provider, directory=None, ttl=0)
+    service.lookup(["XOM"])
+    service.entries["XOM"]["time"] -= 1
+    service.lookup(["XOM"])
+    assert provider.calls == ["XOM", "XOM"]
+
+
+def test_weights_add_up_by_sector():
+    provider = Provider({"AAPL": "Technology", "XOM": "Energy", "MSFT": "Technology"})
+    weights = SectorService(provider, directory=None).weights(["AAPL", "XOM", "MSFT"], np.array([0.2, 0.5, 0.3]))
+    assert list(weights.index) == ["Technology", "Energy"]
+    assert weights.to_list() == pytest.approx([0.5, 0.5])
+
+
+def test_pie_shows_the_sector_weights(monkeypatch):
+    class Sizes:
+        X = np.array([0.2, 0.5, 0.3])
+
+    provider = Provider({"AAPL": "Technology", "XOM": "Energy", "MSFT": "Technology"})
+    monkeypatch.setattr(visualizations, "sectors", SectorService(provider, directory=None))
+    fig = visualizations.plot_portfolio_pie(["AAPL", "XOM", "MSFT"], Sizes)
+    labels = [text.get_text() for text in fig.axes[0].texts]
+    assert labels[:2] == ["Technology", "Energy"] and "50.0%" in labels
+    assert sorted(provider.calls) == ["AAPL", "MSFT", "XOM"]
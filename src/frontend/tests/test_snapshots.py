@@ -0,0 +1,63 @@
+import json
+import os
+
+import gurobipy as gp
+import pytest
+
+import script
+from models import POWERPLANT, POWERPLANT_FILES, demo_files
+from replay import parse_params, replay, snapshot_paths
+from results import ResultCache
+from snapshots import Snapshots
+
+
+@pytest.fixture
+def captured(monkeypatch, tmp_path):
+    monkeypatch.setattr(script, "snapshots", Snapshots(directory=str(tmp_path), size=2))
+    # an empty result cache, a cached answer is never captured
+    monkeypatch.setattr(script, "results", ResultCache(directory=None))
+    summary = {}
+    data = dict(POWERPLANT, plots=False, mip_gap=3e-6)
+    script.general_model(data, demo_files(POWERPLANT_FILES), "PowerPlant", summary=summary)
+    return tmp_path, summary
+
+
+def test_snapshot_holds_the_model_and_the_request(captured):
+    directory, summary = captured
+    [path] = snapshot_paths([str(directory)])
+    assert {"model.mps.gz", "params.prm", "meta.json", "summary.json"} <= set(os.listdir(path))
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+    assert meta["kind"] == "PowerPlant" and meta["request"]["mip_gap"] == 3e-6
+    assert [f["name"] for f in meta["files"]] == POWERPLANT_FILES
+    assert meta["model"]["NumVars"] == 960
+    with open(os.path.join(path, "summary.json")) as f:
+        assert json.load(f)["objective"] == pytest.approx(summary["objective"])
+
+
+def test_replay_reproduces_the_solve(captured):
+    directory, summary = captured
+    [path] = snapshot_paths([str(directory)])
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        [recorded, loose] = replay(path, env=env) + replay(path, {"MIPGap": 0.5}, env=env)
+    assert recorded["status"] == "optimal" and recorded["objective"] == pytest.approx(summary["objective"])
+    assert recorded["recorded_objective"] == pytest.approx(summary["objective"])
+    assert loose["params"] == '{"MIPGap": 0.5}'
+
+
+def test_oldest_snapshots_are_trimmed(tmp_path):
+    snapshots = Snapshots(directory=str(tmp_path), size=2)
+    with gp.Env(params={"OutputFlag": 0}) as env, gp.Model(env=env) as m:
+        m.addVar(name="x")
+        paths = [snapshots.write(m, "test", {}, [], None, None) for _ in range(3)]
+    assert sorted(snapshot_paths([str(tmp_path)])) == sorted(paths[1:])
+
+
+def test_parse_params(tmp_path):
+    assert parse_params(None) == [{}]
+    assert parse_params('{"Method": 1}') == [{"Method": 1}]
+    path = tmp_path / "sets.json"
+    path.write_text('[{}, {"MIPFocus": 2}]')
+    assert parse_params(str(path)) == [{}, {"MIPFocus": 2}]
+    with pytest.raises(Exception, match="json"):
+        parse_params("Method=1")
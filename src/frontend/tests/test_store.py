@@ -0,0 +1,62 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from models import DEMO
+from store import parse_table
+
+TABLE = 'Plant, Capacity, Fuel, Serves, Costs\nA, 10, GAS,"{1, 2, 2}","(1:5)"\nB, 20.5, COAL,"{2}","(2:6)"\n' \
+        'C, 30, GAS,"{3, 1}","(1:7)"\n'
+
+
+def table():
+    return parse_table("plants", pd.read_csv(io.StringIO(TABLE)))
+
+
+def test_parameters_read_like_dictionaries():
+    plants = table()
+    capacity = plants["Capacity"]
+    assert list(plants.index) == ["A", "B", "C"]
+    assert dict(capacity) == {"A": 10.0, "B": 20.5, "C": 30.0}
+    assert type(capacity["A"]) is float
+    assert plants["Fuel"]["B"] == "COAL"
+    assert plants["Serves"]["A"] == {1, 2}
+    assert plants["Costs"]["C"] == {1: 7}
+    assert "D" not in capacity
+
+
+def test_columns_share_the_index():
+    plants = table()
+    assert all(parameter.index is plants.index for parameter in plants.columns.values())
+    assert plants.index.take(["C", "A"]).tolist() == [2, 0]
+    assert plants.index.array.tolist() == ["A", "B", "C"]
+
+
+def test_vector_and_take():
+    plants = table()
+    assert plants["Capacity"].vector().tolist() == [10.0, 20.5, 30.0]
+    assert plants["Capacity"].take(["C", "B"]).tolist() == [30.0, 20.5]
+    assert plants["Serves"].take(["B"]).tolist() == [{2}]
+    with pytest.raises(Exception, match="holds collections"):
+        plants["Serves"].vector()
+
+
+def test_inverted_set_column():
+    inverted = table()["Serves"].inverted()
+    # A lists 2 twice and is kept once
+    assert {element: keys.tolist() for element, keys in inverted.items()} == {1: ["A", "C"], 2: ["A", "B"], 3: ["C"]}
+    assert table()["Costs"].inverted() is None
+    assert table()["Capacity"].inverted() is None
+
+
+def test_demo_coverage_matches_dictionaries():
+    frame = pd.read_csv(f"{DEMO}/coverage.csv")
+    coverage = parse_table("coverage", frame)
+    # the dictionaries of python values the columns used to be kept in
+    rows = frame.rename(columns=str.strip).set_index("Tower")
+    assert dict(coverage["Cost"]) == rows["Cost"].to_dict()
+    assert dict(coverage["Coverage"]) == {t: {int(r) for r in cell.strip("{} ").split(",")}
+                                          for t, cell in rows["Coverage"].items()}
+    assert coverage.nbytes > 0
@@ -0,0 +1,41 @@
+import numpy as np
+import pytest
+
+import script
+from models import POWERPLANT, POWERPLANT_FILES, load
+
+
+def solved(template):
+    m = template.model
+    m.optimize()
+    variables, constrs = m.getVars(), m.getConstrs()
+    return {"A": m.getA(), "rhs": m.getAttr("RHS", constrs), "obj": m.getAttr("Obj", variables),
+            "lb": m.getAttr("LB", variables), "ub": m.getAttr("UB", variables), "objective": m.ObjVal}
+
+
+@pytest.mark.parametrize("scenario", [
+    {"date": "2011-07-02"},
+    # a capacity change moves matrix coefficients, not only right hand sides
+    {"date": "2011-07-01", "overrides": {"Capacity": {"Scherer": 2000}}},
+])
+def test_patched_template_matches_a_fresh_build(scenario):
+    first = script.build_model(POWERPLANT, load(POWERPLANT, POWERPLANT_FILES, "PowerPlant"), "PowerPlant")[0]
+    first.model.optimize()
+    script.templates.release(first)
+
+    data = dict(POWERPLANT, **scenario)
+    hits, misses = script.templates.hits, script.templates.misses
+    patched = script.build_model(data, load(data, POWERPLANT_FILES, "PowerPlant"), "PowerPlant")[0]
+    # the patched template is taken, so the same request now builds a model of its own
+    fresh = script.build_model(data, load(data, POWERPLANT_FILES, "PowerPlant"), "PowerPlant")[0]
+    try:
+        assert patched is first and fresh is not first
+        assert (script.templates.hits, script.templates.misses) == (hits + 1, misses + 1)
+        a, b = solved(patched), solved(fresh)
+        assert (a["A"] != b["A"]).nnz == 0
+        for key in ("rhs", "obj", "lb", "ub"):
+            assert np.allclose(a[key], b[key]), key
+        assert a["objective"] == pytest.approx(b["objective"])
+    finally:
+        script.templates.release(patched)
+        script.templates.release(fresh)
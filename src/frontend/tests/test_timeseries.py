@@ -0,0 +1,49 @@
+import functools
+import io
+
+import pandas as pd
+import pytest
+
+import timeseries
+from models import DEMO
+from timeseries import TimeSeriesLoader, date_code
+
+
+def demand():
+    with open(f"{DEMO}/demand.csv", "rb") as f:
+        return io.BytesIO(f.read())
+
+
+def expected(first, last):
+    frame = pd.read_csv(f"{DEMO}/demand.csv")
+    code = date_code(frame["YEAR"], frame["MONTH"], frame["DAY"])
+    return frame[(code >= date_code(*first)) & (code <= date_code(*last))].reset_index(drop=True)
+
+
+@pytest.mark.parametrize("first, last", [((2011, 7, 1), None), ((2011, 6, 30), (2011, 7, 2))])
+def test_scan_and_indexed_read_match_a_full_read(first, last):
+    loader = TimeSeriesLoader()
+    wanted = expected(first, last or first)
+    # the demo rows are not in date order, a day is spread over many runs of lines
+    pd.testing.assert_frame_equal(loader.load(demand(), first, last), wanted)
+    pd.testing.assert_frame_equal(loader.load(demand(), first, last), wanted)
+    assert loader.info()["hits"] == 1 and loader.info()["misses"] == 1
+
+
+def test_rows_across_block_boundaries(monkeypatch):
+    monkeypatch.setattr(timeseries, "blocks", functools.partial(timeseries.blocks, size=1000))
+    loader = TimeSeriesLoader()
+    pd.testing.assert_frame_equal(loader.load(demand(), (2011, 7, 1)), expected((2011, 7, 1), (2011, 7, 1)))
+    pd.testing.assert_frame_equal(loader.load(demand(), (2011, 7, 2)), expected((2011, 7, 2), (2011, 7, 2)))
+
+
+def test_index_is_kept_on_disk(tmp_path):
+    TimeSeriesLoader(index_dir=str(tmp_path)).load(demand(), (2011, 7, 1))
+    loader = TimeSeriesLoader(index_dir=str(tmp_path))
+    pd.testing.assert_frame_equal(loader.load(demand(), (2011, 7, 3)), expected((2011, 7, 3), (2011, 7, 3)))
+    assert loader.info()["hits"] == 1
+
+
+def test_missing_date_columns():
+    with pytest.raises(Exception, match="YEAR, MONTH, DAY"):
+        TimeSeriesLoader().load(io.BytesIO(b"HOUR,LOAD\n1,2\n"), (2011, 7, 1))
@@ -0,0 +1,64 @@
+import json
+import os
+
+import pytest
+
+import script
+from models import DEMO, POWERPLANT, POWERPLANT_FILES
+from results import ResultCache
+from timings import LatencyHistogram, Metrics, Timings, recording, span
+
+
+def test_histogram_buckets_and_quantiles():
+    histogram = LatencyHistogram(buckets=(0.1, 1, 10))
+    for seconds in (0.05, 0.1, 0.5, 0.7, 2, 50):
+        histogram.observe(seconds)
+    info = histogram.info()
+    # a duration on a bound falls in that bucket
+    assert info["buckets"] == [[0.1, 2], [1, 4], [10, 5], ["inf", 6]]
+    assert info["count"] == 6 and info["max"] == 50 and info["sum"] == pytest.approx(53.35)
+    assert histogram.quantile(0.5) == 1
+    assert histogram.quantile(0.99) == 50
+    assert LatencyHistogram().quantile(0.5) is None
+
+
+def test_phases_add_up_and_spans_need_a_request():
+    timings = Timings("test")
+    # outside of a request a span records nothing
+    with span("load"):
+        pass
+    assert timings.phases == {}
+    with recording(timings):
+        for _ in range(2):
+            with span("optimize"):
+                pass
+        with span("extract"):
+            pass
+    assert list(timings.phases) == ["optimize", "extract"]
+    timings.add("optimize", 1.5)
+    assert timings.block()["phases"]["optimize"] >= 1.5
+    with span("after"):
+        pass
+    assert "after" not in timings.phases
+
+
+def test_request_timings_reach_the_metrics(monkeypatch):
+    monkeypatch.setattr(script, "metrics", Metrics())
+    # an empty result cache, the solve phases are only there when the model is solved
+    monkeypatch.setattr(script, "results", ResultCache(directory=None))
+    client = script.app.test_client()
+    form = {key: json.dumps(value) for key, value in POWERPLANT.items()}
+    form.update(problem=json.dumps("mathematical_optimization"), plots=json.dumps(False))
+    form["file"] = [(open(os.path.join(DEMO, name), "rb"), name) for name in POWERPLANT_FILES]
+    response = client.post("/api/home", data=form, content_type="multipart/form-data").get_json()
+    for f, _ in form["file"]:
+        f.close()
+    block = response["timings"]
+    assert block["problem"] == "mathematical_optimization"
+    assert {"decode", "load", "optimize", "extract"} <= set(block["phases"])
+    assert block["solver"]["solves"] == 1 and block["solver"]["runtime"] > 0
+    assert sum(block["phases"].values()) <= block["total"]
+    latency = client.get("/api/metrics").get_json()["latency"]["mathematical_optimization"]
+    assert latency["phases"]["total"]["count"] == 1
+    assert latency["phases"]["gurobi"]["count"] == 1
+    assert latency["solver"]["solves"] == 1
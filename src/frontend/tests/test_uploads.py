@@ -0,0 +1,46 @@
+import pytest
+
+from models import DEMO
+from uploads import UploadCache
+
+
+def content(name):
+    with open(f"{DEMO}/{name}", "rb") as f:
+        return f.read()
+
+
+def test_same_content_is_parsed_once():
+    cache = UploadCache()
+    first = cache.load("coverage", content("coverage.csv"))
+    assert cache.load("coverage", content("coverage.csv")) is first
+    # the same bytes under another name share the parsed columns
+    renamed = cache.load("towers", content("coverage.csv"))
+    assert renamed.name == "towers" and renamed.columns is first.columns
+    assert cache.info()["hits"] == 2 and cache.info()["misses"] == 1
+
+
+def test_least_recently_used_table_is_dropped():
+    cache = UploadCache(max_bytes=1)
+    cache.load("coverage", content("coverage.csv"))
+    cache.load("population", content("population.csv"))
+    assert cache.info()["size"] == 1
+    cache.load("coverage", content("coverage.csv"))
+    assert cache.info()["misses"] == 3
+
+
+def test_spilled_table_is_read_back(tmp_path):
+    pytest.importorskip("pyarrow")
+    cache = UploadCache(max_bytes=1, spill_dir=str(tmp_path))
+    first = cache.load("coverage", content("coverage.csv"))
+    cache.load("population", content("population.csv"))
+    assert cache.info()["spilled"] == 1
+    again = cache.load("coverage", content("coverage.csv"))
+    assert again is not first and cache.info()["misses"] == 2
+    assert list(again.index) == list(first.index)
+    for name in first.columns:
+        assert dict(again[name]) == dict(first[name])
+
+
+def test_not_a_csv():
+    with pytest.raises(Exception, match="Please upload a csv file"):
+        UploadCache().load("broken", b"\xff\xfe\x00")
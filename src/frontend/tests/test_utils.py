@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from models import DEMO, old_utils
+from utils import RaggedColumn, as_array, parse_column, parse_tokens
+
+
+def test_parse_tokens():
+    assert parse_tokens(["1", "2"]).dtype == np.int64
+    assert parse_tokens(["1", "2.5"]).dtype == float
+    assert parse_tokens(["1", " a ", "2.5"]).tolist() == [1, "a", 2.5]
+
+
+@pytest.mark.parametrize("cells", [
+    ["{0, 1, 5}", "{0, 7, 8}", "{2}"],
+    ["(a:1,b:2.5)", "(c:3)", "(a:-1)"],
+    ["(1:10, 2:20)", "(3:30)", "(1:1.5)"],
+])
+def test_container_columns_match_typeparse(cells):
+    typeparse = old_utils().typeparse
+    column = parse_column(pd.Series(cells, dtype=object))
+    assert isinstance(column, RaggedColumn)
+    assert column.tolist() == [typeparse(cell) for cell in cells]
+
+
+def test_dictionary_keys_are_stripped():
+    # typeparse kept the space in front of " b"
+    assert parse_column(pd.Series(["(a:1, b:2)"], dtype=object)).tolist() == [{"a": 1, "b": 2}]
+
+
+def test_list_column_keeps_order_and_empty_cells():
+    column = parse_column(pd.Series(["[3, 1, 2]", "", None, "[x, 4.5]"], dtype=object))
+    assert column.kind == "list"
+    assert column.tolist() == [[3, 1, 2], [], [], ["x", 4.5]]
+
+
+def test_plain_columns():
+    assert parse_column(pd.Series([1, 2, 3])).tolist() == [1, 2, 3]
+    assert parse_column(pd.Series([" GAS ", "COAL"], dtype=object)).tolist() == ["GAS", "COAL"]
+
+
+def test_demo_coverage_column():
+    typeparse = old_utils().typeparse
+    frame = pd.read_csv(f"{DEMO}/coverage.csv", skipinitialspace=True)
+    column = parse_column(frame["Coverage"])
+    assert column.tolist() == [typeparse(cell) for cell in frame["Coverage"]]
+
+
+def test_as_array():
+    assert as_array([1, 2]).dtype == np.int64
+    assert as_array([1, 2.5]).dtype == float
+    assert as_array(["a", 1]).dtype == object
+    # bools are not taken for numbers
+    assert as_array([True, 1]).dtype == object
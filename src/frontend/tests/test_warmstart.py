@@ -0,0 +1,65 @@
+import gurobipy as gp
+from gurobipy import GRB
+
+from warmstart import Solution, StartMonitor, seed
+
+
+def knapsack(items, env, capacity=10):
+    m = gp.Model("knapsack", env=env)
+    x = m.addVars(items, vtype=GRB.BINARY, name="x")
+    m.setObjective(gp.quicksum(w * x[i] for i, w in items.items()), GRB.MAXIMIZE)
+    m.addConstr(gp.quicksum(w * x[i] for i, w in items.items()) <= capacity)
+    return m, x
+
+
+def monitored(solution, items, env, capacity):
+    m, _ = knapsack(items, env, capacity)
+    seed(m, solution)
+    m.update()
+    monitor = StartMonitor(m)
+    m.optimize(monitor)
+    return monitor
+
+
+def test_start_values_follow_the_index_when_the_data_changes():
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        m, _ = knapsack({"a": 3, "b": 4, "c": 6}, env)
+        m.optimize()
+        solution = Solution(m)
+        picked = {i for i in "abc" if solution.values[f"x[{i}]"] > 0.5}
+
+        # a new item in front and the others in a different order
+        again, x = knapsack({"d": 1, "c": 6, "a": 3, "b": 4}, env)
+        assert seed(again, solution) == 3
+        again.update()
+        assert {i for i in "abc" if x[i].Start > 0.5} == picked
+        assert x["d"].Start == GRB.UNDEFINED
+
+
+def test_monitor_tells_a_used_start_without_the_log():
+    # the log is off, the monitor goes by the incumbents
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        items = {"a": 3, "b": 4, "c": 6, "d": 5}
+        m, _ = knapsack(items, env)
+        m.optimize()
+        solution = Solution(m)
+        # a larger knapsack still fits the start
+        assert monitored(solution, items, env, 12).accepted is True
+        # a smaller one does not, the first incumbent is found by gurobi
+        assert monitored(solution, items, env, 7).accepted is False
+
+
+def test_monitor_of_an_lp_is_unknown():
+    with gp.Env(params={"OutputFlag": 0}) as env:
+        m = gp.Model("lp", env=env)
+        x = m.addVars(2, ub=1, name="x")
+        m.setObjective(x[0] + x[1], GRB.MAXIMIZE)
+        m.optimize()
+        again = gp.Model("lp", env=env)
+        y = again.addVars(2, ub=1, name="x")
+        again.setObjective(y[0] + y[1], GRB.MAXIMIZE)
+        seed(again, Solution(m))
+        again.update()
+        monitor = StartMonitor(again)
+        again.optimize(monitor)
+        assert monitor.accepted is None
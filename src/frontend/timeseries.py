@@ -0,0 +1,273 @@
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# Bytes of csv parsed at a time while scanning a time series, cut at the last full line
+BLOCK_BYTES = 16 * 2 ** 20
+# Directory the date indexes are kept in between restarts, only kept in memory when unset
+TIMESERIES_INDEX_DIR = os.environ.get("TIMESERIES_INDEX_DIR")
+# Number of date indexes kept in memory
+MAX_INDEXES = 32
+DATE_COLUMNS = ("YEAR", "MONTH", "DAY")
+
+
+def date_code(year, month, day):
+    """
+    Encode a date as one sortable integer
+    :return: yyyymmdd as int
+    """
+    return year * 10000 + month * 100 + day
+
+
+def blocks(stream, start, size=BLOCK_BYTES):
+    """
+    Read a file in blocks that end on a line break
+    :param stream: seekable binary file
+    :param start: byte offset to start from
+    :param size: approximate block size in bytes
+    :return: generator of (byte offset, bytes)
+    """
+    stream.seek(start)
+    offset, rest = start, b""
+    while True:
+        chunk = stream.read(size)
+        if not chunk:
+            break
+        chunk = rest + chunk
+        cut = chunk.rfind(b"\n") + 1
+        if cut == 0:
+            rest = chunk
+            continue
+        yield offset, chunk[:cut]
+        offset, rest = offset + cut, chunk[cut:]
+    if rest.strip():
+        yield offset, rest + b"\n"
+
+
+class DateIndex:
+    """
+    The byte ranges of the rows of every day in a time series csv, sorted by date then position.
+    Lets a repeat request read only the lines of the days it asks for.
+    """
+
+    def __init__(self, header, codes, starts, ends):
+        """
+        :param header: bytes of the header line
+        :param codes: int64 array of date codes, one per range
+        :param starts: int64 array of the byte offset each range starts at
+        :param ends: int64 array of the byte offset each range ends at
+        """
+        self.header = header
+        self.codes = codes
+        self.starts = starts
+        self.ends = ends
+
+    @staticmethod
+    def from_runs(header, codes, starts, ends):
+        """
+        Build the index from runs of lines with the same date, adjacent runs of the same day are merged
+        :return: DateIndex
+        """
+        order = np.lexsort((starts, codes))
+        codes, starts, ends = codes[order], starts[order], ends[order]
+        if len(codes) > 0:
+            # a run continues the previous one if it is the same day and starts where the previous one ended
+            new = np.concatenate([[True], (codes[1:] != codes[:-1]) | (starts[1:] != ends[:-1])])
+            last = np.concatenate([np.flatnonzero(new)[1:] - 1, [len(codes) - 1]])
+            codes, starts, ends = codes[new], starts[new], ends[last]
+        return DateIndex(header, codes, starts, ends)
+
+    def ranges(self, first, last):
+        """
+        :param first: first date code, inclusive
+        :param last: last date code, inclusive
+        :return: the (start, end) byte ranges of the dates in file order, touching ranges joined
+        """
+        lo = np.searchsorted(self.codes, first, side="left")
+        hi = np.searchsorted(self.codes, last, side="right")
+        starts, ends = self.starts[lo:hi], self.ends[lo:hi]
+        order = np.argsort(starts, kind="stable")
+        joined = []
+        for start, end in zip(starts[order].tolist(), ends[order].tolist()):
+            if joined and joined[-1][1] == start:
+                joined[-1][1] = end
+            else:
+                joined.append([start, end])
+        return joined
+
+    def save(self, path):
+        temporary = path + f".{threading.get_ident()}.tmp.npz"
+        np.savez(temporary, header=np.frombuffer(self.header, dtype=np.uint8), codes=self.codes,
+                 starts=self.starts, ends=self.ends)
+        os.replace(temporary, path)
+
+    @staticmethod
+    def load(path):
+        with np.load(path) as saved:
+            return DateIndex(saved["header"].tobytes(), saved["codes"], saved["starts"], saved["ends"])
+
+
+def stream_hash(stream):
+    """
+    :param stream: seekable binary file
+    :return: hex digest of its content
+    """
+    stream.seek(0)
+    hasher = hashlib.sha256()
+    for chunk in iter(lambda: stream.read(BLOCK_BYTES), b""):
+        hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+def line_bounds(block, offset):
+    """
+    Find the lines of a block that hold a row
+    :param block: bytes ending on a line break
+    :param offset: byte offset of the block in the file
+    :return: int64 arrays of the start and end offset of every non blank line
+    """
+    newlines = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord("\n"))
+    starts = np.concatenate([[0], newlines[:-1] + 1])
+    ends = newlines + 1
+    # pandas skips empty lines, so they get no row
+    lengths = ends - starts
+    blank = (lengths == 1) | ((lengths == 2) & (np.frombuffer(block, dtype=np.uint8)[starts] == ord("\r")))
+    return starts[~blank] + offset, ends[~blank] + offset
+
+
+def date_codes(frame):
+    columns = [frame[c].to_numpy() for c in DATE_COLUMNS]
+    return date_code(*[c.astype(np.int64) for c in columns])
+
+
+class TimeSeriesLoader:
+    """
+    Loads the rows of a date range from a time series csv with YEAR, MONTH and DAY columns.
+    The first request for a file streams it block by block, keeps only the matching rows and
+    records the byte ranges of every day, later requests for the same content seek straight to them.
+    """
+
+    def __init__(self, index_dir=TIMESERIES_INDEX_DIR, size=MAX_INDEXES):
+        self.index_dir = index_dir
+        self.size = size
+        self.indexes = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def index_path(self, key):
+        return os.path.join(self.index_dir, key + ".npz")
+
+    def find(self, key):
+        """
+        :param key: content hash
+        :return: DateIndex, or None if the file was never scanned
+        """
+        with self.lock:
+            index = self.indexes.get(key)
+            if index is not None:
+                self.indexes.move_to_end(key)
+                return index
+        if self.index_dir is None or not os.path.exists(self.index_path(key)):
+            return None
+        try:
+            index = DateIndex.load(self.index_path(key))
+        except Exception:
+            return None
+        self.remember(key, index)
+        return index
+
+    def remember(self, key, index):
+        with self.lock:
+            self.indexes[key] = index
+            self.indexes.move_to_end(key)
+            while len(self.indexes) > self.size:
+                self.indexes.popitem(last=False)
+
+    def scan(self, stream, first, last):
+        """
+        Stream the whole file, keeping the rows in the date range and indexing every day
+        :param stream: seekable binary file
+        :param first: first date code, inclusive
+        :param last: last date code, inclusive
+        :return: DataFrame of the matching rows and the DateIndex of the file
+        """
+        stream.seek(0)
+        header = stream.readline()
+        names = [name.strip() for name in header.decode().split(",")]
+        if any(c not in names for c in DATE_COLUMNS):
+            raise Exception(f"Error: Please check the data, a time series needs the columns {', '.join(DATE_COLUMNS)}")
+        frames, codes, starts, ends = [], [], [], []
+        for offset, block in blocks(stream, len(header)):
+            frame = pd.read_csv(io.BytesIO(block), header=None, names=names)
+            line_starts, line_ends = line_bounds(block, offset)
+            if len(line_starts) != len(frame):
+                raise Exception("Error: Please check the data, time series rows have to be one per line")
+            code = date_codes(frame)
+            frames.append(frame[(code >= first) & (code <= last)])
+            # one index entry per run of consecutive lines of the same day
+            new = np.concatenate([[True], code[1:] != code[:-1]])
+            run_starts = np.flatnonzero(new)
+            run_ends = np.concatenate([run_starts[1:], [len(code)]]) - 1
+            codes.append(code[run_starts])
+            starts.append(line_starts[run_starts])
+            ends.append(line_ends[run_ends])
+        if len(frames) == 0:
+            return pd.read_csv(io.BytesIO(header)), DateIndex.from_runs(header, *[np.zeros(0, dtype=np.int64)] * 3)
+        index = DateIndex.from_runs(header, np.concatenate(codes), np.concatenate(starts), np.concatenate(ends))
+        return pd.concat(frames, ignore_index=True), index
+
+    def read(self, stream, index, first, last):
+        """
+        Read only the lines of the date range
+        :param stream: seekable binary file
+        :param index: DateIndex of the file
+        :param first: first date code, inclusive
+        :param last: last date code, inclusive
+        :return: DataFrame of the matching rows
+        """
+        parts = [index.header]
+        for start, end in index.ranges(first, last):
+            stream.seek(start)
+            parts.append(stream.read(end - start))
+        return pd.read_csv(io.BytesIO(b"".join(parts)))
+
+    def load(self, stream, first, last=None, key=None):
+        """
+        Load the rows between two dates
+        :param stream: seekable binary file of the csv
+        :param first: (year, month, day) of the first date
+        :param last: (year, month, day) of the last date, the first date if None
+        :param key: content hash of the file if the caller already has it
+        :return: DataFrame with the rows in file order
+        """
+        first = date_code(*first)
+        last = first if last is None else date_code(*last)
+        if key is None:
+            key = stream_hash(stream)
+
+        index = self.find(key)
+        if index is not None:
+            self.hits += 1
+            return self.read(stream, index, first, last)
+        self.misses += 1
+        frame, index = self.scan(stream, first, last)
+        self.remember(key, index)
+        if self.index_dir is not None:
+            os.makedirs(self.index_dir, exist_ok=True)
+            index.save(self.index_path(key))
+        return frame
+
+    def info(self):
+        """
+        :return: dictionary with hits, misses and the number of indexes in memory
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.indexes), "maxsize": self.size}
+
+
+timeseries = TimeSeriesLoader()
@@ -0,0 +1,185 @@
+import threading
+import time
+from bisect import bisect_left
+from collections import OrderedDict
+from contextlib import contextmanager, nullcontext
+
+# Upper bounds in seconds of the latency histogram buckets, slower phases land in one more overflow bucket
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600)
+# Quantiles reported by the metrics endpoint
+QUANTILES = (0.5, 0.95, 0.99)
+
+# the Timings of the request the current thread is working on
+active = threading.local()
+
+
+class Timings:
+    """
+    The seconds spent in every phase of one request in the order they first ran, and what gurobi
+    reports about its solves. A phase entered more than once, such as optimize in a rolling horizon run, adds up.
+    """
+
+    def __init__(self, problem=None):
+        self.problem = problem
+        self.created = time.time()
+        # set when the request is handed to the worker pool, the wait for a worker is its own phase
+        self.sent = None
+        self.phases = OrderedDict()
+        self.solver = {"solves": 0, "runtime": 0.0, "nodes": 0, "iterations": 0}
+
+    def add(self, name, seconds):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def record_solve(self, m):
+        """
+        :param m: gurobi model after optimize
+        :return: None
+        """
+        self.solver["solves"] += 1
+        self.solver["runtime"] += m.Runtime
+        self.solver["iterations"] += int(m.IterCount + m.BarIterCount)
+        if m.IsMIP:
+            self.solver["nodes"] += int(m.NodeCount)
+
+    def block(self):
+        """
+        :return: dictionary for the timings block of the json response
+        """
+        return {"problem": self.problem, "total": round(time.time() - self.created, 6),
+                "phases": {name: round(seconds, 6) for name, seconds in self.phases.items()},
+                "solver": dict(self.solver, runtime=round(self.solver["runtime"], 6))}
+
+
+@contextmanager
+def recording(timings):
+    """
+    Make a Timings the one spans of the current thread are added to
+    :param timings: Timings
+    :return: context manager
+    """
+    previous = getattr(active, "timings", None)
+    active.timings = timings
+    try:
+        yield timings
+    finally:
+        active.timings = previous
+
+
+def span(name):
+    """
+    Time a phase of the request the current thread is working on, nothing is recorded outside of a request
+    :param name: phase name
+    :return: context manager
+    """
+    timings = getattr(active, "timings", None)
+    return timings.phase(name) if timings is not None else nullcontext()
+
+
+def record_solve(m):
+    timings = getattr(active, "timings", None)
+    if timings is not None:
+        timings.record_solve(m)
+
+
+class LatencyHistogram:
+    """
+    Counts of durations per bucket, with the sum and the slowest one
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect_left(self.buckets, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+        self.max = max(self.max, seconds)
+
+    def quantile(self, q):
+        """
+        :param q: quantile between 0 and 1
+        :return: upper bound of the bucket holding the quantile, the slowest duration for the overflow bucket
+        """
+        if self.count == 0:
+            return None
+        rank, seen = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def info(self):
+        # [upper bound, durations at or below it] pairs in order, json objects would sort the bounds as text
+        cumulative, seen = [], 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            cumulative.append([bound, seen])
+        cumulative.append(["inf", self.count])
+        info = {"count": self.count, "sum": round(self.sum, 6), "mean": round(self.sum / self.count, 6) if self.count else None,
+                "max": round(self.max, 6)}
+        info.update({f"p{int(q * 100)}": self.quantile(q) for q in QUANTILES})
+        info["buckets"] = cumulative
+        return info
+
+
+class Metrics:
+    """
+    Latency histograms of every phase, the request total and the gurobi runtime, by problem type
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.histograms = {}
+        self.solver = {}
+        self.lock = threading.Lock()
+
+    def histogram(self, problem, name):
+        key = (problem, name)
+        if key not in self.histograms:
+            self.histograms[key] = LatencyHistogram(self.buckets)
+        return self.histograms[key]
+
+    def observe(self, block):
+        """
+        Add the timings block of a finished request
+        :param block: dictionary returned by Timings.block
+        :return: None
+        """
+        problem = block.get("problem") or "unknown"
+        with self.lock:
+            self.histogram(problem, "total").observe(block["total"])
+            for name, seconds in block["phases"].items():
+                self.histogram(problem, name).observe(seconds)
+            solver = block["solver"]
+            if solver["solves"] > 0:
+                self.histogram(problem, "gurobi").observe(solver["runtime"])
+            totals = self.solver.setdefault(problem, {"solves": 0, "runtime": 0.0, "nodes": 0, "iterations": 0})
+            for key in totals:
+                totals[key] += solver[key]
+
+    def info(self):
+        """
+        :return: dictionary of problem type to the histogram of every phase and the solver totals
+        """
+        with self.lock:
+            info = {}
+            for (problem, name), histogram in self.histograms.items():
+                info.setdefault(problem, {"phases": {}, "solver": dict(self.solver.get(problem, {}))})
+                info[problem]["phases"][name] = histogram.info()
+            return info
+
+
+metrics = Metrics()
@@ -0,0 +1,197 @@
+import hashlib
+import io
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from store import DataTable, IndexSet, Parameter, parse_table
+from utils import RaggedColumn
+
+# pyarrow is only needed to spill evicted tables to disk
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+# Bytes of parsed uploads kept in memory between requests
+UPLOAD_CACHE_BYTES = 256 * 2 ** 20
+# Directory evicted tables are written to as parquet, nothing is spilled when unset
+UPLOAD_SPILL_DIR = os.environ.get("UPLOAD_SPILL_DIR")
+
+
+def content_hash(content):
+    """
+    :param content: bytes of an uploaded file
+    :return: hex digest
+    """
+    return hashlib.sha256(content).hexdigest()
+
+
+def table_to_arrow(table):
+    """
+    Convert a parsed table to an arrow table, ragged columns become list and map columns over their CSR arrays
+    :param table: DataTable
+    :return: pyarrow Table
+    """
+    arrays = {table.index.name: pa.array(list(table.index))}
+    kinds = {}
+    for name, parameter in table.columns.items():
+        values = parameter.values
+        if not parameter.ragged:
+            arrays[name] = pa.array(values.tolist() if values.dtype == object else values)
+            continue
+        offsets = pa.array(values.offsets.astype(np.int32))
+        if values.kind == "dict":
+            arrays[name] = pa.MapArray.from_arrays(offsets, pa.array(values.keys.tolist()), pa.array(values.values.tolist()))
+        else:
+            arrays[name] = pa.ListArray.from_arrays(offsets, pa.array(values.values.tolist()))
+        kinds[name] = values.kind
+    metadata = {"index": table.index.name, "kinds": json.dumps(kinds)}
+    return pa.table(arrays, metadata=metadata)
+
+
+def table_from_arrow(name, arrow):
+    """
+    Rebuild a parsed table from its arrow form
+    :param name: file name without extension
+    :param arrow: pyarrow Table written by table_to_arrow
+    :return: DataTable
+    """
+    metadata = {k.decode(): v.decode() for k, v in arrow.schema.metadata.items()}
+    kinds = json.loads(metadata["kinds"])
+    index_name = metadata["index"]
+    index = IndexSet(index_name, arrow.column(index_name).to_pylist())
+    columns = {}
+    for column in arrow.column_names:
+        if column == index_name:
+            continue
+        array = arrow.column(column).combine_chunks()
+        if column not in kinds:
+            values = array.to_numpy(zero_copy_only=False)
+            columns[column] = Parameter(column, index, values)
+            continue
+        offsets = array.offsets.to_numpy().astype(np.int64)
+        if kinds[column] == "dict":
+            values = RaggedColumn("dict", offsets, array.items.to_numpy(zero_copy_only=False),
+                                  array.keys.to_numpy(zero_copy_only=False))
+        else:
+            values = RaggedColumn(kinds[column], offsets, array.values.to_numpy(zero_copy_only=False))
+        columns[column] = Parameter(column, index, values)
+    return DataTable(name, index, columns)
+
+
+class UploadCache:
+    """
+    Parsed uploads keyed by the hash of the file content, so a file sent again with the next request is not parsed again.
+    The least recently used tables are dropped once the cache holds more than its byte budget,
+    or written to the spill directory as parquet when one is set and pyarrow is installed.
+    """
+
+    def __init__(self, max_bytes=UPLOAD_CACHE_BYTES, spill_dir=UPLOAD_SPILL_DIR):
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir if pa is not None else None
+        self.tables = OrderedDict()
+        self.nbytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.spilled = 0
+
+    def spill_path(self, key):
+        return os.path.join(self.spill_dir, key + ".parquet")
+
+    def get(self, key):
+        """
+        :param key: content hash
+        :return: DataTable, or None if the content was never parsed
+        """
+        with self.lock:
+            table = self.tables.get(key)
+            if table is not None:
+                self.tables.move_to_end(key)
+                return table
+        if self.spill_dir is None or not os.path.exists(self.spill_path(key)):
+            return None
+        try:
+            table = table_from_arrow(key, pq.read_table(self.spill_path(key)))
+        except Exception:
+            return None
+        self.put(key, table)
+        return table
+
+    def put(self, key, table):
+        """
+        :param key: content hash
+        :param table: DataTable
+        :return: None
+        """
+        evicted = []
+        with self.lock:
+            if key in self.tables:
+                return
+            self.tables[key] = table
+            self.nbytes += table.nbytes
+            while self.nbytes > self.max_bytes and len(self.tables) > 1:
+                old_key, old = self.tables.popitem(last=False)
+                self.nbytes -= old.nbytes
+                evicted.append((old_key, old))
+        for old_key, old in evicted:
+            self.spill(old_key, old)
+
+    def spill(self, key, table):
+        """
+        Write an evicted table to the spill directory
+        :param key: content hash
+        :param table: DataTable
+        :return: None
+        """
+        if self.spill_dir is None or os.path.exists(self.spill_path(key)):
+            return
+        try:
+            arrow = table_to_arrow(table)
+        except (pa.ArrowException, TypeError, ValueError):
+            # columns mixing numbers and strings have no arrow type, the table is just dropped
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        # write under a temporary name so a concurrent reader never sees half a file
+        temporary = self.spill_path(key) + f".{threading.get_ident()}.tmp"
+        pq.write_table(arrow, temporary)
+        os.replace(temporary, self.spill_path(key))
+        self.spilled += 1
+
+    def load(self, name, content):
+        """
+        Parse an uploaded csv, or reuse the table parsed from the same content before
+        :param name: file name without extension
+        :param content: bytes of the file
+        :return: DataTable
+        """
+        key = content_hash(content)
+        table = self.get(key)
+        if table is not None:
+            self.hits += 1
+            return table if table.name == name else DataTable(name, table.index, table.columns)
+        self.misses += 1
+        try:
+            frame = pd.read_csv(io.BytesIO(content))
+        except Exception:
+            raise Exception("Error: Please upload a csv file")
+        table = parse_table(name, frame)
+        self.put(key, table)
+        return table
+
+    def info(self):
+        """
+        :return: dictionary with hits, misses, the number of tables and bytes held and the number of tables spilled
+        """
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.tables), "bytes": self.nbytes,
+                "maxbytes": self.max_bytes, "spilled": self.spilled}
+
+
+uploads = UploadCache()
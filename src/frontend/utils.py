@@ -1,193 +1,112 @@
-import re
 import numpy as np
 
-def parse(expr):
+# Bracket that marks the container type of a column, checked on the first non-empty cell
+CONTAINER_KINDS = (("[", "list"), ("{", "set"), ("(", "dict"))
+
+
+class RaggedColumn:
+    """
+    A column of lists, sets or dictionaries stored CSR style.
+    The entries of row i are values[offsets[i]:offsets[i + 1]], and keys holds the matching keys for dictionaries.
+    """
+
+    def __init__(self, kind, offsets, values, keys=None):
+        self.kind = kind
+        self.offsets = offsets
+        self.values = values
+        self.keys = keys
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        start, end = self.offsets[i], self.offsets[i + 1]
+        values = self.values[start:end].tolist()
+        if self.kind == "set":
+            return set(values)
+        if self.kind == "dict":
+            return dict(zip(self.keys[start:end].tolist(), values))
+        return values
+
+    def tolist(self):
+        """
+        Convert every row to its python container
+        :return: list of lists, sets or dictionaries
+        """
+        return [self[i] for i in range(len(self))]
+
+
+BRACKETS = str.maketrans("", "", "[]{}()")
+
+
+def parse_tokens(tokens):
     """
-    Parse the expression to be used in the gurobi model
-    :param expr: string
-    :param sets: dictionary
-    :return: string
+    Convert string tokens to numbers in bulk, ints where every token is one, then floats, strings left as they are
+    :param tokens: list of strings
+    :return: int64 or float64 numpy array if every token is a number, object array of ints, floats and strings otherwise
     """
-    ret = ""
-    # split on ==, <=, >=, <, >, != if it exists
-    operator = re.findall(r"=|<=|>=|<|>|!=", expr)
-    
-    # if there is an operator, we need to split the expression
-    if len(operator) > 0:
-        ret += "(" #Note that we are starting with an open parenthesis
-        # find the sums
-        sums = re.findall(r"/sum_(\w)\^{(\w+)}", expr)
-        if len(sums) > 0:
-            ret += "gp.quicksum(" 
-        # now that we extracted the info from the sums, we can remove them
-        expr = re.sub(r"/sum_(\w)\^{(\w+)}", "", expr)
-
-        #split
-        expr = expr.split(operator[0])
-        lhs = expr[0].strip()
-        rhs = expr[1].strip()
-        # also remove parentheses
-        lhs = lhs.replace("(", "").replace(")", "")
-        rhs = rhs.replace("(", "").replace(")", "")
-        # remove whitespace
-        lhs = lhs.strip()
-        rhs = rhs.strip()
-
-        # find the subscripts to replace with array notation
-        subscripts = re.findall(r"(\w_\w+|\w_\{[\w\+\-\,]+\})", lhs)  # Modified regex pattern
-        for subscript in subscripts:
-            if "{" not in subscript:
-                lhs = lhs.replace(subscript, f"{subscript.split('_')[0]}[{subscript.split('_')[1]}]")
-            else:
-                lhs = lhs.replace(subscript, f"{subscript.split('_')[0]}[{subscript.split('_')[1].replace('{', '').replace('}', '')}]")
-
-        # conditional statement check
-        conditional = ""
-        cond_split = lhs.split("if")
-        lhs = cond_split[0].strip()
-        if len(cond_split) > 1:
-            conditional = cond_split[1].strip()
-
-        ret += lhs
-
-        # Add the sums back in
-        for sum in sums:
-            ret += f" for {sum[0]} in {sum[1]}"
-        # Add the conditional statement back in
-        if len(conditional) > 0:
-            ret += f" if {conditional}"
-        # Add the closing parenthesis
-        if len(sums) > 0:
-            ret += ")"
-
-        # Change the operator to python syntax
-        if operator[0] == "=":
-            operator[0] = "=="
-        ret += f" {operator[0]} "
-
-        # Check if there is a forall statement
-        forall = re.findall(r"/forall_(\w)\^{(\w+)}", rhs)
-        rhs = re.sub(r"/forall_(\w)\^{(\w+)}", "", rhs)
-
-        subscripts = re.findall(r"(\w_\w+|\w_\{[\w\+\-\,]+\})", rhs)  # Modified regex pattern
-        for subscript in subscripts:
-            if "{" not in subscript:
-                rhs = rhs.replace(subscript, f"{subscript.split('_')[0]}[{subscript.split('_')[1]}]")
-            else:
-                rhs = rhs.replace(subscript, f"{subscript.split('_')[0]}[{subscript.split('_')[1].replace('{', '').replace('}', '')}]")
-
-        # Check for a conditional statement and remove it if it exists
-        conditional = ""
-        cond_split = rhs.split("if")
-        rhs = cond_split[0].strip()
-        if len(cond_split) > 1:
-            conditional = cond_split[1].strip()
-
-        ret += rhs
-        # Add the closing parenthesis
-        ret += ")"
-        
-        # Add the forall statement back in
-        for f in forall:
-            ret += f" for {f[0]} in {f[1]}"
-        # Add the conditional statement back in
-        if len(conditional) > 0:
-            ret += f" if {conditional}"
-        
-
-    else:
-        # find the sums
-        sums = re.findall(r"/sum_(\w)\^{(\w+)}", expr)
-        if len(sums) > 0:
-            ret += "gp.quicksum(" 
-        # now that we extracted the info from the sums, we can remove them
-        expr = re.sub(r"/sum_(\w)\^{(\w+)}", "", expr)
-
-        #find the subscripts to replace with array notation
-        subscripts = re.findall(r"(\w_\w+|\w_\{[\w\+\-\,]+\})", expr)
-        for subscript in subscripts:
-            if "{" not in subscript:
-                expr = expr.replace(subscript, f"{subscript.split('_')[0]}[{subscript.split('_')[1]}]")
-            else:
-                expr = expr.replace(subscript, f"{subscript.split('_')[0]}[{subscript.split('_')[1].replace('{', '').replace('}', '')}]")
-
-        # Check for a conditional statement and remove it if it exists  
-        conditional = ""
-        cond_split = expr.split("if")
-        expr = cond_split[0].strip()
-        if len(cond_split) > 1:
-            conditional = cond_split[1].strip()
-
-        ret += expr
-
-        # Add the sums back in
-        for sum in sums:
-            ret += f" for {sum[0]} in {sum[1]}"
-        # Add the conditional statement back in
-        if len(conditional) > 0:
-            ret += f" if {conditional}"
-        # Add the closing parenthesis
-        if len(sums) > 0:
-            ret += ")"
-
-    return ret
-
-def typeparse(value):
+    try:
+        return np.array(list(map(int, tokens)), dtype=np.int64)
+    except (ValueError, OverflowError):
+        pass
+    try:
+        return np.array(list(map(float, tokens)), dtype=float)
+    except ValueError:
+        pass
+    parsed = np.empty(len(tokens), dtype=object)
+    for i, token in enumerate(tokens):
+        token = token.strip()
+        try:
+            parsed[i] = int(token)
+        except ValueError:
+            try:
+                parsed[i] = float(token)
+            except ValueError:
+                parsed[i] = token
+    return parsed
+
+
+def as_array(values):
+    """
+    Convert index values or parameter values to a flat numpy array
+    :param values: iterable
+    :return: numpy array, numeric when every value is a number, object otherwise
+    """
+    values = list(values)
+    kinds = {type(v) for v in values}
+    if kinds and all(issubclass(k, (int, np.integer)) and k is not bool for k in kinds):
+        return np.array(values, dtype=np.int64)
+    if kinds and all(issubclass(k, (int, float, np.integer, np.floating)) and k is not bool for k in kinds):
+        return np.array(values, dtype=float)
+    return np.fromiter(values, dtype=object, count=len(values))
+
+
+def parse_column(column):
     """
-    Parse the data type of the value
-    :param value: value to parse
-    :return: parsed value
+    Parse a whole csv column at once, the column type is detected once from its first cell
+    :param column: pandas Series
+    :return: numpy array for plain columns, RaggedColumn for list, set and dictionary columns
     """
-    #if type is numpy.int64 or numpy.float64, no need to parse
-    if type(value) == np.int64 or type(value) == np.float64:
-        return value
-    # if type is string, check for list, set, or dictionary
-    elif type(value) == str:
-        # check for list
-        if "[" in value:
-            ret = []
-            for i in value.replace("[", "").replace("]", "").split(","):
-                try:
-                    i = int(i)
-                except:
-                    try:
-                        i = float(i)
-                    except:
-                        pass
-                ret.append(i)
-        # check for set
-        elif "{" in value:
-            ret = set()
-            for i in value.replace("{", "").replace("}", "").split(","):
-                try:
-                    i = int(i)
-                except:
-                    try:
-                        i = float(i)
-                    except:
-                        pass
-                ret.add(i)
-            return ret
-        # check for dictionary
-        elif "(" in value:
-            ret = {}
-            for i in value.replace("(", "").replace(")", "").split(","):
-                key, val = i.split(":")
-                try:
-                    key = int(key)
-                except:
-                    try:
-                        key = float(key)
-                    except:
-                        pass
-                try:
-                    val = int(val)
-                except:
-                    try:
-                        val = float(val)
-                    except:
-                        pass
-                ret[key] = val
-            return ret
-    else:
-        return value
+    if column.dtype != object:
+        return column.to_numpy()
+    cells = column.dropna()
+    cells = cells[cells.astype(str).str.strip() != ""]
+    if len(cells) == 0 or not isinstance(cells.iloc[0], str):
+        return column.to_numpy(dtype=object)
+    kind = next((k for bracket, k in CONTAINER_KINDS if bracket in cells.iloc[0]), None)
+    if kind is None:
+        return column.str.strip().to_numpy(dtype=object)
+
+    # split all cells in one pass, a newline token marks the end of every cell
+    text = ",\n,".join(column.fillna("").astype(str).tolist()).translate(BRACKETS) + ",\n"
+    tokens = [t for t in text.split(",") if t == "\n" or not t.isspace() and t != ""]
+    ends = np.fromiter((t == "\n" for t in tokens), dtype=bool, count=len(tokens))
+    rows = np.cumsum(ends)[~ends]
+    offsets = np.concatenate([[0], np.cumsum(np.bincount(rows, minlength=len(column)))])
+    tokens = [t for t in tokens if t != "\n"]
+    if kind != "dict":
+        return RaggedColumn(kind, offsets, parse_tokens(tokens))
+    pairs = [token.split(":", 1) for token in tokens]
+    if any(len(pair) != 2 for pair in pairs):
+        raise Exception("Error: Please check the data, dictionary entries are written as (key:value, ...)")
+    return RaggedColumn(kind, offsets, parse_tokens([p[1] for p in pairs]), parse_tokens([p[0] for p in pairs]))
@@ -1,43 +1,53 @@
 import math
-import matplotlib.pyplot as plt
+from matplotlib.figure import Figure
 import numpy as np
 import pandas as pd
 import seaborn as sns
-import yfinance as yf
 import networkx as nx
 import gurobipy as gp
 
 from statsmodels.tsa.holtwinters import ExponentialSmoothing
 from scipy.spatial import Voronoi, voronoi_plot_2d
 
+from frontier import FRONTIER_POINTS, efficient_frontier
+from sectors import sectors
+
 FIG_SIZE = (10, 8)
 
 
-def plot_efficient_frontier(m, x, delta, std, stocks):
+def subplots(figsize=FIG_SIZE):
+    """
+    Create a figure with a single axes without going through pyplot.
+    pyplot keeps global state, so figures for concurrent requests have to be created directly.
+
+    :param figsize: tuple of width and height in inches
+    :return: matplotlib figure and axes
+    """
+    fig = Figure(figsize=figsize)
+    return fig, fig.subplots()
+
+
+def plot_efficient_frontier(m, x, delta, std, stocks, frontier=None, points=FRONTIER_POINTS):
     """
     Plot the efficient frontier
-    :param m: gurobi model
+    :param m: gurobi model, solved for the minimum risk portfolio
     :param x: gurobi variable
     :param delta: numpy array
     :param std: numpy array
     :param stocks: list
+    :param frontier: tuple of volatility and return arrays from efficient_frontier, solved here if None
+    :param points: number of target returns the frontier is solved at
     :return: None
     """
     # Plot the efficient frontier
     minrisk_volatility = math.sqrt(m.ObjVal)
     minrisk_return = delta @ x.X
-    # Create an expression representing the expected return for the portfolio
-    portfolio_return = delta @ x
-    target = m.addConstr(portfolio_return == minrisk_return, 'target')
 
-    # Solve for efficient frontier by varying target return
-    frontier = np.empty((2,0))
-    for r in np.linspace(delta.min(), delta.max(), 15):
-        target.rhs = r
-        m.optimize()
-        frontier = np.append(frontier, [[math.sqrt(m.ObjVal)],[r]], axis=1)
+    # Solve for efficient frontier by varying target return, the model itself is not changed
+    if frontier is None:
+        frontier = efficient_frontier(m, x, delta, points)
 
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    fig, ax = subplots(figsize=FIG_SIZE)
 
     # Plot volatility versus expected return for individual stocks
     ax.scatter(x=std, y=delta,
@@ -72,7 +82,7 @@ def plot_portfolio_bubble(std, delta, stocks, variable):
     :param variable: Gurobi variable
     :return: matplotlib figure
     """
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    fig, ax = subplots(figsize=FIG_SIZE)
 
     # Plot bubbles
     sizes = variable.X
@@ -109,7 +119,7 @@ def plot_portfolio_forecast(data):
     model = ExponentialSmoothing(portfolio_data, trend='add', seasonal='add', seasonal_periods=12).fit()
     forecast = model.forecast(steps=12)  # Forecast for 12 months ahead
 
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    fig, ax = subplots(figsize=FIG_SIZE)
     ax.plot(portfolio_data, label='Historical Data')
     ax.plot(forecast, label='Forecast', linestyle='dashed')
     ax.set_xlabel('Date')
@@ -131,21 +141,12 @@ def plot_portfolio_pie(stocks, sizes):
     # The portfolio composition is already covered in the text output,
     # how about we base it off of portfolio sector type composition?
 
-    info = yf.Ticker(stocks[0]).info
-    sectors = {}
-    for stock in stocks:
-        info = yf.Ticker(stock).info
-        sector = info['sector']
-        allocation = sizes.X[stocks.index(stock)]
-        if sector in sectors:
-            sectors[sector] += allocation
-        else:
-            sectors[sector] = allocation
+    weights = sectors.weights(stocks, sizes.X)
 
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    fig, ax = subplots(figsize=FIG_SIZE)
 
     # Plot pie chart
-    ax.pie(sectors.values(), labels=sectors.keys(), autopct='%1.1f%%', startangle=140)
+    ax.pie(weights.values, labels=weights.index, autopct='%1.1f%%', startangle=140)
 
     # Set title
     ax.set_title('Portfolio Market Composition')
@@ -170,8 +171,8 @@ def plot_power_plant_supply(hours, plants, variable):
     solution['Power generated (MWh)'] = [variable[pair[1], pair[0]].X for pair in plant_hour_pairs]
 
     print("Power supply:")
-    fig, ax = plt.subplots(figsize=(15, 6))
-    sns.pointplot(data=solution, x='Hour', y='Power generated (MWh)', hue='Plant')
+    fig, ax = subplots(figsize=(15, 6))
+    sns.pointplot(data=solution, x='Hour', y='Power generated (MWh)', hue='Plant', ax=ax)
     sns.move_legend(ax, "upper left", bbox_to_anchor=(1, 1))
 
     return fig
@@ -186,11 +187,11 @@ def plot_power_demand(hours, demand):
     :return: matplotlib figure
     """
     print("Power demand:")
-    fig, ax = plt.subplots(figsize=(15, 6))
+    fig, ax = subplots(figsize=(15, 6))
     demand_data = pd.DataFrame(columns=['Hour', 'Demand (MWh)'])
     demand_data['Hour'] = hours
     demand_data['Demand (MWh)'] = [demand[h] for h in hours]
-    sns.pointplot(data=demand_data, x='Hour', y='Demand (MWh)')
+    sns.pointplot(data=demand_data, x='Hour', y='Demand (MWh)', ax=ax)
 
     return fig
 
@@ -237,7 +238,7 @@ def plot_coverage_tree(coverage, region, selected, covered):
     edges_weight = nx.get_edge_attributes(G, 'weight')
     # find the max length of a node name to set the node size
     max_length = max([len(n) for n in G.nodes()])
-    fig, ax = plt.subplots(figsize=FIG_SIZE)
+    fig, ax = subplots(figsize=FIG_SIZE)
     nx.draw(G, pos, with_labels=True, node_color=nodes_color, edge_color=list(edges_color.values()),
             edgecolors='grey', node_size=max_length * 200, font_size=9, font_color='black', font_weight='bold', ax=ax)
     nx.draw_networkx_edges(G, pos, edge_color=list(edges_color.values()), width=list(edges_weight.values()), ax=ax)
@@ -259,7 +260,7 @@ def create_voronoi_diagram(coverage, region, selected, covered):
     vor = Voronoi(tower_coords)
 
     # Plot Voronoi diagram
-    fig, ax = plt.subplots(figsize=(8, 6))
+    fig, ax = subplots(figsize=(8, 6))
     voronoi_plot_2d(vor, ax=ax, show_vertices=False)
 
     # Highlight selected towers
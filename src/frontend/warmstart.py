@@ -0,0 +1,138 @@
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from gurobipy import GRB
+
+# Number of formulations whose last solution is remembered
+MAX_STARTS = 64
+# Largest difference between a start value and the first incumbent for the start to count as used
+START_TOLERANCE = 1e-6
+
+
+class Solution:
+    """
+    The last solution of a formulation by variable and constraint name.
+    build_model names every variable after its symbol and index tuple, like z[GAS,3], so the start values
+    still land on the right variables when the data changes the order or the number of variables.
+    The constraint families are added as unnamed matrices, R0 to Rn by position, so the basis is only
+    reused when it covers every variable and constraint of the new model.
+    """
+
+    def __init__(self, m):
+        variables = m.getVars()
+        self.values = dict(zip(m.getAttr("VarName", variables), m.getAttr("X", variables)))
+        self.basis = None
+        if not m.IsMIP and m.status == GRB.OPTIMAL:
+            constrs = m.getConstrs()
+            names = m.getAttr("ConstrName", constrs)
+            self.basis = (dict(zip(self.values, m.getAttr("VBasis", variables))),
+                          dict(zip(names, m.getAttr("CBasis", constrs))),
+                          dict(zip(names, m.getAttr("Pi", constrs))))
+
+
+def seed(m, solution):
+    """
+    Set the start attributes of a model from an earlier solution, Start for MIPs and
+    the basis or PStart and DStart for LPs
+    :param m: gurobi model
+    :param solution: Solution
+    :return: number of variables that got a start value
+    """
+    m.update()
+    variables = m.getVars()
+    names = m.getAttr("VarName", variables)
+    known = [(v, solution.values[n]) for v, n in zip(variables, names) if n in solution.values]
+    if len(known) == 0:
+        return 0
+    if m.IsMIP:
+        m.setAttr("Start", [v for v, _ in known], [x for _, x in known])
+        return len(known)
+    m.setAttr("PStart", [v for v, _ in known], [x for _, x in known])
+    if solution.basis is not None:
+        vbasis, cbasis, duals = solution.basis
+        constrs = m.getConstrs()
+        constr_names = m.getAttr("ConstrName", constrs)
+        # a basis is only valid when it covers the whole model
+        if len(vbasis) == len(variables) and len(cbasis) == len(constrs) \
+                and all(n in vbasis for n in names) and all(n in cbasis for n in constr_names):
+            m.setAttr("VBasis", variables, [vbasis[n] for n in names])
+            m.setAttr("CBasis", constrs, [cbasis[n] for n in constr_names])
+        else:
+            found = [(c, duals[n]) for c, n in zip(constrs, constr_names) if n in duals]
+            if len(found) > 0:
+                m.setAttr("DStart", [c for c, _ in found], [d for _, d in found])
+    return len(known)
+
+
+class StartMonitor:
+    """
+    Optimize callback that tells from the first incumbent of a MIP whether gurobi used the start.
+    Gurobi tries the start before anything else, so the first incumbent has the start values when it was used,
+    completed where the start was partial. accepted stays None, unknown, for LPs and when no incumbent is reported.
+    """
+
+    def __init__(self, m):
+        """
+        :param m: gurobi model with its Start attributes set
+        """
+        variables = m.getVars()
+        starts = np.array(m.getAttr("Start", variables), dtype=float)
+        given = starts != GRB.UNDEFINED
+        self.variables = [v for v, g in zip(variables, given) if g]
+        self.starts = starts[given]
+        self.accepted = None
+        self.objective = None
+
+    def __call__(self, model, where):
+        if where != GRB.Callback.MIPSOL or self.accepted is not None or len(self.variables) == 0:
+            return
+        found = np.array(model.cbGetSolution(self.variables))
+        self.accepted = bool(np.allclose(found, self.starts, rtol=START_TOLERANCE, atol=START_TOLERANCE))
+        self.objective = model.cbGet(GRB.Callback.MIPSOL_OBJ)
+
+
+class WarmStarts:
+    """
+    The last solution of every formulation signature, least recently used first out
+    """
+
+    def __init__(self, size=MAX_STARTS):
+        self.size = size
+        self.solutions = OrderedDict()
+        self.lock = threading.Lock()
+
+    def seed(self, signature, m):
+        """
+        Seed a model with the last solution of its formulation
+        :param signature: formulation signature
+        :param m: gurobi model
+        :return: StartMonitor to pass to optimize, or None if there is no earlier solution
+        """
+        with self.lock:
+            solution = self.solutions.get(signature)
+            if solution is not None:
+                self.solutions.move_to_end(signature)
+        if solution is None or seed(m, solution) == 0:
+            return None
+        m.update()
+        return StartMonitor(m)
+
+    def record(self, signature, m):
+        """
+        Remember the solution of a solved model
+        :param signature: formulation signature
+        :param m: gurobi model after optimize
+        :return: None
+        """
+        if m.SolCount == 0:
+            return
+        solution = Solution(m)
+        with self.lock:
+            self.solutions[signature] = solution
+            self.solutions.move_to_end(signature)
+            while len(self.solutions) > self.size:
+                self.solutions.popitem(last=False)
+
+
+warm_starts = WarmStarts()